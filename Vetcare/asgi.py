@@ -2,6 +2,10 @@
 ASGI config for Vetcare project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The `stream` process in the Procfile serves it for the live notification
+endpoints only (notification/stream/ and notification/poll/); everything
+else stays on the WSGI `web` process, where streamed exports and file
+downloads are sent as they are read instead of being loaded whole.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
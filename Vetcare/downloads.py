@@ -0,0 +1,133 @@
+"""
+Authenticated downloads of stored files.
+
+Views check permissions as usual and then return ``file_response()``,
+which serves a ``FieldFile`` with:
+
+- an ETag and Last-Modified derived from the stored name, size and mtime,
+  so ``If-None-Match`` / ``If-Modified-Since`` answer 304 without opening
+  the file;
+- single ``Range: bytes=...`` requests answered with 206 (or 416), honouring
+  ``If-Range``; multi-range requests get the whole file;
+- a ``FileResponse`` over the open file, so WSGI servers with
+  ``wsgi.file_wrapper`` (gunicorn) send it with sendfile() instead of
+  copying it through Python. A range is served by seeking the file and
+  capping what can be read, which keeps the file descriptor usable for
+  sendfile().
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Read-only view of `length` bytes of an open file from its current position"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        if hasattr(file, 'fileno'):
+            self.fileno = file.fileno
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_signature(field_file):
+    """(etag, size, modification timestamp or None) for a stored file, without opening it"""
+    storage, name = field_file.storage, field_file.name
+    size = storage.size(name)
+    try:
+        modified = storage.get_modified_time(name).timestamp()
+    except NotImplementedError:
+        modified = None
+    etag = quote_etag(hashlib.md5(f'{name}:{size}:{modified}'.encode()).hexdigest())
+    return etag, size, modified
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single byte range, None to serve the
+    whole file, or False if the range cannot be satisfied.
+    """
+    match = RANGE_RE.match((header or '').replace(' ', ''))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def file_response(request, field_file, as_attachment=False, filename=None):
+    """Serve `field_file` with conditional and range request support"""
+    etag, size, modified = file_signature(field_file)
+    last_modified = int(modified) if modified is not None else None
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, last_modified)
+
+    byte_range = None
+    if request.method in ('GET', 'HEAD') and 'Range' in request.headers:
+        if_range = request.headers.get('If-Range')
+        if not if_range or if_range == etag:
+            byte_range = parse_range(request.headers['Range'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return _with_validators(response, etag, last_modified)
+
+    filename = filename or os.path.basename(field_file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    file = field_file.storage.open(field_file.name, 'rb')
+    if byte_range:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(
+            RangeFile(file, end - start + 1), status=206, content_type=content_type,
+            as_attachment=as_attachment, filename=filename,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(file, content_type=content_type, as_attachment=as_attachment, filename=filename)
+        response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    return _with_validators(response, etag, last_modified)
+
+
+def _with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Private: access depends on who is asking; revalidate so revoked access takes effect
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
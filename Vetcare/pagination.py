@@ -0,0 +1,290 @@
+"""
+Keyset (seek) pagination for list endpoints.
+
+Each page carries on from the sort key of the last row served, following the
+ordering the view already applies to its queryset, with the primary key added
+as a tie-breaker. A page is fetched as ``WHERE (key) < (last key) LIMIT n``,
+so the cost of page 1000 is the same as page 1 and no COUNT(*) is issued.
+Orderings keyset cannot seek on (expressions, annotations, random order)
+fall back to offset pages behind the same opaque cursor.
+"""
+import base64
+import json
+import operator
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from django.db.models.expressions import OrderBy
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class SortKey:
+    """One column of a keyset ordering (e.g. ``-date``)"""
+
+    def __init__(self, model, path, descending):
+        self.path = 'pk' if path in ('pk', 'id') else path
+        self.descending = descending
+        self.nullable = False
+
+        # Resolve the model field the path ends on, noting nullable hops
+        parts = path.split('__')
+        field = None
+        for name in parts:
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            self.nullable = self.nullable or field.null
+            if field.is_relation and name != parts[-1]:
+                model = field.related_model
+        self.field = field
+        self.attrs = parts[:-1] + [field.attname if field.is_relation else field.name]
+
+    def value_from(self, obj):
+        """Read this key's value off a model instance"""
+        for attr in self.attrs:
+            if obj is None:
+                return None
+            obj = getattr(obj, attr)
+        return obj
+
+    def encode(self, value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    def decode(self, value):
+        if value is None:
+            return None
+        return self.field.to_python(value)
+
+    def order_by(self, reverse=False):
+        """Ordering expression; NULLs sort as the smallest value on every backend"""
+        descending = self.descending != reverse
+        if not self.nullable:
+            return f"-{self.path}" if descending else self.path
+        if descending:
+            return F(self.path).desc(nulls_last=True)
+        return F(self.path).asc(nulls_first=True)
+
+    def beyond(self, value, reverse=False):
+        """Q for rows strictly after `value` in this key's direction, or None if there are none"""
+        descending = self.descending != reverse
+        if descending:
+            if value is None:
+                return None
+            condition = Q(**{f"{self.path}__lt": value})
+            if self.nullable:
+                condition |= Q(**{f"{self.path}__isnull": True})
+            return condition
+        if value is None:
+            return Q(**{f"{self.path}__isnull": False})
+        return Q(**{f"{self.path}__gt": value})
+
+    def equal(self, value):
+        if value is None:
+            return Q(**{f"{self.path}__isnull": True})
+        return Q(**{self.path: value})
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination over the view's own ordering.
+    Query params: cursor, page_size.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 200
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_keys(queryset)
+        if self.keys is None:
+            return self.paginate_by_offset(queryset, request)
+
+        values, reverse = self.decode_cursor(request)
+        queryset = queryset.order_by(*[key.order_by(reverse) for key in self.keys])
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(values, reverse))
+
+        # One extra row tells us whether another page exists without a COUNT
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        self.has_next = True if reverse else has_more
+        self.has_previous = has_more if reverse else values is not None
+        return rows
+
+    def paginate_by_offset(self, queryset, request):
+        """LIMIT/OFFSET pages, still without a COUNT, for orderings get_keys cannot seek on"""
+        self.offset = self.decode_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.page_size + 1])
+        self.page = rows[:self.page_size]
+        self.has_next = len(rows) > self.page_size
+        self.has_previous = self.offset > 0
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_keys(self, queryset):
+        """
+        Sort keys from the queryset's ordering, made unique with the primary key,
+        or None if a term is not a model field (an expression, annotation or '?').
+        """
+        query = queryset.query
+        ordering = query.order_by or (query.default_ordering and queryset.model._meta.ordering) or []
+
+        keys = []
+        for term in ordering:
+            if isinstance(term, OrderBy) and isinstance(term.expression, F):
+                path, descending = term.expression.name, term.descending
+            elif isinstance(term, str) and term != '?':
+                path, descending = term.lstrip('-'), term.startswith('-')
+            else:
+                return None
+            try:
+                keys.append(SortKey(queryset.model, path, descending))
+            except FieldDoesNotExist:
+                return None
+
+        if not any(key.path == 'pk' for key in keys):
+            descending = keys[-1].descending if keys else True
+            keys.append(SortKey(queryset.model, 'pk', descending))
+        return keys
+
+    def seek_filter(self, values, reverse):
+        """Row-value comparison (k1, k2, ...) > (v1, v2, ...) spelled out as ORs"""
+        conditions = []
+        equal = Q()
+        for key, value in zip(self.keys, values):
+            beyond = key.beyond(value, reverse)
+            if beyond is not None:
+                conditions.append(equal & beyond)
+            equal &= key.equal(value)
+        if not conditions:
+            return Q(pk__in=[])
+        return reduce(operator.or_, conditions)
+
+    def decode_payload(self, request):
+        """The decoded cursor dict, or None without a cursor; a malformed one is a 400"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (ValueError, UnicodeError):
+            payload = None
+        if not isinstance(payload, dict):
+            self.invalid_cursor()
+        return payload
+
+    def decode_cursor(self, request):
+        payload = self.decode_payload(request)
+        if payload is None:
+            return None, False
+        try:
+            raw = payload['v']
+            if not isinstance(raw, list) or len(raw) != len(self.keys):
+                raise ValueError
+            values = [key.decode(value) for key, value in zip(self.keys, raw)]
+        except (KeyError, TypeError, ValueError, DjangoValidationError):
+            self.invalid_cursor()
+        return values, bool(payload.get('r'))
+
+    def decode_offset(self, request):
+        payload = self.decode_payload(request)
+        if payload is None:
+            return 0
+        offset = payload.get('o')
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            self.invalid_cursor()
+        return offset
+
+    def invalid_cursor(self):
+        raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+
+    def cursor_link(self, payload):
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def encode_cursor(self, obj, reverse):
+        payload = {'v': [key.encode(key.value_from(obj)) for key in self.keys]}
+        if reverse:
+            payload['r'] = 1
+        return self.cursor_link(payload)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.keys is None:
+            return self.cursor_link({'o': self.offset + self.page_size})
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.keys is None:
+            offset = max(self.offset - self.page_size, 0)
+            if not offset:
+                return remove_query_param(self.base_url, self.cursor_query_param)
+            return self.cursor_link({'o': offset})
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
@@ -0,0 +1,106 @@
+"""
+Infer select_related / prefetch_related from what a serializer reads.
+
+Each readable serializer field is followed along its ``source`` path
+(``owner.get_full_name`` -> ``owner``). Forward FKs and one-to-ones become
+joins, reverse FKs and many-to-manys become prefetches, and nested
+serializers are walked recursively. Model properties that hide a relation
+(``MedicalRecord.pet_owner``) are expanded through the model's
+``PROPERTY_RELATIONS`` mapping, e.g. ``{'pet_owner': 'pet__owner'}``.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.relations import RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+_lookup_cache = {}
+
+
+def related_lookups(serializer_class, model):
+    """Return (select_related, prefetch_related) lookups for `serializer_class` on `model`"""
+    key = (serializer_class, model)
+    if key not in _lookup_cache:
+        select, prefetch = set(), set()
+        _walk_serializer(serializer_class(), model, [], False, select, prefetch)
+
+        # Anything under a prefetch is fetched by the prefetch itself
+        select = {path for path in select if path not in prefetch}
+        _lookup_cache[key] = (sorted(select), sorted(prefetch))
+    return _lookup_cache[key]
+
+
+def optimize_queryset(queryset, serializer_class):
+    """Apply the joins and prefetches `serializer_class` needs to `queryset`"""
+    select, prefetch = related_lookups(serializer_class, queryset.model)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def _walk_serializer(serializer, model, prefix, many, select, prefetch):
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        if field.source == '*':
+            if isinstance(field, BaseSerializer):
+                _walk_serializer(field, model, prefix, many, select, prefetch)
+            continue
+
+        attrs = list(field.source_attrs)
+        if isinstance(field, RelatedField) and field.use_pk_only_optimization():
+            # Primary key fields read the FK column, no join needed
+            attrs = attrs[:-1]
+
+        target, path, path_many = _follow(model, attrs, prefix, many, select, prefetch)
+        if isinstance(field, BaseSerializer) and target is not None:
+            _walk_serializer(field, target, path, path_many, select, prefetch)
+
+
+def _follow(model, attrs, prefix, many, select, prefetch):
+    """
+    Walk `attrs` from `model`, recording each relation crossed.
+    Returns the model reached (None once the path leaves relations),
+    the lookup path and whether it passed a to-many relation.
+    """
+    path = list(prefix)
+    pending = list(attrs)
+
+    while pending and model is not None:
+        attr = pending.pop(0)
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            alias = getattr(model, 'PROPERTY_RELATIONS', {}).get(attr)
+            if alias:
+                pending[:0] = alias.split('__')
+                continue
+            return None, path, many
+
+        if not field.is_relation:
+            return None, path, many
+
+        path.append(attr)
+        many = many or field.many_to_many or field.one_to_many
+        lookup = '__'.join(path)
+        (prefetch if many else select).add(lookup)
+        model = field.related_model
+
+    return model, path, many
+
+
+class OptimizedQuerysetMixin:
+    """
+    Generic view mixin that joins/prefetches whatever the view's serializer reads.
+    Hooks filter_queryset() so it applies to both list() and get_object()
+    on top of whatever get_queryset() returns.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return optimize_queryset(queryset, self.get_serializer_class())
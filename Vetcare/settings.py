@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     'medical_records',
     'notifications',
     'pets',
+    'benchmarks',
     'widget_tweaks',
 
     'rest_framework.authtoken',
@@ -146,6 +147,29 @@ USE_TZ = True
 STATIC_URL = 'static/'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+
+# Resumable test result uploads: chunks are staged here (outside MEDIA_ROOT) until complete
+TEST_RESULT_UPLOAD_DIR = BASE_DIR / "uploads" / "partial"
+TEST_RESULT_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+TEST_RESULT_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Processes resizing pet profile images; 0 renders thumbnails inline
+PET_THUMBNAIL_WORKERS = 2
+
+# Live notification streams (notifications.stream), served by the ASGI `stream` process: the pub/sub
+# that wakes them, how often its watcher reads the ids of rows created by other processes, and how
+# often an idle stream sends a keep-alive
+NOTIFICATION_BROKER = "notifications.broker.TableBroker"
+NOTIFICATION_BROKER_POLL = 1
+NOTIFICATION_STREAM_HEARTBEAT = 30
+NOTIFICATION_LONG_POLL_TIMEOUT = 25
+
+# Seconds a delivered notification of each type opens a window for its recipient; later ones
+# in the window are merged into one digest (notifications.digests). Types not listed never wait
+NOTIFICATION_DIGEST_WINDOWS = {
+    "appointment": 300,
+    "vaccination": 300,
+}
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
@@ -171,6 +195,8 @@ REST_FRAMEWORK = {
         "rest_framework.renderers.JSONRenderer",
         "rest_framework.renderers.BrowsableAPIRenderer",  # enables browsable API
     ],
+    "DEFAULT_PAGINATION_CLASS": "Vetcare.pagination.KeysetPagination",  # seek on each view's ordering, no OFFSET/COUNT
+    "PAGE_SIZE": 50,
 }
 
 SIMPLE_JWT = {
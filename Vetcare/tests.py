@@ -0,0 +1,87 @@
+from datetime import time, timedelta
+from urllib.parse import parse_qs, urlparse
+
+from django.db.models.functions import Lower
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from accounts.models import CustomUser
+from appointments.models import Appointment
+from pets.models import PetProfile
+from .pagination import KeysetPagination
+
+
+class KeysetPaginationTests(APITestCase):
+    """Cursors walk every row once in both directions, NULL keys included"""
+
+    URL = '/vetcare/appointments/appointment/upcoming/'
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=2)
+        today = timezone.now().date()
+        # Upcoming is ordered by (date, time); confirmed appointments may have no time
+        for days, hour in [(1, 9), (1, None), (1, 11), (2, None), (2, None), (2, 10), (3, 8)]:
+            appointment = Appointment.objects.create(
+                client=self.owner, veterinarian=self.vet, pet=pet,
+                date=today + timedelta(days=days), reason=f'Visit {days} {hour}',
+            )
+            Appointment.objects.filter(pk=appointment.pk).update(
+                status=Appointment.CONFIRMED, time=time(hour) if hour is not None else None
+            )
+        self.expected = list(
+            Appointment.objects.order_by('date', 'time', 'pk').values_list('pk', flat=True)
+        )
+        self.client.force_authenticate(self.vet)
+
+    def ids(self, response):
+        return [item['id'] for item in response.data['results']]
+
+    def test_cursor_round_trip(self):
+        seen, pages = [], []
+        url = self.URL + '?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(response.data)
+            seen += self.ids(response)
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]['previous'])
+
+        # Walking back from the last page returns the same pages
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(self.ids(response), self.expected[3:6])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.ids(response), self.expected[:3])
+        self.assertIsNone(response.data['previous'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_malformed_cursor(self):
+        for cursor in ['not-base64!', 'eyJ2IjogWzFdfQ==', 'eyJ2IjogWyJ4IiwgbnVsbCwgMV19']:
+            response = self.client.get(self.URL, {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertIn('cursor', response.data)
+
+    def test_expression_ordering_falls_back_to_offsets(self):
+        paginator = KeysetPagination()
+        paginator.page_size = 3
+        queryset = Appointment.objects.order_by(Lower('reason').desc(), 'pk')
+        expected = list(queryset.values_list('pk', flat=True))
+
+        seen, url = [], '/list/'
+        while url:
+            request = Request(APIRequestFactory().get(url))
+            seen += [row.pk for row in paginator.paginate_queryset(queryset, request)]
+            url = paginator.get_next_link()
+        self.assertEqual(seen, expected)
+        self.assertTrue(parse_qs(urlparse(paginator.get_previous_link()).query)['cursor'])
+
+        # Keyset cursors do not fit an offset-paginated ordering
+        request = Request(APIRequestFactory().get('/list/', {'cursor': 'eyJ2IjogWzFdfQ=='}))
+        with self.assertRaises(ValidationError):
+            paginator.paginate_queryset(queryset, request)
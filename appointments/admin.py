@@ -1,4 +1,7 @@
 from django.contrib import admin
-from . models import Appointment
+from . models import Appointment, VetSchedule, WeeklyAvailability, ScheduleException
 # Register your models here.
-admin.site.register(Appointment)
\ No newline at end of file
+admin.site.register(Appointment)
+admin.site.register(VetSchedule)
+admin.site.register(WeeklyAvailability)
+admin.site.register(ScheduleException)
\ No newline at end of file
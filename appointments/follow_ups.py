@@ -0,0 +1,163 @@
+"""
+Automatic booking of recorded follow-ups.
+
+Consultations and medical records that ask for a follow-up get a pending
+appointment with the same vet and pet on the follow-up date once that date
+is less than LEAD_DAYS away. Each source row keeps the appointment it was
+booked into (``follow_up_appointment``), so the follow-ups still waiting are
+read through a partial index holding only those rows, and a run that is
+interrupted loses nothing: the next one starts from whatever is unbooked.
+A follow-up whose appointment was cancelled counts as unbooked again: each
+run first releases those links, and editing a follow-up's date or turning it
+off releases its link on save.
+
+A follow-up is first matched against the pet's existing appointments: an
+appointment with the same vet, not cancelled, after the original visit and
+within MATCH_DAYS of the follow-up date is linked instead of booking another.
+Follow-ups of the same pet and vet in one chunk (a consultation and the
+medical record written for the same visit, usually) share one appointment.
+Each chunk is read, booked with bulk_create and linked in one transaction.
+"""
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from notifications import fanout
+from .models import Appointment, Consultation
+
+
+LEAD_DAYS = 14
+MATCH_DAYS = 7
+CHUNK_SIZE = 500
+
+REASON_LENGTH = 200
+
+
+class Source:
+    """A model with follow-up fields and the paths to the values booking needs"""
+
+    def __init__(self, model, pet, owner, visited):
+        self.model = model
+        self.pet = pet
+        self.owner = owner
+        self.visited = visited
+
+    def release_cancelled(self):
+        """Unlink follow-ups from cancelled appointments, so they are booked again"""
+        return (
+            self.model.objects.filter(follow_up_appointment__status=Appointment.CANCELLED)
+            .update(follow_up_appointment=None)
+        )
+
+    def due(self, today, lead_days):
+        """Unbooked follow-ups from today to `lead_days` ahead, in (follow_up_date, pk) order"""
+        return (
+            self.model.objects.filter(
+                follow_up_required=True, follow_up_appointment__isnull=True,
+                follow_up_date__range=(today, today + timedelta(days=lead_days)),
+                veterinarian__isnull=False,
+            )
+            .order_by('follow_up_date', 'pk')
+            .values_list('pk', 'follow_up_date', 'veterinarian_id', self.pet, self.owner, self.visited, 'diagnosis')
+        )
+
+
+def sources():
+    from medical_records.models import MedicalRecord
+
+    # Consultations first: their records then usually find the appointment already booked
+    return [
+        Source(Consultation, pet='appointment__pet_id', owner='appointment__client_id', visited='appointment__date'),
+        Source(MedicalRecord, pet='pet_id', owner='pet__owner_id', visited='visit_date'),
+    ]
+
+
+def run(today=None, lead_days=LEAD_DAYS, match_days=MATCH_DAYS, chunk_size=CHUNK_SIZE, pause=0):
+    """
+    Book or link every follow-up due within `lead_days`, `chunk_size` rows
+    per transaction, sleeping `pause` seconds between chunks.
+    Returns (appointments booked, follow-ups linked to existing appointments).
+    """
+    today = today or timezone.now().date()
+    booked = linked = 0
+    for source in sources():
+        source.release_cancelled()
+        after = None
+        while True:
+            with transaction.atomic():
+                rows = source.due(today, lead_days)
+                if after:
+                    rows = rows.filter(Q(follow_up_date__gt=after[0]) | Q(follow_up_date=after[0], pk__gt=after[1]))
+                # Concurrent runs on Postgres take different rows instead of queueing behind each other
+                rows = list(rows.select_for_update(skip_locked=True, of=('self',))[:chunk_size])
+                if not rows:
+                    break
+                after = rows[-1][1], rows[-1][0]
+                created, matched = book(source.model, rows, match_days)
+            booked += created
+            linked += matched
+            if pause:
+                time.sleep(pause)
+    return booked, linked
+
+
+def book(model, rows, match_days):
+    """Book or link one chunk of (pk, follow_up_date, vet, pet, owner, visited, diagnosis) rows"""
+    window = timedelta(days=match_days)
+    dates = [row[1] for row in rows]
+    existing = (
+        Appointment.objects.filter(
+            pet_id__in={row[3] for row in rows},
+            date__range=(min(dates) - window, max(dates) + window),
+        )
+        .exclude(status=Appointment.CANCELLED)
+        .values_list('veterinarian_id', 'pet_id', 'date', 'pk')
+    )
+    calendar = defaultdict(list)
+    for vet_id, pet_id, day, pk in existing:
+        calendar[vet_id, pet_id].append((day, pk))
+
+    new = []
+    links = []
+    for pk, follow_up_date, vet_id, pet_id, owner_id, visited, diagnosis in rows:
+        visited = _local_date(visited)
+        candidates = calendar[vet_id, pet_id]
+        appointment = next(
+            (found for day, found in candidates if day > visited and abs(day - follow_up_date) <= window),
+            None,
+        )
+        if appointment is None:
+            appointment = Appointment(
+                client_id=owner_id, veterinarian_id=vet_id, pet_id=pet_id, date=follow_up_date,
+                status=Appointment.PENDING, reason=f"Follow-up: {diagnosis}"[:REASON_LENGTH],
+                notes="Booked automatically from a follow-up request.",
+            )
+            new.append(appointment)
+            candidates.append((follow_up_date, appointment))
+        links.append((pk, appointment))
+
+    # bulk_create records the care relationships (see CareSourceQuerySet)
+    Appointment.objects.bulk_create(new)
+    fanout.notify([fanout.follow_up_booked(appointment) for appointment in new])
+
+    by_appointment = defaultdict(list)
+    matched = 0
+    for pk, appointment in links:
+        if isinstance(appointment, Appointment):
+            appointment = appointment.pk
+        else:
+            matched += 1
+        by_appointment[appointment].append(pk)
+    for appointment, pks in by_appointment.items():
+        model.objects.filter(pk__in=pks).update(follow_up_appointment_id=appointment)
+    return len(new), matched
+
+
+def _local_date(value):
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
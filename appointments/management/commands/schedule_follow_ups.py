@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments import follow_ups
+
+
+class Command(BaseCommand):
+    help = (
+        "Book pending appointments for consultation and medical record follow-ups that are due soon, "
+        "or link them to a matching appointment that already exists. Safe to run every few minutes "
+        "and to interrupt: booked follow-ups are never looked at again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lead-days', type=int, default=follow_ups.LEAD_DAYS,
+                            help="Book follow-ups due within this many days")
+        parser.add_argument('--match-days', type=int, default=follow_ups.MATCH_DAYS,
+                            help="An existing appointment this close to the follow-up date counts as booked")
+        parser.add_argument('--chunk-size', type=int, default=follow_ups.CHUNK_SIZE,
+                            help="Follow-ups booked per transaction")
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between chunks")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        if options['lead_days'] < 0 or options['match_days'] < 0:
+            raise CommandError("--lead-days and --match-days cannot be negative.")
+
+        started = time.perf_counter()
+        booked, linked = follow_ups.run(
+            lead_days=options['lead_days'],
+            match_days=options['match_days'],
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Booked {booked} follow-up appointments and linked {linked} follow-ups to existing ones "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
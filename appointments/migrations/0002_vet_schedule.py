@@ -0,0 +1,66 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:59
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VetSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30, help_text='Length of one bookable slot in minutes', validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(480)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('veterinarian', models.OneToOneField(help_text='Veterinarian this schedule belongs to', limit_choices_to={'role': 'VETERINARIAN'}, on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Vet Schedule',
+                'verbose_name_plural': 'Vet Schedules',
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Date the exception applies to')),
+                ('start_time', models.TimeField(blank=True, help_text='Start of the window (leave empty for the whole day)', null=True)),
+                ('end_time', models.TimeField(blank=True, help_text='End of the window (leave empty for the whole day)', null=True)),
+                ('is_available', models.BooleanField(default=False, help_text='True adds extra hours, False blocks time off')),
+                ('reason', models.CharField(blank=True, help_text='Reason for the exception', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('schedule', models.ForeignKey(help_text='Schedule this exception belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='appointments.vetschedule')),
+            ],
+            options={
+                'verbose_name': 'Schedule Exception',
+                'verbose_name_plural': 'Schedule Exceptions',
+                'ordering': ['date', 'start_time'],
+                'indexes': [models.Index(fields=['schedule', 'date'], name='appointment_schedul_29a7e6_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')], help_text='Day of the week')),
+                ('start_time', models.TimeField(help_text='Start of working hours')),
+                ('end_time', models.TimeField(help_text='End of working hours')),
+                ('schedule', models.ForeignKey(help_text='Schedule this block belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='weekly_hours', to='appointments.vetschedule')),
+            ],
+            options={
+                'verbose_name': 'Weekly Availability',
+                'verbose_name_plural': 'Weekly Availability',
+                'ordering': ['weekday', 'start_time'],
+                'indexes': [models.Index(fields=['schedule', 'weekday'], name='appointment_schedul_67554a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_vet_schedule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultation',
+            name='follow_up_appointment',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, help_text='Appointment the follow-up was booked into by the schedule_follow_ups job', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='follow_up_consultations', to='appointments.appointment'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(condition=models.Q(('follow_up_appointment__isnull', True), ('follow_up_required', True)), fields=['follow_up_date', 'id'], name='consult_followup_unbooked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(condition=models.Q(('follow_up_appointment__isnull', False)), fields=['follow_up_appointment'], name='consult_followup_booked_idx'),
+        ),
+    ]
@@ -1,12 +1,13 @@
 from django.db import models
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator, MaxValueValidator
 
 from accounts.models import CustomUser
-from pets.models import PetProfile
+from pets.models import CareSource, CareSourceQuerySet, PetProfile
 
 
-class Appointment(models.Model):
+class Appointment(CareSource, models.Model):
     """Model to handle veterinary appointments between clients and veterinarians. """
     
     # Status choices
@@ -22,6 +23,9 @@ class Appointment(models.Model):
         (CANCELLED, 'Cancelled'),
     ]
     
+    # Statuses that hold a slot on the veterinarian's calendar
+    BOOKED_STATUSES = [CONFIRMED, COMPLETED]
+    
     # Relationships
     client = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name='client_appointments',limit_choices_to={'role': 'CLIENT'},help_text="Pet owner requesting the appointment")
     veterinarian = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name='vet_appointments',limit_choices_to={'role': 'VETERINARIAN'},help_text="Veterinarian assigned to the appointment")
@@ -35,6 +39,9 @@ class Appointment(models.Model):
     notes = models.TextField( blank=True, help_text="Additional notes or special instructions")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    care_date = 'date'
+    objects = CareSourceQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Appointment'
@@ -66,8 +73,14 @@ class Appointment(models.Model):
             raise ValidationError("Appointment date cannot be in the past.")
     
     def save(self, *args, **kwargs):
+        from notifications import fanout
+
+        requested = self._state.adding and self.status == self.PENDING
         self.full_clean()
         super().save(*args, **kwargs)
+        self.update_care()
+        if requested:
+            fanout.notify([fanout.appointment_requested(self)])
     
     @property
     def is_past(self):
@@ -101,9 +114,13 @@ class Consultation(models.Model):
     prescription = models.TextField(blank=True,help_text="Prescribed medications or treatments")
     follow_up_required = models.BooleanField(default=False,help_text="Whether a follow-up appointment is needed")
     follow_up_date = models.DateField(null=True,blank=True,help_text="Recommended follow-up date")
+    follow_up_appointment = models.ForeignKey(Appointment,on_delete=models.SET_NULL,null=True,blank=True,editable=False,db_index=False,related_name='follow_up_consultations',help_text="Appointment the follow-up was booked into by the schedule_follow_ups job")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Relations reached through properties, for the queryset optimizer
+    PROPERTY_RELATIONS = {'pet': 'appointment__pet', 'client': 'appointment__client'}
+    
     class Meta:
         verbose_name = 'Consultation'
         verbose_name_plural = 'Consultations'
@@ -111,6 +128,10 @@ class Consultation(models.Model):
         indexes = [
             models.Index(fields=['veterinarian', 'created_at']),
             models.Index(fields=['appointment']),
+            # Follow-ups still waiting to be booked, in date order (see appointments.follow_ups)
+            models.Index(fields=['follow_up_date', 'id'], condition=models.Q(follow_up_required=True, follow_up_appointment__isnull=True), name='consult_followup_unbooked_idx'),
+            # Only booked rows: NULL is nearly every row and would tempt the planner away from the index above
+            models.Index(fields=['follow_up_appointment'], condition=models.Q(follow_up_appointment__isnull=False), name='consult_followup_booked_idx'),
         ]
     
     def __str__(self):
@@ -135,9 +156,36 @@ class Consultation(models.Model):
         if self.follow_up_date and self.follow_up_date <= timezone.now().date():
             raise ValidationError("Follow-up date must be in the future.")
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Keep the loaded follow-up, so save() can tell when an edit changes it"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_follow_up = instance._follow_up()
+        return instance
+
+    def _follow_up(self):
+        deferred = self.get_deferred_fields()
+        return {name: getattr(self, name) for name in ('follow_up_required', 'follow_up_date') if name not in deferred}
+
     def save(self, *args, **kwargs):
+        from medical_records.search import index_consultations
+        from notifications import fanout
+
+        adding = self._state.adding
         self.full_clean()
+        loaded = getattr(self, '_loaded_follow_up', {})
+        # A changed follow-up no longer matches the appointment booked for it; the next run rebooks
+        if self.follow_up_appointment_id is not None and any(
+            loaded[name] != getattr(self, name) for name in loaded
+        ):
+            self.follow_up_appointment = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = [*kwargs['update_fields'], 'follow_up_appointment']
         super().save(*args, **kwargs)
+        self._loaded_follow_up = self._follow_up()
+        index_consultations([self.pk])
+        if adding:
+            fanout.notify([fanout.consultation_recorded(self, self.appointment.client_id, self.appointment.date)])
     
     @property
     def client(self):
@@ -147,4 +195,117 @@ class Consultation(models.Model):
     @property
     def pet(self):
         """Get the pet from the associated appointment"""
-        return self.appointment.pet
\ No newline at end of file
+        return self.appointment.pet
+
+
+class VetSchedule(models.Model):
+    """Booking settings for a veterinarian: slot length, weekly hours and exceptions."""
+    
+    DEFAULT_SLOT_MINUTES = 30
+    
+    veterinarian = models.OneToOneField(CustomUser,on_delete=models.CASCADE,related_name='schedule',limit_choices_to={'role': 'VETERINARIAN'},help_text="Veterinarian this schedule belongs to")
+    slot_minutes = models.PositiveSmallIntegerField(default=DEFAULT_SLOT_MINUTES,validators=[MinValueValidator(5), MaxValueValidator(480)],help_text="Length of one bookable slot in minutes")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Vet Schedule'
+        verbose_name_plural = 'Vet Schedules'
+    
+    def __str__(self):
+        return f"Schedule: {self.veterinarian.get_full_name()} ({self.slot_minutes} min slots)"
+    
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+
+class WeeklyAvailability(models.Model):
+    """A recurring block of working hours on one day of the week."""
+    
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    
+    schedule = models.ForeignKey(VetSchedule,on_delete=models.CASCADE,related_name='weekly_hours',help_text="Schedule this block belongs to")
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES,help_text="Day of the week")
+    start_time = models.TimeField(help_text="Start of working hours")
+    end_time = models.TimeField(help_text="End of working hours")
+    
+    class Meta:
+        verbose_name = 'Weekly Availability'
+        verbose_name_plural = 'Weekly Availability'
+        ordering = ['weekday', 'start_time']
+        indexes = [
+            models.Index(fields=['schedule', 'weekday']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+    
+    def clean(self):
+        """Validate the time window"""
+        super().clean()
+        
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError("Start time must be before end time.")
+    
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+
+class ScheduleException(models.Model):
+    """
+    A one-off change to the weekly template on a specific date.
+    Unavailable exceptions block time (the whole day when no times are given),
+    available exceptions add extra hours.
+    """
+    
+    schedule = models.ForeignKey(VetSchedule,on_delete=models.CASCADE,related_name='exceptions',help_text="Schedule this exception belongs to")
+    date = models.DateField(help_text="Date the exception applies to")
+    start_time = models.TimeField(null=True,blank=True,help_text="Start of the window (leave empty for the whole day)")
+    end_time = models.TimeField(null=True,blank=True,help_text="End of the window (leave empty for the whole day)")
+    is_available = models.BooleanField(default=False,help_text="True adds extra hours, False blocks time off")
+    reason = models.CharField(max_length=255,blank=True,help_text="Reason for the exception")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Schedule Exception'
+        verbose_name_plural = 'Schedule Exceptions'
+        ordering = ['date', 'start_time']
+        indexes = [
+            models.Index(fields=['schedule', 'date']),
+        ]
+    
+    def __str__(self):
+        kind = "Available" if self.is_available else "Unavailable"
+        return f"{kind} on {self.date}"
+    
+    @property
+    def is_full_day(self):
+        """Check if the exception covers the whole day"""
+        return self.start_time is None and self.end_time is None
+    
+    def clean(self):
+        """Validate the time window"""
+        super().clean()
+        
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValidationError("Provide both start and end time, or neither for a full day.")
+        
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError("Start time must be before end time.")
+        
+        if self.is_available and self.is_full_day:
+            raise ValidationError("Extra availability needs a start and end time.")
+    
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
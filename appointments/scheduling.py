@@ -0,0 +1,247 @@
+"""
+Availability engine for veterinarian schedules.
+
+An appointment only stores its start time; it occupies one slot of the vet's
+configured length. Booked slots for a vet are loaded once per date range into
+a sorted index per day, so each overlap check is a binary search instead of a
+scan over the appointment table.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import time, timedelta
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Appointment, VetSchedule, ScheduleException
+
+
+def to_minutes(value):
+    """Convert a time to minutes since midnight"""
+    return value.hour * 60 + value.minute
+
+
+def to_time(minutes):
+    """Convert minutes since midnight back to a time (clamped to the day)"""
+    minutes = min(minutes, 24 * 60 - 1)
+    return time(minutes // 60, minutes % 60)
+
+
+class DayIndex:
+    """
+    Sorted index of [start, end) intervals, in minutes, for a single day.
+
+    Alongside the sorted starts it keeps the furthest end reached by any
+    interval up to each position, so overlap queries stay O(log n) even if
+    the stored intervals overlap each other (e.g. legacy double-bookings).
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._reach = []
+        self._keys = []
+
+    def __len__(self):
+        return len(self._starts)
+
+    def add(self, start, end, key=None):
+        """Insert an interval, keeping the index sorted by start"""
+        i = bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+        self._keys.insert(i, key)
+        self._reach.insert(i, end)
+        for j in range(i, len(self._reach)):
+            previous = self._reach[j - 1] if j else end
+            self._reach[j] = max(self._ends[j], previous)
+
+    def overlaps(self, start, end):
+        """Check if any stored interval intersects [start, end)"""
+        i = bisect_left(self._starts, end)
+        return bool(i) and self._reach[i - 1] > start
+
+    def find_overlap(self, start, end):
+        """Return the key of an interval intersecting [start, end), or None"""
+        if not self.overlaps(start, end):
+            return None
+        # Walk back from the last interval starting before `end`; the reach
+        # array guarantees a hit before we pass below `start`.
+        i = bisect_left(self._starts, end) - 1
+        while i >= 0 and self._reach[i] > start:
+            if self._ends[i] > start:
+                return self._keys[i]
+            i -= 1
+        return None
+
+
+class VetCalendar:
+    """
+    Working hours and booked slots for one veterinarian over a date range.
+    Loads everything it needs up front; all checks afterwards are in memory.
+    """
+
+    def __init__(self, veterinarian, start_date, end_date, exclude=None, load_hours=True):
+        self.veterinarian = veterinarian
+        self.start_date = start_date
+        self.end_date = end_date
+
+        schedules = VetSchedule.objects.filter(veterinarian=veterinarian)
+        if load_hours:
+            schedules = schedules.prefetch_related(
+                'weekly_hours',
+                Prefetch(
+                    'exceptions',
+                    queryset=ScheduleException.objects.filter(date__range=(start_date, end_date)),
+                ),
+            )
+        self.schedule = schedules.first()
+        self.slot_minutes = (
+            self.schedule.slot_minutes if self.schedule else VetSchedule.DEFAULT_SLOT_MINUTES
+        )
+
+        booked = Appointment.objects.filter(
+            veterinarian=veterinarian,
+            date__range=(start_date, end_date),
+            status__in=Appointment.BOOKED_STATUSES,
+            time__isnull=False,
+        )
+        if exclude is not None:
+            booked = booked.exclude(pk=exclude)
+
+        self._booked = defaultdict(DayIndex)
+        self.booked_ids = set()
+        for pk, day, start_time in booked.values_list('pk', 'date', 'time'):
+            self.book(day, start_time, pk)
+            self.booked_ids.add(pk)
+
+    def book(self, day, start_time, key=None):
+        """Record a booked slot starting at `start_time` on `day`"""
+        start = to_minutes(start_time)
+        self._booked[day].add(start, start + self.slot_minutes, key)
+
+    def find_conflict(self, day, start_time):
+        """Return the id of a booked appointment overlapping the slot, or None"""
+        index = self._booked.get(day)
+        if not index:
+            return None
+        start = to_minutes(start_time)
+        return index.find_overlap(start, start + self.slot_minutes)
+
+    def _windows(self, day):
+        """Return (open windows, blocked index) for a day from the template and exceptions"""
+        if not self.schedule:
+            return [], DayIndex()
+
+        exceptions = [e for e in self.schedule.exceptions.all() if e.date == day]
+        if any(not e.is_available and e.is_full_day for e in exceptions):
+            return [], DayIndex()
+
+        windows = [
+            (to_minutes(block.start_time), to_minutes(block.end_time))
+            for block in self.schedule.weekly_hours.all()
+            if block.weekday == day.weekday()
+        ]
+        blocked = DayIndex()
+        for exception in exceptions:
+            start, end = to_minutes(exception.start_time), to_minutes(exception.end_time)
+            if exception.is_available:
+                windows.append((start, end))
+            else:
+                blocked.add(start, end)
+        return windows, blocked
+
+    def free_slots(self):
+        """List the free slots between start_date and end_date (inclusive)"""
+        now = timezone.localtime()
+        slots = []
+        day = self.start_date
+        while day <= self.end_date:
+            if day >= now.date():
+                earliest = to_minutes(now) + 1 if day == now.date() else 0
+                windows, blocked = self._windows(day)
+                booked = self._booked.get(day) or DayIndex()
+                starts = set()
+                for window_start, window_end in windows:
+                    start = window_start
+                    while start + self.slot_minutes <= window_end:
+                        end = start + self.slot_minutes
+                        if (
+                            start >= earliest
+                            and not blocked.overlaps(start, end)
+                            and not booked.overlaps(start, end)
+                        ):
+                            starts.add(start)
+                        start = end
+                for start in sorted(starts):
+                    slots.append({
+                        'date': day,
+                        'start_time': to_time(start),
+                        'end_time': to_time(start + self.slot_minutes),
+                    })
+            day += timedelta(days=1)
+        return slots
+
+
+def slot_minutes_for(veterinarian):
+    """Slot length for a vet user, using a select_related schedule when available"""
+    try:
+        return veterinarian.schedule.slot_minutes
+    except VetSchedule.DoesNotExist:
+        return VetSchedule.DEFAULT_SLOT_MINUTES
+
+
+def overlapping_bookings(veterinarian_id, day, start_time, slot_minutes):
+    """
+    Queryset of booked appointments whose slot overlaps one starting at `start_time`.
+    Every slot on a vet's calendar has the same length, so two slots overlap
+    exactly when their starts are less than one slot apart. That keeps the
+    check a range condition on (veterinarian, date, time) usable inside an UPDATE.
+    """
+    start = to_minutes(start_time)
+    bookings = Appointment.objects.filter(
+        veterinarian_id=veterinarian_id,
+        date=day,
+        status__in=Appointment.BOOKED_STATUSES,
+        time__isnull=False,
+    )
+    if start - slot_minutes >= 0:
+        bookings = bookings.filter(time__gt=to_time(start - slot_minutes))
+    if start + slot_minutes < 24 * 60:
+        bookings = bookings.filter(time__lt=to_time(start + slot_minutes))
+    return bookings
+
+
+def find_conflict(appointment):
+    """
+    Return the id of a booked appointment that overlaps `appointment` on its
+    veterinarian's calendar, or None. Appointments without a time never conflict.
+    """
+    if not appointment.time:
+        return None
+    calendar = VetCalendar(
+        appointment.veterinarian_id,
+        appointment.date,
+        appointment.date,
+        exclude=appointment.pk,
+        load_hours=False,
+    )
+    return calendar.find_conflict(appointment.date, appointment.time)
+
+
+def lock_calendars(veterinarian_ids):
+    """
+    Serialize bookings on these vets' calendars until the transaction ends by
+    locking their VetSchedule rows, creating default ones where missing. Locks
+    are taken in vet order, and before any appointment row, so two bookers
+    cannot deadlock. Under READ COMMITTED an overlap check run after the lock
+    sees the bookings committed by whoever held it before.
+    """
+    ids = sorted(set(veterinarian_ids))
+    schedules = VetSchedule.objects.select_for_update().order_by('veterinarian_id')
+    locked = set(schedules.filter(veterinarian_id__in=ids).values_list('veterinarian_id', flat=True))
+    missing = [vet_id for vet_id in ids if vet_id not in locked]
+    for vet_id in missing:
+        VetSchedule.objects.get_or_create(veterinarian_id=vet_id)
+    if missing:
+        list(schedules.filter(veterinarian_id__in=missing).values_list('pk', flat=True))
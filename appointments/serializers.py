@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.utils import timezone
 
-from .models import Appointment, Consultation
+from .models import Appointment, Consultation, VetSchedule, WeeklyAvailability, ScheduleException
 from accounts.models import Vetprofile, CustomUser
 from pets.models import PetProfile
 
@@ -52,6 +52,10 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
     
     def get_has_consultation(self, obj):
         """Check if appointment has a consultation"""
+        # Views annotate this with Exists() to avoid a query per appointment
+        annotated = getattr(obj, 'consultation_exists', None)
+        if annotated is not None:
+            return annotated
         return hasattr(obj, 'consultation')
 
 
@@ -101,51 +105,20 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
 class AppointmentUpdateSerializer(serializers.ModelSerializer):
     """
     Serializer for updating appointments.
-    Veterinarians can update status, date, and time.
+    Veterinarians can update date, time and notes; status changes go
+    through the confirm, complete and cancel endpoints (see transitions).
     """
     
     class Meta:
         model = Appointment
-        fields = ['status', 'date', 'time', 'notes']
-    
-    def validate_status(self, value):
-        """Validate status transitions"""
-        instance = self.instance
-        if not instance:
-            return value
-        
-        current_status = instance.status
-        
-        # Define valid status transitions
-        valid_transitions = {
-            Appointment.PENDING: [Appointment.CONFIRMED, Appointment.CANCELLED],
-            Appointment.CONFIRMED: [Appointment.COMPLETED, Appointment.CANCELLED],
-            Appointment.COMPLETED: [],  # Cannot change from completed
-            Appointment.CANCELLED: []   # Cannot change from cancelled
-        }
-        
-        if value not in valid_transitions.get(current_status, []):
-            raise serializers.ValidationError(
-                f"Cannot change status from {current_status} to {value}."
-            )
-        
-        return value
+        fields = ['date', 'time', 'notes']
     
     def validate(self, data):
-        """Additional validation for status-specific requirements"""
-        status = data.get('status', self.instance.status if self.instance else None)
-        
-        # When confirming, require date and time
-        if status == Appointment.CONFIRMED:
-            if not data.get('date') and not self.instance.date:
-                raise serializers.ValidationError({
-                    "date": "Date is required when confirming appointment."
-                })
-            if not data.get('time') and not self.instance.time:
-                raise serializers.ValidationError({
-                    "time": "Time is required when confirming appointment."
-                })
-        
+        """Refuse status changes, which would bypass the transition guards"""
+        if 'status' in self.initial_data:
+            raise serializers.ValidationError({
+                "status": "Use the confirm, complete or cancel endpoints to change the status."
+            })
         return data
 
 
@@ -179,6 +152,46 @@ class AppointmentStatusUpdateSerializer(serializers.Serializer):
         return value
 
 
+class AppointmentConfirmSerializer(serializers.Serializer):
+    """
+    Optional date and time to set when a veterinarian confirms an appointment.
+    """
+    date = serializers.DateField(required=False)
+    time = serializers.TimeField(required=False)
+    
+    def validate_date(self, value):
+        """Ensure appointment date is not in the past"""
+        if value < timezone.now().date():
+            raise serializers.ValidationError("Appointment date cannot be in the past.")
+        return value
+
+
+class AppointmentBulkActionSerializer(serializers.Serializer):
+    """
+    Serializer for moving several appointments to the same status at once.
+    """
+    MAX_IDS = 200
+    
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_IDS,
+        help_text="IDs of the appointments to update"
+    )
+    status = serializers.ChoiceField(
+        choices=[
+            (Appointment.CONFIRMED, 'Confirmed'),
+            (Appointment.COMPLETED, 'Completed'),
+            (Appointment.CANCELLED, 'Cancelled'),
+        ],
+        help_text="Target status for every appointment"
+    )
+    
+    def validate_ids(self, value):
+        """Drop duplicates while keeping the requested order"""
+        return list(dict.fromkeys(value))
+
+
 class ConsultationSerializer(serializers.ModelSerializer):
     """
     Serializer for creating and viewing consultations.
@@ -255,4 +268,72 @@ class ConsultationListSerializer(serializers.ModelSerializer):
             'appointment_date', 'diagnosis', 'follow_up_required',
             'follow_up_date', 'created_at'
         ]
-        read_only_fields = ['id', 'created_at']
\ No newline at end of file
+        read_only_fields = ['id', 'created_at']
+
+
+class WeeklyAvailabilitySerializer(serializers.ModelSerializer):
+    
+    weekday_display = serializers.CharField(source='get_weekday_display', read_only=True)
+    
+    class Meta:
+        model = WeeklyAvailability
+        fields = ['id', 'weekday', 'weekday_display', 'start_time', 'end_time']
+        read_only_fields = ['id']
+    
+    def validate(self, data):
+        """Ensure the window is not empty"""
+        start_time = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(self.instance, 'end_time', None))
+        if start_time and end_time and start_time >= end_time:
+            raise serializers.ValidationError("Start time must be before end time.")
+        return data
+
+
+class ScheduleExceptionSerializer(serializers.ModelSerializer):
+    
+    class Meta:
+        model = ScheduleException
+        fields = ['id', 'date', 'start_time', 'end_time', 'is_available', 'reason', 'created_at']
+        read_only_fields = ['id', 'created_at']
+    
+    def validate(self, data):
+        """Ensure the window is either complete or a full day"""
+        start_time = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(self.instance, 'end_time', None))
+        is_available = data.get('is_available', getattr(self.instance, 'is_available', False))
+        
+        if (start_time is None) != (end_time is None):
+            raise serializers.ValidationError("Provide both start and end time, or neither for a full day.")
+        if start_time and end_time and start_time >= end_time:
+            raise serializers.ValidationError("Start time must be before end time.")
+        if is_available and start_time is None:
+            raise serializers.ValidationError("Extra availability needs a start and end time.")
+        return data
+
+
+class VetScheduleSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a veterinarian's own schedule.
+    Weekly hours and exceptions are managed through their own endpoints.
+    """
+    weekly_hours = WeeklyAvailabilitySerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = VetSchedule
+        fields = ['id', 'slot_minutes', 'weekly_hours', 'updated_at']
+        read_only_fields = ['id', 'updated_at']
+
+    def to_representation(self, instance):
+        """An unsaved schedule (a vet's defaults) has no stored hours to list"""
+        if instance.pk is None:
+            return {'id': None, 'slot_minutes': instance.slot_minutes, 'weekly_hours': [], 'updated_at': None}
+        return super().to_representation(instance)
+
+
+class AvailableSlotSerializer(serializers.Serializer):
+    """
+    A free bookable slot on a veterinarian's calendar.
+    """
+    date = serializers.DateField()
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
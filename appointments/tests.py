@@ -1,3 +1,441 @@
-from django.test import TestCase
+import io
+from datetime import time, timedelta
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser, Vetprofile
+from medical_records.models import MedicalRecord
+from pets.models import PetProfile
+from . import follow_ups
+from .models import Appointment, Consultation, ScheduleException, VetSchedule, WeeklyAvailability
+from .scheduling import DayIndex, VetCalendar
+from .transitions import TransitionConflict, transition_many
+
+
+class AppointmentQueryCountTests(APITestCase):
+    """
+    Every endpoint must run a fixed number of queries no matter how many rows
+    it returns, so serializers cannot silently reintroduce N+1 lookups.
+    """
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user(
+            'vet@example.com', 'password123', role=CustomUser.VETERINARIAN, first_name='Vera'
+        )
+        Vetprofile.objects.create(user=self.vet, specialization='Surgery', license_number='LIC-1')
+        self.owner = CustomUser.objects.create_user(
+            'owner@example.com', 'password123', role=CustomUser.CLIENT, first_name='Otto'
+        )
+        self.tomorrow = timezone.now().date() + timedelta(days=1)
+        self.appointments = []
+
+    def add_appointments(self, count):
+        """Create `count` appointments, each for a new pet, some with consultations"""
+        for i in range(count):
+            pet = PetProfile.objects.create(owner=self.owner, name=f'Pet {i}', species=PetProfile.DOG, age=2)
+            appointment = Appointment.objects.create(
+                client=self.owner, veterinarian=self.vet, pet=pet,
+                date=self.tomorrow, time=time(9 + i % 8), reason='Checkup',
+                status=Appointment.CONFIRMED,
+            )
+            if i % 2 == 0:
+                Appointment.objects.filter(pk=appointment.pk).update(status=Appointment.COMPLETED)
+                appointment.status = Appointment.COMPLETED
+                Consultation.objects.create(
+                    appointment=appointment, veterinarian=self.vet,
+                    diagnosis='Healthy', notes='All good',
+                )
+            self.appointments.append(appointment)
+
+    def assertConstantQueries(self, user, url, expected):
+        """Check `url` runs `expected` queries with both few and many rows"""
+        self.client.force_authenticate(user)
+        for count in (2, 6):
+            self.add_appointments(count)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def test_appointment_list(self):
+        self.assertConstantQueries(self.vet, '/vetcare/appointments/appointment/', 1)
+        self.assertConstantQueries(self.owner, '/vetcare/appointments/appointment/', 1)
+
+    def test_pending_appointments(self):
+        self.assertConstantQueries(self.vet, '/vetcare/appointments/appointment/pending/', 1)
+
+    def test_upcoming_appointments(self):
+        self.assertConstantQueries(self.vet, '/vetcare/appointments/appointment/upcoming/', 1)
+
+    def test_appointment_detail(self):
+        self.add_appointments(1)
+        self.client.force_authenticate(self.owner)
+        for appointment in self.appointments:
+            with self.assertNumQueries(1):
+                response = self.client.get(f'/vetcare/appointments/appointment/{appointment.pk}/')
+            self.assertEqual(
+                response.data['has_consultation'], appointment.status == Appointment.COMPLETED
+            )
+            self.assertEqual(response.data['vet_specialization'], 'Surgery')
+
+    def test_consultation_lists(self):
+        self.assertConstantQueries(self.vet, '/vetcare/appointments/consultations/', 1)
+        self.assertConstantQueries(self.vet, '/vetcare/appointments/consultations/my-consultations/', 1)
+        self.assertConstantQueries(self.owner, '/vetcare/appointments/consultations/my-history/', 1)
+
+    def test_consultation_detail(self):
+        self.add_appointments(1)
+        consultation = Consultation.objects.get()
+        self.client.force_authenticate(self.owner)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/vetcare/appointments/consultations/{consultation.pk}/')
+        self.assertTrue(response.data['appointment_details']['has_consultation'])
+
+    def test_status_transitions(self):
+        self.client.force_authenticate(self.vet)
+        pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=2)
+        appointment = Appointment.objects.create(
+            client=self.owner, veterinarian=self.vet, pet=pet, date=self.tomorrow, reason='Checkup'
+        )
+        url = f'/vetcare/appointments/appointment/{appointment.pk}/'
+        VetSchedule.objects.create(veterinarian=self.vet)
+
+        # Load, calendar lock and guarded UPDATE (in a savepoint), nothing else
+        with self.assertNumQueries(5):
+            response = self.client.patch(url + 'confirm/', {'time': '15:00'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        with self.assertNumQueries(2):
+            response = self.client.patch(url + 'complete/')
+        self.assertEqual(response.data['status'], Appointment.COMPLETED)
+        self.assertFalse(response.data['has_consultation'])
+
+
+class SchedulingTests(APITestCase):
+    """Free slots come from the weekly hours, exceptions and bookings; confirms cannot double-book"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.vet_profile = Vetprofile.objects.create(user=self.vet, specialization='Surgery', license_number='LIC-1')
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=2)
+        self.day = timezone.now().date() + timedelta(days=7)
+        self.schedule = VetSchedule.objects.create(veterinarian=self.vet, slot_minutes=30)
+        WeeklyAvailability.objects.create(
+            schedule=self.schedule, weekday=self.day.weekday(), start_time=time(9), end_time=time(11)
+        )
+
+    def appointment(self, at=None, status=Appointment.PENDING):
+        appointment = Appointment.objects.create(
+            client=self.owner, veterinarian=self.vet, pet=self.pet, date=self.day, reason='Checkup'
+        )
+        Appointment.objects.filter(pk=appointment.pk).update(status=status, time=at)
+        appointment.refresh_from_db()
+        return appointment
+
+    def starts(self, slots):
+        return [str(slot['start_time'])[:5] for slot in slots]
+
+    def test_day_index(self):
+        index = DayIndex()
+        for start, end, key in [(600, 630, 'b'), (540, 570, 'a'), (540, 720, 'long')]:
+            index.add(start, end, key)
+        self.assertEqual(len(index), 3)
+        # The long interval is found through the running reach, not only its neighbours
+        self.assertTrue(index.overlaps(700, 710))
+        self.assertEqual(index.find_overlap(700, 710), 'long')
+        self.assertFalse(index.overlaps(720, 750))
+        # Touching intervals do not overlap
+        self.assertFalse(index.overlaps(480, 540))
+
+    def test_free_slots(self):
+        self.appointment(time(9, 30), Appointment.CONFIRMED)
+        # Pending requests hold no slot
+        self.appointment(time(10))
+        ScheduleException.objects.create(schedule=self.schedule, date=self.day, start_time=time(10, 30), end_time=time(11))
+        ScheduleException.objects.create(
+            schedule=self.schedule, date=self.day, start_time=time(14), end_time=time(15), is_available=True
+        )
+        calendar = VetCalendar(self.vet.pk, self.day, self.day + timedelta(days=1))
+        self.assertEqual(self.starts(calendar.free_slots()), ['09:00', '10:00', '14:00', '14:30'])
+
+        # A day off blocks everything
+        ScheduleException.objects.create(schedule=self.schedule, date=self.day)
+        self.assertEqual(VetCalendar(self.vet.pk, self.day, self.day).free_slots(), [])
+
+    def test_available_slots_endpoint(self):
+        self.appointment(time(10), Appointment.CONFIRMED)
+        self.client.force_authenticate(self.owner)
+        url = f'/vetcare/appointments/veterinarians/{self.vet_profile.pk}/slots/'
+        response = self.client.get(url, {'start': self.day.isoformat(), 'end': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['slot_minutes'], 30)
+        self.assertEqual(self.starts(response.data['slots']), ['09:00', '09:30', '10:30'])
+
+        self.assertEqual(self.client.get(url, {'start': 'tomorrow'}).status_code, 400)
+        response = self.client.get(url, {'start': self.day.isoformat(), 'end': (self.day - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+    def test_overlapping_confirm_is_refused(self):
+        booked = self.appointment(time(10), Appointment.CONFIRMED)
+        pending = self.appointment()
+        self.client.force_authenticate(self.vet)
+        url = f'/vetcare/appointments/appointment/{pending.pk}/confirm/'
+
+        response = self.client.patch(url, {'time': '10:15'}, format='json')
+        self.assertEqual(response.status_code, 409, response.content)
+        self.assertEqual(response.data['conflicting_appointment'], booked.pk)
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, Appointment.PENDING)
+
+        # The slot right after the booking is free
+        response = self.client.patch(url, {'time': '10:30'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_second_confirm_into_a_slot_conflicts(self):
+        first, second = self.appointment(), self.appointment()
+        self.client.force_authenticate(self.vet)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/vetcare/appointments/appointment/{first.pk}/confirm/', {'time': '09:00'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        # The vet's calendar is locked before the guarded UPDATE runs
+        statements = [query['sql'].split()[0] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements[-2:], ['SELECT', 'UPDATE'])
+        self.assertIn('appointments_vetschedule', queries.captured_queries[-3]['sql'])
+
+        response = self.client.patch(
+            f'/vetcare/appointments/appointment/{second.pk}/confirm/', {'time': '09:00'}, format='json'
+        )
+        self.assertEqual(response.status_code, 409, response.content)
+        self.assertEqual(response.data['conflicting_appointment'], first.pk)
+
+    def test_update_cannot_change_status_or_double_book(self):
+        booked = self.appointment(time(10), Appointment.CONFIRMED)
+        pending = self.appointment()
+        moved = self.appointment(time(9), Appointment.CONFIRMED)
+        self.client.force_authenticate(self.vet)
+
+        # Status changes only go through the guarded transitions
+        response = self.client.patch(
+            f'/vetcare/appointments/appointment/{pending.pk}/update/', {'status': 'confirmed', 'time': '10:00'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('status', response.data)
+        pending.refresh_from_db()
+        self.assertEqual((pending.status, pending.time), (Appointment.PENDING, None))
+
+        url = f'/vetcare/appointments/appointment/{moved.pk}/update/'
+        response = self.client.patch(url, {'time': '10:15'}, format='json')
+        self.assertEqual(response.status_code, 409, response.content)
+        self.assertEqual(response.data['conflicting_appointment'], booked.pk)
+        self.assertEqual(response.data['status'], Appointment.CONFIRMED)
+        moved.refresh_from_db()
+        self.assertEqual(moved.time, time(9))
+
+        # Notes alone never touch the calendar, and a free slot can be taken
+        self.assertEqual(self.client.patch(url, {'notes': 'Fasted'}, format='json').status_code, 200)
+        self.assertEqual(self.client.patch(url, {'time': '10:30'}, format='json').status_code, 200)
+
+    def test_confirm_creates_missing_schedule(self):
+        self.schedule.delete()
+        self.client.force_authenticate(self.vet)
+        response = self.client.patch(
+            f'/vetcare/appointments/appointment/{self.appointment().pk}/confirm/', {'time': '09:00'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(VetSchedule.objects.get(veterinarian=self.vet).slot_minutes, VetSchedule.DEFAULT_SLOT_MINUTES)
+
+    def test_reading_schedule_does_not_create_it(self):
+        self.schedule.delete()
+        self.client.force_authenticate(self.vet)
+        response = self.client.get('/vetcare/appointments/schedule/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['slot_minutes'], VetSchedule.DEFAULT_SLOT_MINUTES)
+        self.assertEqual(response.data['weekly_hours'], [])
+        self.assertFalse(VetSchedule.objects.exists())
+
+        response = self.client.patch('/vetcare/appointments/schedule/', {'slot_minutes': 20}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(VetSchedule.objects.get(veterinarian=self.vet).slot_minutes, 20)
+
+
+class AppointmentBulkActionTests(APITestCase):
+    """The bulk endpoint reports an outcome per id and only moves the vet's own appointments"""
+
+    URL = '/vetcare/appointments/appointment/bulk/'
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.other_vet = CustomUser.objects.create_user('other@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=2)
+        self.day = timezone.now().date() + timedelta(days=3)
+        self.client.force_authenticate(self.vet)
+
+    def appointment(self, at=time(10), veterinarian=None):
+        appointment = Appointment.objects.create(
+            client=self.owner, veterinarian=veterinarian or self.vet, pet=self.pet, date=self.day, reason='Checkup'
+        )
+        Appointment.objects.filter(pk=appointment.pk).update(time=at)
+        appointment.time = at
+        return appointment
+
+    def results(self, response):
+        return {item['id']: item for item in response.data['results']}
+
+    def test_per_item_results(self):
+        mine = self.appointment(time(9))
+        theirs = self.appointment(time(9), veterinarian=self.other_vet)
+        missing = theirs.pk + 100
+        response = self.client.post(self.URL, {'ids': [mine.pk, theirs.pk, missing], 'status': 'confirmed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['updated'], 1)
+
+        results = self.results(response)
+        self.assertEqual(results[mine.pk], {'id': mine.pk, 'success': True, 'status': 'confirmed'})
+        self.assertFalse(results[theirs.pk]['success'])
+        self.assertEqual(results[missing], {'id': missing, 'success': False, 'error': 'Appointment not found.'})
+        self.assertEqual(Appointment.objects.get(pk=theirs.pk).status, Appointment.PENDING)
+
+        # Completing a pending appointment is refused for that item only
+        response = self.client.post(self.URL, {'ids': [mine.pk, self.appointment().pk], 'status': 'completed'}, format='json')
+        self.assertEqual([item['success'] for item in response.data['results']], [True, False])
+
+    def test_conflicting_confirms_in_one_batch(self):
+        first, second, later = self.appointment(time(10)), self.appointment(time(10, 15)), self.appointment(time(11))
+        response = self.client.post(self.URL, {'ids': [first.pk, second.pk, later.pk], 'status': 'confirmed'}, format='json')
+        results = self.results(response)
+        self.assertTrue(results[first.pk]['success'])
+        self.assertTrue(results[later.pk]['success'])
+        self.assertEqual(results[second.pk]['status'], Appointment.PENDING)
+        self.assertEqual(results[second.pk]['conflicting_appointment'], first.pk)
+        self.assertEqual(Appointment.objects.filter(status=Appointment.CONFIRMED).count(), 2)
+
+    def test_rows_moved_by_another_request(self):
+        moved, deleted, ours = self.appointment(time(9)), self.appointment(time(11)), self.appointment(time(13))
+        # Another request confirms and deletes rows after they were loaded
+        Appointment.objects.filter(pk=moved.pk).update(status=Appointment.CONFIRMED)
+        Appointment.objects.filter(pk=deleted.pk).delete()
+
+        results = transition_many([moved, deleted, ours], Appointment.CONFIRMED)
+        self.assertIsInstance(results[moved.pk], TransitionConflict)
+        self.assertEqual(results[moved.pk].status, Appointment.CONFIRMED)
+        self.assertIsInstance(results[deleted.pk], TransitionConflict)
+        self.assertIsNone(results[ours.pk])
+
+
+class FollowUpSchedulingTests(APITestCase):
+    """The follow-up booking job books each due follow-up once"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.today = timezone.now().date()
+        self.pets = [
+            PetProfile.objects.create(owner=self.owner, name=f'Pet {i}', species=PetProfile.DOG, age=2)
+            for i in range(3)
+        ]
+
+    def visit(self, pet, follow_up_in, record=True):
+        """A completed visit today asking for a follow-up in `follow_up_in` days"""
+        appointment = Appointment.objects.create(
+            client=self.owner, veterinarian=self.vet, pet=pet, date=self.today, reason='Checkup'
+        )
+        Appointment.objects.filter(pk=appointment.pk).update(status=Appointment.COMPLETED)
+        appointment.status = Appointment.COMPLETED
+        follow_up_date = self.today + timedelta(days=follow_up_in)
+        consultation = Consultation.objects.create(
+            appointment=appointment, veterinarian=self.vet, diagnosis='Otitis', notes='Drops',
+            follow_up_required=True, follow_up_date=follow_up_date,
+        )
+        if record:
+            MedicalRecord.objects.create(
+                pet=pet, veterinarian=self.vet, appointment=appointment, diagnosis='Otitis', treatment='Drops',
+                follow_up_required=True, follow_up_date=follow_up_date,
+            )
+        return consultation
+
+    def test_books_one_appointment_per_visit(self):
+        consultation = self.visit(self.pets[0], follow_up_in=10)
+        # The visit's medical record is linked to the appointment booked for its consultation
+        self.assertEqual(follow_ups.run(chunk_size=1), (1, 1))
+
+        booked = Appointment.objects.get(status=Appointment.PENDING)
+        self.assertEqual((booked.pet, booked.client, booked.veterinarian), (self.pets[0], self.owner, self.vet))
+        self.assertEqual(booked.date, consultation.follow_up_date)
+        self.assertEqual(booked.reason, 'Follow-up: Otitis')
+        consultation.refresh_from_db()
+        self.assertEqual(consultation.follow_up_appointment, booked)
+        self.assertEqual(MedicalRecord.objects.get().follow_up_appointment, booked)
+
+    def test_is_idempotent(self):
+        for pet in self.pets:
+            self.visit(pet, follow_up_in=5)
+        self.assertEqual(follow_ups.run(chunk_size=2), (3, 3))
+        # Per source model: the release of cancelled links and one empty read in its own savepoint
+        with self.assertNumQueries(8):
+            self.assertEqual(follow_ups.run(), (0, 0))
+        self.assertEqual(Appointment.objects.filter(status=Appointment.PENDING).count(), 3)
+
+    def test_links_existing_appointment(self):
+        self.visit(self.pets[0], follow_up_in=10, record=False)
+        existing = Appointment.objects.create(
+            client=self.owner, veterinarian=self.vet, pet=self.pets[0],
+            date=self.today + timedelta(days=12), reason='Recheck',
+        )
+        self.assertEqual(follow_ups.run(), (0, 1))
+        self.assertEqual(Consultation.objects.get().follow_up_appointment, existing)
+
+        # A cancelled appointment does not count, even once linked
+        Appointment.objects.filter(pk=existing.pk).update(status=Appointment.CANCELLED)
+        self.assertEqual(follow_ups.run(), (1, 0))
+        self.assertEqual(Consultation.objects.get().follow_up_appointment.status, Appointment.PENDING)
+
+    def test_changed_follow_up_is_rebooked(self):
+        consultation = self.visit(self.pets[0], follow_up_in=5)
+        self.assertEqual(follow_ups.run(), (1, 1))
+        first = Appointment.objects.get(status=Appointment.PENDING)
+
+        # Saving without a follow-up change keeps the link
+        consultation = Consultation.objects.get()
+        consultation.notes = 'Drops twice a day'
+        consultation.save()
+        self.assertEqual(Consultation.objects.get().follow_up_appointment, first)
+
+        new_date = self.today + timedelta(days=13)
+        consultation.follow_up_date = new_date
+        consultation.save()
+        record = MedicalRecord.objects.get()
+        record.follow_up_date = new_date
+        record.save()
+        self.assertIsNone(Consultation.objects.get().follow_up_appointment)
+        self.assertIsNone(MedicalRecord.objects.get().follow_up_appointment)
+
+        self.assertEqual(follow_ups.run(), (1, 1))
+        second = Consultation.objects.get().follow_up_appointment
+        self.assertEqual(second.date, new_date)
+        self.assertEqual(MedicalRecord.objects.get().follow_up_appointment, second)
+
+        # Turning the follow-up off releases the link and books nothing
+        record = MedicalRecord.objects.get()
+        record.follow_up_required = False
+        record.follow_up_date = None
+        record.save(update_fields=['follow_up_required', 'follow_up_date'])
+        self.assertIsNone(MedicalRecord.objects.get().follow_up_appointment)
+        self.assertEqual(follow_ups.run(), (0, 0))
+
+    def test_waits_until_within_lead_days(self):
+        self.visit(self.pets[0], follow_up_in=30, record=False)
+        self.assertEqual(follow_ups.run(lead_days=14), (0, 0))
+        self.assertEqual(follow_ups.run(today=self.today + timedelta(days=20), lead_days=14), (1, 0))
+
+    def test_command(self):
+        self.visit(self.pets[0], follow_up_in=3)
+        out = io.StringIO()
+        call_command('schedule_follow_ups', stdout=out)
+        self.assertIn('Booked 1 follow-up appointments', out.getvalue())
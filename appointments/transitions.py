@@ -0,0 +1,244 @@
+"""
+Compare-and-swap status transitions for appointments.
+
+Each move is applied as a single ``UPDATE ... WHERE id = %s AND status IN (...)``
+so the database decides the winner when two requests race. A status change
+cannot invalidate the client, pet or veterinarian, so the model's full_clean()
+(and its FK lookups) is skipped. Extra reads only happen on the failure path,
+to explain why nothing was updated. Successful moves notify the other
+participants once the transaction commits (see notifications.fanout).
+
+The overlap guard on a confirm is a NOT EXISTS inside the UPDATE. On its own
+that does not stop two confirms of different appointments into the same slot
+under READ COMMITTED, since neither sees the other's uncommitted booking. So
+confirms first lock the vet's calendar (scheduling.lock_calendars).
+"""
+from contextlib import nullcontext
+
+from django.db import transaction
+from django.db.models import Exists
+from django.utils import timezone
+
+from notifications import fanout
+from pets.models import CareRelationship
+from .models import Appointment
+from .scheduling import VetCalendar, find_conflict, lock_calendars, overlapping_bookings, slot_minutes_for
+
+
+# Rows per UPDATE when moving many appointments at once
+BULK_BATCH_SIZE = 100
+
+
+# Statuses an appointment may be in for each target status
+TRANSITION_SOURCES = {
+    Appointment.CONFIRMED: [Appointment.PENDING],
+    Appointment.COMPLETED: [Appointment.CONFIRMED],
+    Appointment.CANCELLED: [Appointment.PENDING, Appointment.CONFIRMED],
+}
+
+TRANSITION_ERRORS = {
+    Appointment.CONFIRMED: "Only pending appointments can be confirmed.",
+    Appointment.COMPLETED: "Only confirmed appointments can be marked as completed.",
+    Appointment.CANCELLED: "This appointment cannot be cancelled.",
+}
+
+
+class TransitionError(Exception):
+    """The appointment is not in a state that allows the requested move."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class TransitionConflict(TransitionError):
+    """The appointment changed between being read and being updated."""
+
+
+class SlotUnavailable(TransitionError):
+    """Confirming would overlap another booking on the veterinarian's calendar."""
+
+    def __init__(self, message, conflicting_appointment=None, status=Appointment.PENDING):
+        super().__init__(message, status=status)
+        self.conflicting_appointment = conflicting_appointment
+
+
+def guard_conditions(target, today=None):
+    """Filter kwargs an appointment row must match for the move to `target`"""
+    if target not in TRANSITION_SOURCES:
+        raise ValueError(f"Unsupported target status: {target}")
+
+    conditions = {'status__in': TRANSITION_SOURCES[target]}
+    if target == Appointment.CANCELLED:
+        # Past appointments cannot be cancelled (Appointment.can_be_cancelled)
+        conditions['date__gte'] = today or timezone.now().date()
+    return conditions
+
+
+def is_allowed(appointment, target):
+    """Check the in-memory copy of an appointment against the guard"""
+    if appointment.status not in TRANSITION_SOURCES.get(target, []):
+        return False
+    if target == Appointment.CANCELLED:
+        return appointment.can_be_cancelled
+    return True
+
+
+def transition(appointment, target, actor_id=None, **changes):
+    """
+    Move `appointment` to `target`, also writing any field `changes`
+    (e.g. date/time on confirm), with one conditional UPDATE.
+    `actor_id` is the user making the move, who is not notified of it.
+
+    Raises TransitionError if the loaded status does not allow the move,
+    TransitionConflict if another request changed the row first, and
+    SlotUnavailable if a confirm would double-book the veterinarian.
+    The instance is updated in place and returned on success.
+    """
+    if not is_allowed(appointment, target):
+        raise TransitionError(TRANSITION_ERRORS[target], status=appointment.status)
+
+    rows = Appointment.objects.filter(pk=appointment.pk, **guard_conditions(target))
+
+    day = changes.get('date', appointment.date)
+    start_time = changes.get('time', appointment.time)
+    now = timezone.now()
+    books_slot = target == Appointment.CONFIRMED and start_time
+    with transaction.atomic() if books_slot else nullcontext():
+        if books_slot:
+            # Other confirms for this vet wait here until we commit
+            lock_calendars([appointment.veterinarian_id])
+            overlapping = overlapping_bookings(
+                appointment.veterinarian_id, day, start_time, slot_minutes_for(appointment.veterinarian)
+            ).exclude(pk=appointment.pk)
+            rows = rows.filter(~Exists(overlapping))
+
+        if not rows.update(status=target, updated_at=now, **changes):
+            raise _explain_failure(appointment, target, day, start_time)
+
+    appointment.status = target
+    appointment.updated_at = now
+    for field, value in changes.items():
+        setattr(appointment, field, value)
+    if 'date' in changes:
+        CareRelationship.record(appointment.veterinarian_id, appointment.pet_id, appointment.date)
+    fanout.notify([fanout.appointment_status_changed(appointment, actor_id)])
+    return appointment
+
+
+def transition_many(appointments, target, batch_size=BULK_BATCH_SIZE, actor_id=None):
+    """
+    Move several loaded appointments to `target` using batched guarded UPDATEs.
+
+    Confirm overlaps are checked against each vet's calendar in memory, so
+    appointments in the same batch cannot double-book each other either.
+    Call inside a transaction with the rows loaded via select_for_update()
+    so the batch sees a stable snapshot. For confirms, lock the vets'
+    calendars (scheduling.lock_calendars) before loading the rows.
+
+    Returns a dict of appointment id -> TransitionError, or None on success.
+    Successful instances are updated in place and their participants other
+    than `actor_id` notified together; the instances need client_id loaded.
+    """
+    results = {}
+    eligible = []
+    calendars = {}
+
+    if target == Appointment.CONFIRMED:
+        # Already held if the caller locked them first, as it should
+        lock_calendars(appointment.veterinarian_id for appointment in appointments if appointment.time)
+
+    for appointment in appointments:
+        if not is_allowed(appointment, target):
+            results[appointment.pk] = TransitionError(TRANSITION_ERRORS[target], status=appointment.status)
+            continue
+
+        if target == Appointment.CONFIRMED and appointment.time:
+            calendar = calendars.get(appointment.veterinarian_id)
+            if calendar is None:
+                days = [a.date for a in appointments if a.veterinarian_id == appointment.veterinarian_id]
+                calendar = VetCalendar(appointment.veterinarian_id, min(days), max(days), load_hours=False)
+                calendars[appointment.veterinarian_id] = calendar
+
+            if appointment.pk in calendar.booked_ids:
+                # Already booked in the database, so moved by another request; the guarded UPDATE reports it
+                eligible.append(appointment)
+                continue
+
+            conflict = calendar.find_conflict(appointment.date, appointment.time)
+            if conflict:
+                results[appointment.pk] = SlotUnavailable(
+                    "The veterinarian already has an appointment at this time.",
+                    conflicting_appointment=conflict,
+                )
+                continue
+            calendar.book(appointment.date, appointment.time, appointment.pk)
+
+        eligible.append(appointment)
+
+    now = timezone.now()
+    conditions = guard_conditions(target)
+    for start in range(0, len(eligible), batch_size):
+        batch = {appointment.pk: appointment for appointment in eligible[start:start + batch_size]}
+        updated = Appointment.objects.filter(pk__in=batch, **conditions).update(status=target, updated_at=now)
+
+        current = None
+        if updated < len(batch):
+            # Someone else moved or deleted some rows between our read and the UPDATE.
+            # Rows they moved to `target` themselves do not carry our timestamp.
+            current = {
+                pk: (status, updated_at)
+                for pk, status, updated_at in Appointment.objects.filter(pk__in=batch).values_list('pk', 'status', 'updated_at')
+            }
+
+        for pk, appointment in batch.items():
+            if current is not None and current.get(pk) != (target, now):
+                if pk not in current:
+                    results[pk] = TransitionConflict("This appointment no longer exists.")
+                else:
+                    results[pk] = TransitionConflict(
+                        f"This appointment was {current[pk][0]} by another request.", status=current[pk][0]
+                    )
+            else:
+                appointment.status = target
+                appointment.updated_at = now
+                results[pk] = None
+
+    fanout.notify([
+        fanout.appointment_status_changed(appointment, actor_id)
+        for appointment in eligible if results[appointment.pk] is None
+    ])
+    return results
+
+
+def _explain_failure(appointment, target, day, start_time):
+    """Work out why a guarded UPDATE matched no rows"""
+    current = Appointment.objects.filter(pk=appointment.pk).values_list('status', flat=True).first()
+
+    if current is None:
+        return TransitionConflict("This appointment no longer exists.")
+
+    if current not in TRANSITION_SOURCES[target]:
+        return TransitionConflict(
+            f"This appointment was {current} by another request.", status=current
+        )
+
+    if target == Appointment.CONFIRMED:
+        probe = Appointment(
+            pk=appointment.pk,
+            veterinarian_id=appointment.veterinarian_id,
+            date=day,
+            time=start_time,
+        )
+        conflict = find_conflict(probe)
+        if conflict:
+            return SlotUnavailable(
+                "The veterinarian already has an appointment at this time.",
+                conflicting_appointment=conflict,
+            )
+
+    if target == Appointment.CANCELLED:
+        return TransitionError(TRANSITION_ERRORS[target], status=current)
+
+    return TransitionConflict("This appointment changed while updating; please retry.", status=current)
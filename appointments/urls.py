@@ -7,6 +7,7 @@ from .views import (
     AppointmentConfirmView,
     AppointmentCompleteView,
     AppointmentCancelView,
+    AppointmentBulkActionView,
     PendingAppointmentsView,
     UpcomingAppointmentsView,
 
@@ -15,6 +16,13 @@ from .views import (
     ConsultationDetailView,
     ClientConsultationHistoryView,
     VetConsultationHistoryView,
+
+    MyScheduleView,
+    WeeklyAvailabilityListCreateView,
+    WeeklyAvailabilityDetailView,
+    ScheduleExceptionListCreateView,
+    ScheduleExceptionDetailView,
+    VetAvailableSlotsView,
 )
 
 app_name = 'appointments'
@@ -27,6 +35,7 @@ urlpatterns = [
     path('appointment/<int:pk>/confirm/', AppointmentConfirmView.as_view(), name='appointment-confirm'),
     path('appointment/<int:pk>/complete/', AppointmentCompleteView.as_view(), name='appointment-complete'),
     path('appointment/<int:pk>/cancel/', AppointmentCancelView.as_view(), name='appointment-cancel'),
+    path('appointment/bulk/', AppointmentBulkActionView.as_view(), name='appointment-bulk'),
     path('appointment/pending/', PendingAppointmentsView.as_view(), name='appointment-pending'),
     path('appointment/upcoming/', UpcomingAppointmentsView.as_view(), name='appointment-upcoming'),
     
@@ -36,4 +45,11 @@ urlpatterns = [
     path('consultations/<int:pk>/', ConsultationDetailView.as_view(), name='consultation-detail'),
     path('consultations/my-history/', ClientConsultationHistoryView.as_view(), name='client-consultation-history'),
     path('consultations/my-consultations/', VetConsultationHistoryView.as_view(), name='vet-consultation-history'),
+
+    path('schedule/', MyScheduleView.as_view(), name='my-schedule'),
+    path('schedule/hours/', WeeklyAvailabilityListCreateView.as_view(), name='schedule-hours'),
+    path('schedule/hours/<int:pk>/', WeeklyAvailabilityDetailView.as_view(), name='schedule-hours-detail'),
+    path('schedule/exceptions/', ScheduleExceptionListCreateView.as_view(), name='schedule-exceptions'),
+    path('schedule/exceptions/<int:pk>/', ScheduleExceptionDetailView.as_view(), name='schedule-exception-detail'),
+    path('veterinarians/<int:pk>/slots/', VetAvailableSlotsView.as_view(), name='vet-available-slots'),
 ]
\ No newline at end of file
@@ -3,13 +3,33 @@ from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 
-from .models import Appointment, Consultation
+from .models import Appointment, Consultation, VetSchedule, WeeklyAvailability, ScheduleException
 from .serializers import (AppointmentListSerializer,AppointmentDetailSerializer,AppointmentCreateSerializer,AppointmentUpdateSerializer,
-                          AppointmentStatusUpdateSerializer,ConsultationSerializer,ConsultationListSerializer)
+                          AppointmentStatusUpdateSerializer,AppointmentConfirmSerializer,AppointmentBulkActionSerializer,ConsultationSerializer,ConsultationListSerializer,
+                          VetScheduleSerializer,WeeklyAvailabilitySerializer,ScheduleExceptionSerializer,AvailableSlotSerializer)
+from .scheduling import VetCalendar, lock_calendars, overlapping_bookings, slot_minutes_for
+from .transitions import transition, transition_many, TransitionError, TransitionConflict, SlotUnavailable
 from .permissions import (IsAppointmentParticipant,IsAppointmentVeterinarian,IsAppointmentClient,IsConsultationVeterinarian,CanViewConsultation)
 from accounts.permissions import IsVeterinarian, IsClient
 from accounts.models import Vetprofile
+from Vetcare.query_optimizer import OptimizedQuerysetMixin, optimize_queryset
+
+
+def annotate_consultation_exists(queryset):
+    """Annotate has_consultation for AppointmentDetailSerializer without a query per row"""
+    return queryset.annotate(
+        consultation_exists=Exists(Consultation.objects.filter(appointment=OuterRef('pk')))
+    )
+
+
+def with_appointment_details(queryset):
+    """Join and annotate everything AppointmentDetailSerializer reads"""
+    return annotate_consultation_exists(optimize_queryset(queryset, AppointmentDetailSerializer))
 
 
 # APPOINTMENT VIEWS
@@ -26,7 +46,7 @@ class AppointmentCreateView(generics.CreateAPIView):
         serializer.save(client=self.request.user)
 
 
-class AppointmentListView(generics.ListAPIView):
+class AppointmentListView(OptimizedQuerysetMixin, generics.ListAPIView):
     """List appointments for the logged-in user. """
     serializer_class = AppointmentListSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -38,27 +58,27 @@ class AppointmentListView(generics.ListAPIView):
         if user.role == 'VETERINARIAN':
             return Appointment.objects.filter(
                 veterinarian=user
-            ).select_related('client', 'veterinarian', 'pet').order_by('-date', '-created_at')
+            ).order_by('-date', '-created_at')
         
         elif user.role == 'CLIENT':
             return Appointment.objects.filter(
                 client=user
-            ).select_related('client', 'veterinarian', 'pet').order_by('-date', '-created_at')
+            ).order_by('-date', '-created_at')
         
         return Appointment.objects.none()
 
 
-class AppointmentDetailView(generics.RetrieveAPIView):
+class AppointmentDetailView(OptimizedQuerysetMixin, generics.RetrieveAPIView):
     """ View detailed information about a specific appointment """
 
-    queryset = Appointment.objects.select_related('client', 'veterinarian', 'pet').all()
+    queryset = annotate_consultation_exists(Appointment.objects.all())
     serializer_class = AppointmentDetailSerializer
     permission_classes = [permissions.IsAuthenticated, IsAppointmentParticipant]
 
 
 class AppointmentUpdateView(generics.UpdateAPIView):
     """ Update appointment (Veterinarian only). """
-    queryset = Appointment.objects.all()
+    queryset = with_appointment_details(Appointment.objects.all())
     serializer_class = AppointmentUpdateSerializer
     permission_classes = [permissions.IsAuthenticated, IsAppointmentVeterinarian]
 
@@ -68,7 +88,10 @@ class AppointmentUpdateView(generics.UpdateAPIView):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+        try:
+            self.perform_update(serializer)
+        except TransitionError as e:
+            return transition_error_response(e)
         
         # Return detailed response
         return Response(
@@ -76,36 +99,45 @@ class AppointmentUpdateView(generics.UpdateAPIView):
             status=status.HTTP_200_OK
         )
 
+    def perform_update(self, serializer):
+        """Save, refusing to move a booked appointment onto a slot that overlaps another booking"""
+        appointment = serializer.instance
+        booking = {field: serializer.validated_data.get(field, getattr(appointment, field)) for field in ('date', 'time')}
+        moves_slot = (
+            appointment.status in Appointment.BOOKED_STATUSES and booking['time']
+            and any(value != getattr(appointment, field) for field, value in booking.items())
+        )
+        with transaction.atomic() if moves_slot else nullcontext():
+            if moves_slot:
+                # Same lock and overlap check as a confirm (see transitions.transition)
+                lock_calendars([appointment.veterinarian_id])
+                conflict = overlapping_bookings(
+                    appointment.veterinarian_id, booking['date'], booking['time'], slot_minutes_for(appointment.veterinarian)
+                ).exclude(pk=appointment.pk).values_list('pk', flat=True).first()
+                if conflict:
+                    raise SlotUnavailable(
+                        "The veterinarian already has an appointment at this time.",
+                        conflicting_appointment=conflict, status=appointment.status,
+                    )
+            serializer.save()
+
 
 class AppointmentConfirmView(generics.UpdateAPIView):
     """Confirm an appointment (Veterinarian only)."""
-    queryset = Appointment.objects.all()
+    queryset = with_appointment_details(Appointment.objects.select_related('veterinarian__schedule'))
     permission_classes = [permissions.IsAuthenticated, IsAppointmentVeterinarian]
 
     def update(self, request, *args, **kwargs):
         appointment = self.get_object()
         
-        # Validate current status
-        if appointment.status != Appointment.PENDING:
-            return Response(
-                {"error": "Only pending appointments can be confirmed."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Update appointment
-        appointment.status = Appointment.CONFIRMED
-        appointment.date = request.data.get('date', appointment.date)
-        appointment.time = request.data.get('time', appointment.time)
+        serializer = AppointmentConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        # Validate before saving
+        # Single guarded UPDATE; also refuses slots that overlap another booking
         try:
-            appointment.full_clean()
-            appointment.save()
-        except ValidationError as e:
-            return Response(
-                {"error": str(e)},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            transition(appointment, Appointment.CONFIRMED, actor_id=request.user.pk, **serializer.validated_data)
+        except TransitionError as e:
+            return transition_error_response(e)
         
         return Response(
             AppointmentDetailSerializer(appointment).data,
@@ -115,22 +147,16 @@ class AppointmentConfirmView(generics.UpdateAPIView):
 
 class AppointmentCompleteView(generics.UpdateAPIView):
     """Mark an appointment as completed (Veterinarian only)"""
-    queryset = Appointment.objects.all()
+    queryset = with_appointment_details(Appointment.objects.all())
     permission_classes = [permissions.IsAuthenticated, IsAppointmentVeterinarian]
 
     def update(self, request, *args, **kwargs):
         appointment = self.get_object()
         
-        # Validate current status
-        if appointment.status != Appointment.CONFIRMED:
-            return Response(
-                {"error": "Only confirmed appointments can be marked as completed."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Update status
-        appointment.status = Appointment.COMPLETED
-        appointment.save()
+        try:
+            transition(appointment, Appointment.COMPLETED, actor_id=request.user.pk)
+        except TransitionError as e:
+            return transition_error_response(e)
         
         return Response(
             AppointmentDetailSerializer(appointment).data,
@@ -140,29 +166,24 @@ class AppointmentCompleteView(generics.UpdateAPIView):
 
 class AppointmentCancelView(generics.UpdateAPIView):
     """Cancel an appointment"""
-    queryset = Appointment.objects.all()
+    queryset = with_appointment_details(Appointment.objects.all())
     permission_classes = [permissions.IsAuthenticated, IsAppointmentParticipant]
 
     def update(self, request, *args, **kwargs):
         appointment = self.get_object()
         user = request.user
         
-        # Check if appointment can be cancelled
-        if not appointment.can_be_cancelled:
-            return Response(
-                {"error": "This appointment cannot be cancelled."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         # Verify user is either client or vet
-        if user != appointment.client and user != appointment.veterinarian:
+        if user.pk != appointment.client_id and user.pk != appointment.veterinarian_id:
             return Response(
                 {"error": "You are not authorized to cancel this appointment."},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        appointment.status = Appointment.CANCELLED
-        appointment.save()
+        try:
+            transition(appointment, Appointment.CANCELLED, actor_id=user.pk)
+        except TransitionError as e:
+            return transition_error_response(e)
         
         return Response(
             AppointmentDetailSerializer(appointment).data,
@@ -170,6 +191,80 @@ class AppointmentCancelView(generics.UpdateAPIView):
         )
 
 
+class AppointmentBulkActionView(generics.GenericAPIView):
+    """
+    Confirm, complete or cancel several appointments in one request (Veterinarian only).
+    Body: {"ids": [1, 2, 3], "status": "confirmed"}
+    Returns a result for every requested ID.
+    """
+    serializer_class = AppointmentBulkActionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAppointmentVeterinarian]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        target = serializer.validated_data['status']
+        
+        with transaction.atomic():
+            if target == Appointment.CONFIRMED:
+                # Calendar before appointment rows, the order single confirms take them in
+                lock_calendars([request.user.pk])
+            # One query loads (and locks) the whole set for the ownership check
+            appointments = Appointment.objects.select_for_update().filter(pk__in=ids).only(
+                'id', 'client_id', 'veterinarian_id', 'status', 'date', 'time'
+            ).in_bulk()
+            
+            owned = []
+            errors = {}
+            for pk in ids:
+                appointment = appointments.get(pk)
+                if appointment is None:
+                    errors[pk] = "Appointment not found."
+                elif appointment.veterinarian_id != request.user.pk:
+                    errors[pk] = IsAppointmentVeterinarian.message
+                else:
+                    owned.append(appointment)
+            
+            outcomes = transition_many(owned, target, actor_id=request.user.pk)
+        
+        results = []
+        for pk in ids:
+            error = outcomes.get(pk)
+            if pk in errors:
+                results.append({"id": pk, "success": False, "error": errors[pk]})
+            elif error is not None:
+                item = {"id": pk, "success": False, "error": error.message, "status": error.status}
+                if isinstance(error, SlotUnavailable):
+                    item["conflicting_appointment"] = error.conflicting_appointment
+                results.append(item)
+            else:
+                results.append({"id": pk, "success": True, "status": target})
+        
+        return Response({
+            "status": target,
+            "updated": sum(1 for item in results if item["success"]),
+            "results": results,
+        }, status=status.HTTP_200_OK)
+
+
+def transition_error_response(error):
+    """
+    Map a failed status transition to a response.
+    Invalid moves are 400; lost races and double-bookings are 409.
+    """
+    body = {"error": error.message}
+    if error.status:
+        body["status"] = error.status
+    
+    if isinstance(error, SlotUnavailable):
+        body["conflicting_appointment"] = error.conflicting_appointment
+    
+    if isinstance(error, (TransitionConflict, SlotUnavailable)):
+        return Response(body, status=status.HTTP_409_CONFLICT)
+    return Response(body, status=status.HTTP_400_BAD_REQUEST)
+
+
 # CONSULTATION VIEWS
 
 class ConsultationCreateView(generics.CreateAPIView):
@@ -182,7 +277,7 @@ class ConsultationCreateView(generics.CreateAPIView):
         serializer.save(veterinarian=self.request.user)
 
 
-class ConsultationListView(generics.ListAPIView):
+class ConsultationListView(OptimizedQuerysetMixin, generics.ListAPIView):
     #List consultations for the logged-in user.
     serializer_class = ConsultationListSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -194,19 +289,19 @@ class ConsultationListView(generics.ListAPIView):
         if user.role == 'VETERINARIAN':
             return Consultation.objects.filter(
                 veterinarian=user
-            ).select_related('appointment', 'veterinarian').order_by('-created_at')
+            ).order_by('-created_at')
         
         elif user.role == 'CLIENT':
             return Consultation.objects.filter(
                 appointment__client=user
-            ).select_related('appointment', 'veterinarian').order_by('-created_at')
+            ).order_by('-created_at')
         
         return Consultation.objects.none()
 
 
-class ConsultationDetailView(generics.RetrieveUpdateAPIView):
+class ConsultationDetailView(OptimizedQuerysetMixin, generics.RetrieveUpdateAPIView):
     """View or update a consultation."""
-    queryset = Consultation.objects.select_related('appointment', 'veterinarian').all()
+    queryset = Consultation.objects.all()
     serializer_class = ConsultationSerializer
     permission_classes = [permissions.IsAuthenticated, CanViewConsultation]
 
@@ -217,7 +312,7 @@ class ConsultationDetailView(generics.RetrieveUpdateAPIView):
         return [permissions.IsAuthenticated(), CanViewConsultation()]
 
 
-class ClientConsultationHistoryView(generics.ListAPIView):
+class ClientConsultationHistoryView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     List all consultations for the logged-in client's pets.
     """
@@ -228,10 +323,10 @@ class ClientConsultationHistoryView(generics.ListAPIView):
         """Return all consultations for the client's pets"""
         return Consultation.objects.filter(
             appointment__client=self.request.user
-        ).select_related('appointment', 'veterinarian').order_by('-created_at')
+        ).order_by('-created_at')
 
 
-class VetConsultationHistoryView(generics.ListAPIView):
+class VetConsultationHistoryView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     List all consultations created by the logged-in veterinarian.
     """
@@ -242,10 +337,10 @@ class VetConsultationHistoryView(generics.ListAPIView):
         """Return all consultations created by this vet"""
         return Consultation.objects.filter(
             veterinarian=self.request.user
-        ).select_related('appointment', 'veterinarian').order_by('-created_at')
+        ).order_by('-created_at')
 
 
-class PendingAppointmentsView(generics.ListAPIView):
+class PendingAppointmentsView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     List pending appointments (Veterinarian only).
     """
@@ -257,10 +352,10 @@ class PendingAppointmentsView(generics.ListAPIView):
         return Appointment.objects.filter(
             veterinarian=self.request.user,
             status=Appointment.PENDING
-        ).select_related('client', 'pet').order_by('date', 'created_at')
+        ).order_by('date', 'created_at')
 
 
-class UpcomingAppointmentsView(generics.ListAPIView):
+class UpcomingAppointmentsView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     List upcoming confirmed appointments.
     """
@@ -275,7 +370,7 @@ class UpcomingAppointmentsView(generics.ListAPIView):
         base_query = Appointment.objects.filter(
             status=Appointment.CONFIRMED,
             date__gte=today
-        ).select_related('client', 'veterinarian', 'pet')
+        )
         
         if user.role == 'VETERINARIAN':
             return base_query.filter(veterinarian=user).order_by('date', 'time')
@@ -283,4 +378,119 @@ class UpcomingAppointmentsView(generics.ListAPIView):
         elif user.role == 'CLIENT':
             return base_query.filter(client=user).order_by('date', 'time')
         
-        return Appointment.objects.none()
\ No newline at end of file
+        return Appointment.objects.none()
+
+
+# SCHEDULE VIEWS
+
+class MyScheduleView(generics.RetrieveUpdateAPIView):
+    """
+    View or update own schedule settings (Veterinarian only).
+    """
+    serializer_class = VetScheduleSerializer
+    permission_classes = [permissions.IsAuthenticated, IsVeterinarian]
+
+    def get_object(self):
+        """The vet's schedule; reading one that was never saved shows the defaults without creating it"""
+        if self.request.method in ['PUT', 'PATCH']:
+            obj, created = VetSchedule.objects.get_or_create(veterinarian=self.request.user)
+            return obj
+        return VetSchedule.objects.filter(veterinarian=self.request.user).first() or VetSchedule(veterinarian=self.request.user)
+
+
+class WeeklyAvailabilityListCreateView(generics.ListCreateAPIView):
+    """
+    List or add recurring weekly working hours (Veterinarian only).
+    """
+    serializer_class = WeeklyAvailabilitySerializer
+    permission_classes = [permissions.IsAuthenticated, IsVeterinarian]
+
+    def get_queryset(self):
+        return WeeklyAvailability.objects.filter(schedule__veterinarian=self.request.user)
+
+    def perform_create(self, serializer):
+        schedule, created = VetSchedule.objects.get_or_create(veterinarian=self.request.user)
+        serializer.save(schedule=schedule)
+
+
+class WeeklyAvailabilityDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """
+    View, update or remove a block of weekly working hours (Veterinarian only).
+    """
+    serializer_class = WeeklyAvailabilitySerializer
+    permission_classes = [permissions.IsAuthenticated, IsVeterinarian]
+
+    def get_queryset(self):
+        return WeeklyAvailability.objects.filter(schedule__veterinarian=self.request.user)
+
+
+class ScheduleExceptionListCreateView(generics.ListCreateAPIView):
+    """
+    List or add schedule exceptions such as days off or extra hours (Veterinarian only).
+    """
+    serializer_class = ScheduleExceptionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsVeterinarian]
+
+    def get_queryset(self):
+        return ScheduleException.objects.filter(
+            schedule__veterinarian=self.request.user,
+            date__gte=timezone.now().date()
+        )
+
+    def perform_create(self, serializer):
+        schedule, created = VetSchedule.objects.get_or_create(veterinarian=self.request.user)
+        serializer.save(schedule=schedule)
+
+
+class ScheduleExceptionDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """
+    View, update or remove a schedule exception (Veterinarian only).
+    """
+    serializer_class = ScheduleExceptionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsVeterinarian]
+
+    def get_queryset(self):
+        return ScheduleException.objects.filter(schedule__veterinarian=self.request.user)
+
+
+class VetAvailableSlotsView(generics.GenericAPIView):
+    """
+    List free slots for a veterinarian between two dates.
+    Takes the veterinarian profile ID, as used when booking.
+    Query params: start, end (YYYY-MM-DD, default today and a week ahead).
+    """
+    serializer_class = AvailableSlotSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    MAX_RANGE_DAYS = 31
+
+    def get(self, request, *args, **kwargs):
+        vet_profile = get_object_or_404(Vetprofile, pk=self.kwargs.get('pk'))
+        
+        today = timezone.now().date()
+        start = self._parse_date('start', today)
+        end = self._parse_date('end', start + timedelta(days=7))
+        
+        if end < start:
+            raise ValidationError({"end": "End date must not be before start date."})
+        if (end - start).days >= self.MAX_RANGE_DAYS:
+            raise ValidationError({"end": f"Date range cannot exceed {self.MAX_RANGE_DAYS} days."})
+        
+        calendar = VetCalendar(vet_profile.user_id, max(start, today), end)
+        serializer = self.get_serializer(calendar.free_slots(), many=True)
+        
+        return Response({
+            "veterinarian": vet_profile.pk,
+            "slot_minutes": calendar.slot_minutes,
+            "slots": serializer.data,
+        })
+
+    def _parse_date(self, param, default):
+        """Parse a YYYY-MM-DD query parameter"""
+        value = self.request.query_params.get(param)
+        if not value:
+            return default
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValidationError({param: "Use the YYYY-MM-DD format."})
@@ -0,0 +1,121 @@
+"""
+Deterministic data for the endpoint benchmarks.
+
+The dataset comes from the same generator as ``manage.py seed_vetcare``
+(see benchmarks.seeding), at a size that keeps the suite quick. Every vet
+works every day so slot listings do not depend on the weekday the suite
+runs on. The same seed and scale always produce the same rows.
+"""
+from datetime import time, timedelta
+
+from django.utils import timezone
+
+from accounts.models import CustomUser, ClientProfile, Vetprofile
+from appointments.models import Appointment, Consultation, VetSchedule, ScheduleException
+from medical_records.models import MedicalRecord, MedicalRecordRevision, TestResultUpload, Vaccination
+from notifications.models import Notification
+
+from .seeding import Seeder
+
+
+PREFIX = 'bench'
+PASSWORD = f'{PREFIX}-password'
+
+# Base volumes at scale=1
+VETS = 10
+CLIENTS = 60
+APPOINTMENTS = 1200
+NOTIFICATIONS_PER_USER = 8
+
+
+def build_fixture(scale=1, seed=1234):
+    """
+    Seed the database and return the named objects the benchmarks act as or on.
+    The benchmarked vet is the busiest available one.
+    """
+    seeder = Seeder(
+        seed=seed, vets=VETS * scale, clients=CLIENTS * scale, appointments=APPOINTMENTS * scale,
+        notifications_per_user=NOTIFICATIONS_PER_USER, history_days=365, weekend_hours=1, prefix=PREFIX,
+    )
+    seeder.run()
+    vet_profile = Vetprofile.objects.filter(is_available=True).order_by('user_id').first()
+    named = _named_objects(vet_profile.user, vet_profile, timezone.now().date())
+    seeder.rebuild_derived()
+    return named
+
+
+def _named_objects(vet, vet_profile, today):
+    """
+    Pick a client of the benchmarked vet and add the rows that write
+    endpoints need, so each benchmark hits its success path.
+    """
+    client = CustomUser.objects.filter(
+        client_appointments__veterinarian=vet
+    ).order_by('pk').first()
+    pet = client.pets.order_by('pk').first()
+    tomorrow = today + timedelta(days=1)
+
+    def appointment(**fields):
+        values = dict(client=client, veterinarian=vet, pet=pet, date=tomorrow, reason='Benchmark visit')
+        values.update(fields)
+        return Appointment.objects.bulk_create([Appointment(**values)])[0]
+
+    pending = [appointment() for _ in range(5)]
+    confirmed = appointment(status=Appointment.CONFIRMED, time=time(7, 0))
+    completed = appointment(status=Appointment.COMPLETED, date=today - timedelta(days=3), time=time(7, 0))
+    consulted = appointment(status=Appointment.COMPLETED, date=today - timedelta(days=2), time=time(7, 0))
+    consultation = Consultation.objects.bulk_create([
+        Consultation(appointment=consulted, veterinarian=vet, diagnosis='Healthy', notes='Fine')
+    ])[0]
+    record = MedicalRecord.objects.filter(veterinarian=vet, pet__owner=client).order_by('pk').first()
+    if record is None:
+        record = MedicalRecord.objects.bulk_create([
+            MedicalRecord(pet=pet, appointment=consulted, veterinarian=vet,
+                          diagnosis='Healthy', treatment='None')
+        ])[0]
+
+    # A short edit history for the revision endpoints
+    MedicalRecordRevision.objects.bulk_create([
+        MedicalRecordRevision(record=record, number=number, edited_by=vet, changes=changes)
+        for number, changes in enumerate([
+            {'diagnosis': 'Suspected otitis', 'notes': ''},
+            {'treatment': 'Ear drops', 'prescription': ''},
+            {'notes': 'Recheck in two weeks'},
+        ], start=1)
+    ])
+    MedicalRecord.objects.filter(pk=record.pk).update(revision_count=3)
+
+    upload = TestResultUpload.objects.create(record=record, uploaded_by=vet, filename='bloods.pdf', size=2 * 65536)
+    vaccination = Vaccination.objects.bulk_create([
+        Vaccination(pet=pet, veterinarian=vet, vaccine='Rabies', dose=1,
+                    administered_at=timezone.now() - timedelta(days=350), next_due=today + timedelta(days=15))
+    ])[0]
+
+    notification = Notification.objects.bulk_create([
+        Notification(recipient=client, sender=vet, notification_type='appointment',
+                     title='Appointment confirmed', message='Your appointment is confirmed.')
+    ])[0]
+
+    schedule = VetSchedule.objects.get(veterinarian=vet)
+    exception = ScheduleException.objects.bulk_create([
+        ScheduleException(schedule=schedule, date=today + timedelta(days=7), start_time=time(12),
+                          end_time=time(13), is_available=False, reason='Training')
+    ])[0]
+    return {
+        'vet': vet,
+        'vet_profile': vet_profile,
+        'client': client,
+        'client_profile': ClientProfile.objects.get(user=client),
+        'pet': pet,
+        'pending': pending,
+        'confirmed': confirmed,
+        'completed': completed,
+        'consultation': consultation,
+        'record': record,
+        'upload': upload,
+        'vaccination': vaccination,
+        'notification': notification,
+        'weekly_hours': schedule.weekly_hours.order_by('pk').first(),
+        'schedule': schedule,
+        'exception': exception,
+    }
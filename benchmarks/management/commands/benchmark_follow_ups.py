@@ -0,0 +1,106 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import CustomUser
+from medical_records.models import MedicalRecord
+from medical_records.views import FollowUpRequiredView
+
+INDEXES = ['medrec_followup_vet_idx', 'medrec_followup_pet_idx']
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the first page of the pending follow-ups list for a sample of vets and clients, "
+        "with and without the partial follow-up indexes, and show both query plans. "
+        "Run it against a seeded database (e.g. seed_vetcare --appointments 1230000 for about "
+        "1M medical records), never production: the indexes are dropped for the comparison "
+        "and rebuilt afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=20, help="Vets and clients timed per role")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per user")
+
+    def handle(self, *args, **options):
+        if options['sample'] < 1 or options['repeat'] < 1:
+            raise CommandError("--sample and --repeat must be positive.")
+        records = MedicalRecord.objects.count()
+        if not records:
+            raise CommandError("No medical records; seed the database first (seed_vetcare).")
+        self.stdout.write(f"{records:,} medical records, {options['sample']} users per role, {options['repeat']} runs each")
+
+        # Busiest vets and clients with pending follow-ups: the cases the indexes are for
+        users = {
+            'VETERINARIAN': self.sample('veterinarian', options['sample']),
+            'CLIENT': self.sample('pet__owner', options['sample']),
+        }
+
+        results = {'with indexes': self.measure(users, options['repeat'])}
+        indexes = [index for index in MedicalRecord._meta.indexes if index.name in INDEXES]
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.remove_index(MedicalRecord, index)
+        try:
+            results['without indexes'] = self.measure(users, options['repeat'])
+        finally:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(MedicalRecord, index)
+
+        for label in ('without indexes', 'with indexes'):
+            by_role = results[label]
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+            for role, (timings, plan) in by_role.items():
+                self.stdout.write(
+                    f"  {role.lower():<13} median {statistics.median(timings):8.2f} ms   "
+                    f"max {max(timings):8.2f} ms"
+                )
+                for line in plan.splitlines():
+                    self.stdout.write(f"      {line}")
+
+        self.stdout.write("")
+        for role in users:
+            before = statistics.median(results['without indexes'][role][0])
+            after = statistics.median(results['with indexes'][role][0])
+            self.stdout.write(self.style.SUCCESS(f"{role.lower()}: {before / after:.1f}x faster with the indexes"))
+
+    def sample(self, path, size):
+        """The users with the most pending follow-ups along `path`"""
+        ids = (
+            MedicalRecord.objects.filter(follow_up_required=True, follow_up_date__gte=timezone.now().date())
+            .order_by().values_list(path).annotate(total=Count('pk')).order_by('-total')
+            .values_list(path, flat=True)[:size]
+        )
+        return list(CustomUser.objects.filter(pk__in=list(ids)))
+
+    def measure(self, users, repeat):
+        """(per-run timings in ms, query plan of the last user) per role"""
+        factory = APIRequestFactory()
+        measured = {}
+        for role, sample in users.items():
+            timings, plan = [], ''
+            for user in sample:
+                view = FollowUpRequiredView()
+                view.request = Request(factory.get('/'))
+                view.request.user = user
+                view.format_kwarg = None
+                queryset = view.get_queryset()
+                paginator = view.paginator
+
+                # First run warms the page cache and is not counted
+                for run in range(repeat + 1):
+                    started = time.perf_counter()
+                    paginator.paginate_queryset(queryset, view.request, view)
+                    if run:
+                        timings.append((time.perf_counter() - started) * 1000)
+                ordered = queryset.order_by(*[key.order_by() for key in paginator.keys])
+                plan = ordered[:paginator.page_size + 1].explain()
+            measured[role] = (timings or [0.0], plan)
+        return measured
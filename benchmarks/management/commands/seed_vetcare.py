@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import CustomUser
+from benchmarks.seeding import DEFAULT_BATCH_SIZE, Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic users, pets, appointments, consultations, medical records "
+        "and notifications for load testing. Rows are bulk inserted without model "
+        "validation; the same --seed always produces the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Random seed (default 0)")
+        parser.add_argument('--vets', type=int, default=200)
+        parser.add_argument('--clients', type=int, default=100000)
+        parser.add_argument('--appointments', type=int, default=1000000)
+        parser.add_argument('--notifications-per-user', type=int, default=10,
+                            help="Mean notifications per user (exponentially distributed)")
+        parser.add_argument('--history-days', type=int, default=3 * 365,
+                            help="How far back appointment history goes")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per INSERT")
+        parser.add_argument('--prefix', default='seed',
+                            help="Namespace for generated emails and license numbers")
+
+    def handle(self, *args, **options):
+        if options['vets'] < 1 or options['clients'] < 1:
+            raise CommandError("At least one vet and one client are required.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+        if CustomUser.objects.filter(email__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(
+                f"Data with prefix '{options['prefix']}' already exists; pass a different --prefix."
+            )
+
+        seeder = Seeder(
+            seed=options['seed'],
+            vets=options['vets'],
+            clients=options['clients'],
+            appointments=options['appointments'],
+            notifications_per_user=options['notifications_per_user'],
+            history_days=options['history_days'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            stdout=self.stdout,
+        )
+
+        started = time.perf_counter()
+        counts = seeder.run()
+        elapsed = time.perf_counter() - started
+
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {total:,} rows in {elapsed:.1f}s. Users log in with password '{options['prefix']}-password'."
+        ))
@@ -0,0 +1,442 @@
+"""
+Synthetic data generator for load tests and benchmarks.
+
+Rows are produced lazily and written with chunked bulk_create, so neither
+Model.save() (and its full_clean() validation queries) nor signals run, and
+memory stays flat however many rows are generated. Only primary keys and
+sampling weights are kept between stages. The generator keeps the data
+consistent itself: pets belong to the client booking them, consultations and
+records only exist for completed appointments, confirmed and completed
+appointments take free slots within their vet's working hours (no
+double-booking), microchips are unique, etc.
+
+All randomness comes from one random.Random(seed), so the same seed and
+counts always produce the same rows (dates are relative to today).
+"""
+import random
+import time as clock
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate, groupby, islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import CustomUser, ClientProfile, Vetprofile
+from appointments.models import Appointment, Consultation, VetSchedule, WeeklyAvailability
+from medical_records import anomalies, search
+from medical_records.models import MedicalRecord, Vaccination, VaccineSchedule
+from notifications.models import Notification, NotificationCounter
+from pets.models import CareRelationship, PetProfile
+
+
+DEFAULT_BATCH_SIZE = 2000
+
+# Every seeded vet works these hours on the days they work, in default-length slots
+WORKING_HOURS = (9, 17)
+SLOT_MINUTES = VetSchedule.DEFAULT_SLOT_MINUTES
+SLOTS_PER_DAY = (WORKING_HOURS[1] - WORKING_HOURS[0]) * 60 // SLOT_MINUTES
+
+SPECIALIZATIONS = ['General Practice', 'Surgery', 'Dentistry', 'Internal Medicine', 'Dermatology', 'Exotics']
+
+# (species, weight) - dogs and cats dominate real caseloads
+SPECIES = [
+    (PetProfile.DOG, 45), (PetProfile.CAT, 35), (PetProfile.RABBIT, 6), (PetProfile.BIRD, 5),
+    (PetProfile.GUINEA_PIG, 3), (PetProfile.HAMSTER, 2), (PetProfile.REPTILE, 2), (PetProfile.FISH, 1),
+    (PetProfile.OTHER, 1),
+]
+
+# Typical adult weight range in kg per species
+WEIGHT_RANGES = {
+    PetProfile.DOG: (3, 45), PetProfile.CAT: (2.5, 7), PetProfile.RABBIT: (1, 5),
+    PetProfile.BIRD: (0.05, 1.5), PetProfile.GUINEA_PIG: (0.7, 1.2), PetProfile.HAMSTER: (0.1, 0.2),
+    PetProfile.REPTILE: (0.1, 10), PetProfile.FISH: (0.01, 0.5), PetProfile.OTHER: (0.1, 10),
+}
+
+DIAGNOSES = [
+    'Otitis externa', 'Gastroenteritis', 'Atopic dermatitis', 'Periodontal disease', 'Osteoarthritis',
+    'Upper respiratory infection', 'Urinary tract infection', 'Obesity', 'Conjunctivitis', 'Healthy',
+]
+SYMPTOMS = ['Lethargy', 'Vomiting', 'Scratching', 'Limping', 'Coughing', 'Loss of appetite', 'Sneezing']
+TREATMENTS = ['Supportive care', 'Antibiotic course', 'Topical ointment', 'Dietary change', 'Pain management']
+PRESCRIPTIONS = ['', 'Amoxicillin 250mg', 'Meloxicam 1.5mg/ml', 'Apoquel 16mg', 'Metronidazole 250mg']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn']
+LAST_NAMES = ['Smith', 'Okafor', 'Garcia', 'Chen', 'Novak', 'Adeyemi', 'Silva', 'Khan', 'Muller', 'Ito']
+PET_NAMES = ['Bella', 'Max', 'Luna', 'Charlie', 'Milo', 'Coco', 'Rocky', 'Daisy', 'Oliver', 'Nala']
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items from `iterable`"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class WeightedSampler:
+    """Draw indexes in proportion to fixed weights in O(log n), using one shared Random"""
+
+    def __init__(self, rng, weights):
+        self.rng = rng
+        self.cumulative = list(accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def __call__(self):
+        return bisect_left(self.cumulative, self.rng.random() * self.total)
+
+
+class Seeder:
+    """
+    Generate a consistent VetCare dataset.
+
+    Vet load follows a Zipf-like curve (a few vets see most patients) and pet
+    activity is Pareto-distributed, so some pets build up long histories.
+    `prefix` namespaces emails and license numbers so several seeded
+    datasets can share one database. `weekend_hours` is the chance a vet
+    also works any given weekend day.
+    """
+
+    def __init__(self, seed=0, vets=50, clients=5000, appointments=50000, notifications_per_user=10,
+                 history_days=3 * 365, weekend_hours=0.3, batch_size=DEFAULT_BATCH_SIZE, prefix='seed', stdout=None):
+        self.rng = random.Random(seed)
+        # Separate stream for rows derived from appointments, so output does not depend on batch size
+        self.detail_rng = random.Random(f'{seed}-details')
+        self.vaccination_rng = random.Random(f'{seed}-vaccinations')
+        self.vets = vets
+        self.clients = clients
+        self.appointments = appointments
+        self.notifications_per_user = notifications_per_user
+        self.history_days = history_days
+        self.weekend_hours = weekend_hours
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.stdout = stdout
+        self.today = timezone.now().date()
+        self.counts = {}
+
+        self.vet_ids = []
+        self.vet_weekdays = []
+        self.vet_profile_ids = []
+        self.client_ids = []
+        self.pet_ids = []
+        self.pet_owner_ids = []
+
+    def run(self):
+        """Generate every table in dependency order and return the row counts"""
+        self.password = make_password(f'{self.prefix}-password')
+        self.seed_vets()
+        self.seed_clients()
+        self.seed_pets()
+        self.seed_appointments()
+        self.seed_vaccinations()
+        self.seed_notifications()
+        self.rebuild_derived()
+        return self.counts
+
+    def rebuild_derived(self):
+        """bulk_create skips the save() hooks, so rebuild the tables they maintain in one pass each"""
+        self.seed_care_relationships()
+        self.seed_search_index()
+        self.seed_anomaly_scores()
+        self.seed_notification_counters()
+
+    def insert(self, model, rows):
+        """bulk_create `rows` in batches, returning the saved objects' primary keys"""
+        started = clock.perf_counter()
+        pks = []
+        for batch in batched(rows, self.batch_size):
+            with transaction.atomic():
+                created = model.objects.bulk_create(batch, batch_size=self.batch_size)
+            pks.extend(obj.pk for obj in created)
+        self.count(model, len(pks), clock.perf_counter() - started)
+        return pks
+
+    def count(self, model, rows, elapsed):
+        name = model.__name__
+        self.counts[name] = self.counts.get(name, 0) + rows
+        if self.stdout and rows:
+            self.stdout.write(f"  {name}: {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-6):,.0f}/s)")
+
+    # Users
+
+    def user(self, role, index):
+        rng = self.rng
+        kind = 'vet' if role == CustomUser.VETERINARIAN else 'client'
+        return CustomUser(
+            email=f'{self.prefix}-{kind}{index}@vetcare.test', password=self.password, role=role,
+            first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+            phone=f'+1555{rng.randrange(10 ** 7):07d}',
+        )
+
+    def seed_vets(self):
+        rng = self.rng
+        self.vet_ids = self.insert(
+            CustomUser, (self.user(CustomUser.VETERINARIAN, i) for i in range(self.vets))
+        )
+        self.vet_profile_ids = self.insert(Vetprofile, (
+            Vetprofile(user_id=vet_id, specialization=rng.choice(SPECIALIZATIONS),
+                       license_number=f'{self.prefix.upper()}-{i:07d}', years_of_experience=rng.randint(1, 35),
+                       is_available=rng.random() < 0.95)
+            for i, vet_id in enumerate(self.vet_ids)
+        ))
+        schedule_ids = self.insert(VetSchedule, (VetSchedule(veterinarian_id=vet_id) for vet_id in self.vet_ids))
+        self.vet_weekdays = [
+            [weekday for weekday in range(7) if weekday < 5 or rng.random() < self.weekend_hours]
+            for _ in self.vet_ids
+        ]
+        start, end = (time(hour) for hour in WORKING_HOURS)
+        self.insert(WeeklyAvailability, (
+            WeeklyAvailability(schedule_id=schedule_id, weekday=weekday, start_time=start, end_time=end)
+            for schedule_id, weekdays in zip(schedule_ids, self.vet_weekdays) for weekday in weekdays
+        ))
+
+    def seed_clients(self):
+        self.client_ids = self.insert(
+            CustomUser, (self.user(CustomUser.CLIENT, i) for i in range(self.clients))
+        )
+        self.insert(ClientProfile, (
+            ClientProfile(user_id=client_id, address=f'{self.rng.randint(1, 999)} Main Street')
+            for client_id in self.client_ids
+        ))
+
+    # Pets
+
+    def pet_count(self):
+        """Pets per client: mostly one, a long tail of multi-pet households"""
+        return min(1 + int(self.rng.expovariate(1.2)), 8)
+
+    def pets(self):
+        rng = self.rng
+        species = [name for name, _ in SPECIES]
+        species_weights = [weight for _, weight in SPECIES]
+        serial = 0
+        for client_id in self.client_ids:
+            for _ in range(self.pet_count()):
+                kind = rng.choices(species, species_weights)[0]
+                low, high = WEIGHT_RANGES[kind]
+                serial += 1
+                yield PetProfile(
+                    owner_id=client_id, name=rng.choice(PET_NAMES), species=kind,
+                    gender=rng.choice([PetProfile.MALE, PetProfile.FEMALE]), age=rng.randint(1, 16),
+                    weight=Decimal(str(round(rng.uniform(low, high), 2))),
+                    microchip_number=f'{self.prefix.upper()}{serial:012d}' if rng.random() < 0.6 else None,
+                )
+
+    def seed_pets(self):
+        self.pet_owner_ids = []
+        weights = []
+
+        def remember(pets):
+            for pet in pets:
+                self.pet_owner_ids.append(pet.owner_id)
+                weights.append(float(pet.weight))
+                yield pet
+
+        self.pet_ids = self.insert(PetProfile, remember(self.pets()))
+        self.pet_weights = dict(zip(self.pet_ids, weights))
+
+    # Appointments, consultations and records
+
+    def seed_appointments(self):
+        """
+        Appointments are written in batches; each batch's consultations and
+        medical records are generated right after, from the saved rows.
+        """
+        rng = self.rng
+        if not self.pet_ids or not self.vet_ids:
+            return
+        pick_vet = WeightedSampler(rng, [1 / (rank + 1) ** 0.8 for rank in range(len(self.vet_ids))])
+        pick_pet = WeightedSampler(rng, [rng.paretovariate(1.16) for _ in self.pet_ids])
+
+        # Slot indexes taken per (vet index, day)
+        self.booked = defaultdict(set)
+        started = clock.perf_counter()
+        totals = {Appointment: 0, Consultation: 0, MedicalRecord: 0}
+        for batch in batched((self.appointment(pick_vet(), pick_pet()) for _ in range(self.appointments)),
+                             self.batch_size):
+            with transaction.atomic():
+                appointments = Appointment.objects.bulk_create(batch)
+                consultations, records = [], []
+                for appointment in appointments:
+                    if appointment.status != Appointment.COMPLETED:
+                        continue
+                    if self.detail_rng.random() < 0.7:
+                        consultations.append(self.consultation(appointment))
+                    records.append(self.medical_record(appointment))
+                Consultation.objects.bulk_create(consultations)
+                MedicalRecord.objects.bulk_create(records)
+            totals[Appointment] += len(appointments)
+            totals[Consultation] += len(consultations)
+            totals[MedicalRecord] += len(records)
+
+        elapsed = clock.perf_counter() - started
+        for model, rows in totals.items():
+            self.count(model, rows, elapsed)
+
+    def appointment(self, vet_index, pet_index):
+        rng = self.rng
+        offset = rng.randint(-self.history_days, 30)
+        if offset < 0:
+            status = rng.choices([Appointment.COMPLETED, Appointment.CANCELLED], [85, 15])[0]
+        else:
+            status = rng.choices([Appointment.PENDING, Appointment.CONFIRMED, Appointment.CANCELLED], [35, 55, 10])[0]
+        day = self.today + timedelta(days=offset)
+        slot = None
+        if status in Appointment.BOOKED_STATUSES:
+            booking = self.book_slot(vet_index, day, step=-1 if offset < 0 else 1)
+            if booking:
+                vet_index, day, slot = booking
+            else:
+                # Nowhere to fit it: a request nobody confirmed, or a visit that never happened
+                status = Appointment.CANCELLED if offset < 0 else Appointment.PENDING
+        if status == Appointment.CANCELLED:
+            # The slot it once had has been released
+            slot = self.slot_time(rng.randrange(SLOTS_PER_DAY))
+        return Appointment(
+            client_id=self.pet_owner_ids[pet_index], veterinarian_id=self.vet_ids[vet_index],
+            pet_id=self.pet_ids[pet_index], date=day, time=slot,
+            reason=rng.choice(SYMPTOMS), status=status,
+        )
+
+    def book_slot(self, vet_index, day, step):
+        """
+        (vet index, day, time) of a free slot for a booking drawn for `vet_index` on `day`.
+        A full diary moves it to the vet's next working days in `step` direction, up to a
+        week, then refers it to the following vets on the same day. None if all are full.
+        """
+        for attempt in range(len(self.vet_ids)):
+            index = (vet_index + attempt) % len(self.vet_ids)
+            weekdays = self.vet_weekdays[index]
+            candidate = day
+            for _ in range(7 if not attempt else 1):
+                while candidate.weekday() not in weekdays:
+                    candidate += timedelta(days=step)
+                taken = self.booked[index, candidate]
+                if len(taken) < SLOTS_PER_DAY:
+                    slot = self.rng.choice([i for i in range(SLOTS_PER_DAY) if i not in taken])
+                    taken.add(slot)
+                    return index, candidate, self.slot_time(slot)
+                candidate += timedelta(days=step)
+        return None
+
+    def slot_time(self, index):
+        minutes = WORKING_HOURS[0] * 60 + index * SLOT_MINUTES
+        return time(minutes // 60, minutes % 60)
+
+    def consultation(self, appointment):
+        rng = self.detail_rng
+        return Consultation(
+            appointment=appointment, veterinarian_id=appointment.veterinarian_id,
+            diagnosis=rng.choice(DIAGNOSES), symptoms=rng.choice(SYMPTOMS),
+            notes='Examined remotely', prescription=rng.choice(PRESCRIPTIONS),
+        )
+
+    def medical_record(self, appointment):
+        rng = self.detail_rng
+        follow_up = rng.random() < 0.15
+        visited = datetime.combine(appointment.date, appointment.time or time(12))
+        return MedicalRecord(
+            pet_id=appointment.pet_id, appointment=appointment, veterinarian_id=appointment.veterinarian_id,
+            visit_date=timezone.make_aware(visited), diagnosis=rng.choice(DIAGNOSES),
+            symptoms=rng.choice(SYMPTOMS), treatment=rng.choice(TREATMENTS),
+            prescription=rng.choice(PRESCRIPTIONS),
+            follow_up_required=follow_up,
+            follow_up_date=appointment.date + timedelta(days=rng.randint(7, 60)) if follow_up else None,
+            # Visit weights scatter around the pet's own weight
+            weight=Decimal(str(round(self.pet_weights[appointment.pet_id] * rng.gauss(1, 0.03), 2))),
+            temperature=Decimal(rng.randint(375, 395)) / 10,
+        )
+
+    # Vaccinations
+
+    def seed_vaccinations(self):
+        """
+        Some completed visits of species with a vaccine schedule include the
+        next dose of one of their vaccines. As Vaccination.save() would, only
+        each pet's latest dose of a vaccine gets a next_due date.
+        """
+        intervals = {}
+        for species, vaccine, dose, days in VaccineSchedule.objects.values_list(
+                'species', 'vaccine', 'dose', 'interval_days').order_by('dose'):
+            intervals.setdefault(species, {}).setdefault(vaccine, []).append((dose, days))
+        if not intervals:
+            return
+        visits = (
+            Appointment.objects.filter(status=Appointment.COMPLETED, pet__species__in=list(intervals))
+            .order_by('pet_id', 'date', 'pk')
+            .values_list('pet_id', 'veterinarian_id', 'date', 'pet__species')
+        )
+        self.insert(Vaccination, (
+            vaccination
+            for _, pet_visits in groupby(visits.iterator(chunk_size=self.batch_size), key=lambda visit: visit[0])
+            for vaccination in self.vaccinations(list(pet_visits), intervals)
+        ))
+
+    def vaccinations(self, visits, intervals):
+        """One pet's doses, given (pet, vet, date, species) visits in date order"""
+        rng = self.vaccination_rng
+        latest = {}
+        doses = []
+        species = visits[0][3]
+        for pet_id, vet_id, day, _ in visits:
+            if rng.random() >= 0.3:
+                continue
+            vaccine = rng.choice(sorted(intervals[species]))
+            dose = latest[vaccine].dose + 1 if vaccine in latest else 1
+            latest[vaccine] = Vaccination(
+                pet_id=pet_id, veterinarian_id=vet_id, vaccine=vaccine, dose=dose,
+                batch_number=f'LOT{rng.randrange(10 ** 6):06d}',
+                administered_at=timezone.make_aware(datetime.combine(day, time(12))),
+            )
+            doses.append(latest[vaccine])
+        for vaccine, last in latest.items():
+            # The interval of the highest listed dose up to this one
+            steps = [days for dose, days in intervals[species][vaccine] if dose <= last.dose]
+            if steps and steps[-1] is not None:
+                last.next_due = last.administered_at.date() + timedelta(days=steps[-1])
+        return doses
+
+    def seed_care_relationships(self):
+        started = clock.perf_counter()
+        pairs = CareRelationship.rebuild(batch_size=self.batch_size)
+        self.count(CareRelationship, pairs, clock.perf_counter() - started)
+
+    def seed_notification_counters(self):
+        started = clock.perf_counter()
+        users = NotificationCounter.rebuild(batch_size=self.batch_size)
+        self.count(NotificationCounter, users, clock.perf_counter() - started)
+
+    def seed_search_index(self):
+        started = clock.perf_counter()
+        search.rebuild()
+        if self.stdout:
+            self.stdout.write(f"  Search index rebuilt in {clock.perf_counter() - started:.1f}s")
+
+    def seed_anomaly_scores(self):
+        started = clock.perf_counter()
+        scored, flagged = anomalies.run(full=True, batch_size=self.batch_size)
+        if self.stdout:
+            self.stdout.write(
+                f"  Scored {scored} records for vitals anomalies ({flagged} flagged) in {clock.perf_counter() - started:.1f}s"
+            )
+
+    # Notifications
+
+    def seed_notifications(self):
+        rng = self.rng
+        if not self.notifications_per_user or not self.vet_ids:
+            return
+        kinds = [kind for kind, _ in Notification.NOTIFICATION_TYPES]
+        recipients = self.vet_ids + self.client_ids
+        self.insert(Notification, (
+            Notification(
+                recipient_id=recipient, sender_id=rng.choice(self.vet_ids),
+                notification_type=rng.choices(kinds, [50, 25, 15, 5, 5, 5])[0],
+                title='Appointment update', message='Your appointment status changed.',
+                read=rng.random() < 0.7,
+            )
+            for recipient in recipients
+            for _ in range(int(rng.expovariate(1 / self.notifications_per_user)))
+        ))
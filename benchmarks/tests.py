@@ -0,0 +1,420 @@
+"""
+Endpoint benchmarks.
+
+Every URL in the API apps is called through the DRF test client against the
+seeded fixture, recording SQL query count, SQL time, wall time and response
+size. Results are compared with ``benchmarks/baseline.json``; any regression
+past the allowed margin fails the run.
+
+Environment variables:
+    BENCHMARK_SCALE              fixture size multiplier (default 1)
+    BENCHMARK_REPEATS            timed runs per endpoint, best one kept (default 3)
+    BENCHMARK_TIME_TOLERANCE     allowed slowdown factor for timings (default 3)
+    BENCHMARK_UPDATE_BASELINE=1  write the measured numbers as the new baseline
+    BENCHMARK_ACCEPT_QUERIES     comma separated labels whose query count may
+                                 rise in that update; any other rise refuses
+                                 to write, so each one is a deliberate choice
+    BENCHMARK_OUTPUT=<path>      also write the measured numbers to <path>
+
+Requests run inside a rolled-back transaction; the on_commit callbacks they
+register (notification fan-out, stream wake-ups) are run and measured as
+part of the request, as they would be when a real request commits.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from appointments.models import Appointment, WeeklyAvailability
+from medical_records.models import MedicalRecord
+from Vetcare.downloads import file_signature
+from pets import thumbnails
+from pets.models import PetProfile
+from .fixtures import PASSWORD, build_fixture
+from .seeding import WORKING_HOURS, Seeder
+
+
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+
+SCALE = int(os.environ.get('BENCHMARK_SCALE', 1))
+REPEATS = int(os.environ.get('BENCHMARK_REPEATS', 3))
+TIME_TOLERANCE = float(os.environ.get('BENCHMARK_TIME_TOLERANCE', 3))
+
+# Absolute slack so sub-millisecond timings do not fail on noise
+SQL_SLACK_MS = 2
+WALL_SLACK_MS = 25
+BYTES_TOLERANCE = 1.10
+BYTES_SLACK = 512
+
+# URL modules whose every route must be benchmarked
+URL_MODULES = ['accounts.urls', 'appointments.urls', 'medical_records.urls', 'pets.urls', 'notifications.urls']
+
+
+def endpoint(label, name, method, user, kwargs=None, data=None, query=None, headers=None):
+    """
+    Describe one benchmarked request. `kwargs`, `data`, `query` and
+    `headers` are callables taking the fixture dict, so ids are resolved
+    after seeding. `data` returning bytes is sent as a raw request body.
+    """
+    return {
+        'label': label, 'name': name, 'method': method, 'user': user,
+        'kwargs': kwargs, 'data': data, 'query': query, 'headers': headers,
+    }
+
+
+def _days(n):
+    return (timezone.now().date() + timedelta(days=n)).isoformat()
+
+
+UPLOAD_CHUNK = bytes(range(256)) * 256
+
+# Served by the download endpoints; only its size matters
+STORED_FILE = bytes(range(256)) * 1024
+
+
+def pet_photo():
+    """A photo-sized JPEG for the thumbnail pipeline"""
+    buffer = io.BytesIO()
+    Image.linear_gradient('L').resize((1600, 1200)).convert('RGB').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+ENDPOINTS = [
+    # accounts
+    endpoint('register', 'accounts:register', 'post', None, data=lambda f: {
+        'email': 'new.client@bench.vetcare', 'password': PASSWORD, 'password_confirm': PASSWORD,
+        'first_name': 'New', 'last_name': 'Client', 'role': 'CLIENT',
+    }),
+    endpoint('login', 'accounts:login', 'post', None,
+             data=lambda f: {'email': f['client'].email, 'password': PASSWORD}),
+    endpoint('logout', 'accounts:logout', 'post', 'client', data=lambda f: {'refresh': f['refresh']}),
+    endpoint('token-refresh', 'accounts:token-refresh', 'post', None, data=lambda f: {'refresh': f['refresh']}),
+    endpoint('current-user', 'accounts:current-user', 'get', 'client'),
+    endpoint('client-list', 'accounts:client-list', 'get', 'vet'),
+    endpoint('client-detail', 'accounts:client-detail', 'get', 'client',
+             kwargs=lambda f: {'pk': f['client_profile'].pk}),
+    endpoint('my-client-profile', 'accounts:my-client-profile', 'get', 'client'),
+    endpoint('vet-list', 'accounts:vet-list', 'get', 'client'),
+    endpoint('vet-detail', 'accounts:vet-detail', 'get', 'client', kwargs=lambda f: {'pk': f['vet_profile'].pk}),
+    endpoint('vet-update', 'accounts:vet-update', 'patch', 'vet',
+             kwargs=lambda f: {'pk': f['vet_profile'].pk}, data=lambda f: {'bio': 'Updated biography'}),
+    endpoint('my-vet-profile', 'accounts:my-vet-profile', 'get', 'vet'),
+    endpoint('user-list', 'accounts:user-list', 'get', 'vet'),
+    endpoint('user-detail', 'accounts:user-detail', 'get', 'client', kwargs=lambda f: {'pk': f['client'].pk}),
+
+    # appointments
+    endpoint('appointment-list.vet', 'appointments:appointment-list', 'get', 'vet'),
+    endpoint('appointment-list.client', 'appointments:appointment-list', 'get', 'client'),
+    endpoint('appointment-create', 'appointments:appointment-create', 'post', 'client', data=lambda f: {
+        'veterinarian': f['vet_profile'].pk, 'pet': f['pet'].pk, 'date': _days(2), 'reason': 'Checkup',
+    }),
+    endpoint('appointment-detail', 'appointments:appointment-detail', 'get', 'client',
+             kwargs=lambda f: {'pk': f['pending'][0].pk}),
+    endpoint('appointment-update', 'appointments:appointment-update', 'patch', 'vet',
+             kwargs=lambda f: {'pk': f['pending'][0].pk}, data=lambda f: {'notes': 'Bring previous records'}),
+    endpoint('appointment-confirm', 'appointments:appointment-confirm', 'patch', 'vet',
+             kwargs=lambda f: {'pk': f['pending'][0].pk}, data=lambda f: {'time': '06:00'}),
+    endpoint('appointment-complete', 'appointments:appointment-complete', 'patch', 'vet',
+             kwargs=lambda f: {'pk': f['confirmed'].pk}),
+    endpoint('appointment-cancel', 'appointments:appointment-cancel', 'patch', 'client',
+             kwargs=lambda f: {'pk': f['pending'][1].pk}),
+    endpoint('appointment-bulk', 'appointments:appointment-bulk', 'post', 'vet', data=lambda f: {
+        'ids': [a.pk for a in f['pending'][2:]], 'status': 'confirmed',
+    }),
+    endpoint('appointment-pending', 'appointments:appointment-pending', 'get', 'vet'),
+    endpoint('appointment-upcoming', 'appointments:appointment-upcoming', 'get', 'vet'),
+    endpoint('consultation-list', 'appointments:consultation-list', 'get', 'vet'),
+    endpoint('consultation-create', 'appointments:consultation-create', 'post', 'vet', data=lambda f: {
+        'appointment_id': f['completed'].pk, 'diagnosis': 'Healthy', 'notes': 'No concerns',
+    }),
+    endpoint('consultation-detail', 'appointments:consultation-detail', 'get', 'client',
+             kwargs=lambda f: {'pk': f['consultation'].pk}),
+    endpoint('client-consultation-history', 'appointments:client-consultation-history', 'get', 'client'),
+    endpoint('vet-consultation-history', 'appointments:vet-consultation-history', 'get', 'vet'),
+    endpoint('my-schedule', 'appointments:my-schedule', 'get', 'vet'),
+    endpoint('schedule-hours', 'appointments:schedule-hours', 'get', 'vet'),
+    endpoint('schedule-hours-detail', 'appointments:schedule-hours-detail', 'get', 'vet',
+             kwargs=lambda f: {'pk': f['weekly_hours'].pk}),
+    endpoint('schedule-exceptions', 'appointments:schedule-exceptions', 'get', 'vet'),
+    endpoint('schedule-exception-detail', 'appointments:schedule-exception-detail', 'get', 'vet',
+             kwargs=lambda f: {'pk': f['exception'].pk}),
+    endpoint('vet-available-slots', 'appointments:vet-available-slots', 'get', 'client',
+             kwargs=lambda f: {'pk': f['vet_profile'].pk}, query=lambda f: {'start': _days(1), 'end': _days(14)}),
+
+    # medical records
+    endpoint('medical-record-list.vet', 'medical_records:medical-record-list', 'get', 'vet'),
+    endpoint('medical-record-list.client', 'medical_records:medical-record-list', 'get', 'client'),
+    endpoint('medical-record-create', 'medical_records:medical-record-create', 'post', 'vet', data=lambda f: {
+        'pet': f['pet'].pk, 'diagnosis': 'Healthy', 'treatment': 'None required',
+    }),
+    endpoint('medical-record-detail', 'medical_records:medical-record-detail', 'get', 'client',
+             kwargs=lambda f: {'pk': f['record'].pk}),
+    endpoint('medical-record-revisions', 'medical_records:medical-record-revisions', 'get', 'client',
+             kwargs=lambda f: {'pk': f['record'].pk}),
+    endpoint('medical-record-version', 'medical_records:medical-record-version', 'get', 'client',
+             kwargs=lambda f: {'pk': f['record'].pk, 'version': 1}),
+    endpoint('pet-medical-history', 'medical_records:pet-medical-history', 'get', 'client',
+             kwargs=lambda f: {'pet_id': f['pet'].pk}),
+    endpoint('pet-medical-history.csv.gz', 'medical_records:pet-medical-history', 'get', 'client',
+             kwargs=lambda f: {'pet_id': f['pet'].pk}, query=lambda f: {'export': 'csv', 'gzip': '1'}),
+    endpoint('pet-vitals', 'medical_records:pet-vitals', 'get', 'client',
+             kwargs=lambda f: {'pet_id': f['pet'].pk}, query=lambda f: {'points': 100}),
+    endpoint('pet-vitals.month', 'medical_records:pet-vitals', 'get', 'client',
+             kwargs=lambda f: {'pet_id': f['pet'].pk}, query=lambda f: {'bucket': 'month'}),
+    endpoint('my-pets-records', 'medical_records:my-pets-records', 'get', 'client'),
+    endpoint('my-pets-records.ndjson', 'medical_records:my-pets-records', 'get', 'client',
+             query=lambda f: {'export': 'ndjson'}),
+    endpoint('recent-records', 'medical_records:recent-records', 'get', 'vet'),
+    endpoint('follow-up-required', 'medical_records:follow-up-required', 'get', 'vet'),
+    endpoint('flagged-records', 'medical_records:flagged-records', 'get', 'vet'),
+    endpoint('medical-search', 'medical_records:medical-search', 'get', 'vet', query=lambda f: {'q': 'otitis'}),
+    endpoint('medical-record-test-results', 'medical_records:medical-record-test-results', 'get', 'client',
+             kwargs=lambda f: {'pk': f['record'].pk}),
+    endpoint('medical-record-test-results.range', 'medical_records:medical-record-test-results', 'get', 'client',
+             kwargs=lambda f: {'pk': f['record'].pk}, headers=lambda f: {'HTTP_RANGE': 'bytes=65536-131071'}),
+    endpoint('test-result-upload-create', 'medical_records:test-result-upload-create', 'post', 'vet',
+             kwargs=lambda f: {'pk': f['record'].pk}, data=lambda f: {'filename': 'xray.pdf', 'size': 1 << 20}),
+    endpoint('test-result-upload', 'medical_records:test-result-upload', 'get', 'vet',
+             kwargs=lambda f: {'upload_id': f['upload'].pk}),
+    endpoint('test-result-upload.chunk', 'medical_records:test-result-upload', 'patch', 'vet',
+             kwargs=lambda f: {'upload_id': f['upload'].pk}, data=lambda f: UPLOAD_CHUNK, headers=lambda f: {
+                 'HTTP_UPLOAD_OFFSET': '0', 'HTTP_UPLOAD_CHECKSUM': f'sha256 {hashlib.sha256(UPLOAD_CHUNK).hexdigest()}',
+             }),
+    endpoint('vaccination-list.vet', 'medical_records:vaccination-list', 'get', 'vet'),
+    endpoint('vaccination-list.client', 'medical_records:vaccination-list', 'get', 'client'),
+    endpoint('vaccination-create', 'medical_records:vaccination-create', 'post', 'vet', data=lambda f: {
+        'pet': f['pet'].pk, 'vaccine': 'Rabies', 'dose': 2,
+    }),
+    endpoint('vaccination-detail', 'medical_records:vaccination-detail', 'get', 'client',
+             kwargs=lambda f: {'pk': f['vaccination'].pk}),
+    endpoint('vaccinations-due.vet', 'medical_records:vaccinations-due', 'get', 'vet', query=lambda f: {'days': 60}),
+    endpoint('vaccinations-due.client', 'medical_records:vaccinations-due', 'get', 'client',
+             query=lambda f: {'days': 60, 'overdue': 'true'}),
+    endpoint('pet-vaccinations', 'medical_records:pet-vaccinations', 'get', 'client',
+             kwargs=lambda f: {'pet_id': f['pet'].pk}),
+
+    # pets
+    endpoint('pet-list.vet', 'pets:pet-list', 'get', 'vet'),
+    endpoint('pet-list.client', 'pets:pet-list', 'get', 'client'),
+    endpoint('pet-create', 'pets:pet-create', 'post', 'client',
+             data=lambda f: {'name': 'Biscuit', 'species': 'Dog', 'age': 3}),
+    endpoint('pet-detail', 'pets:pet-detail', 'get', 'client', kwargs=lambda f: {'pk': f['pet'].pk}),
+    endpoint('pet-image', 'pets:pet-image', 'get', 'vet', kwargs=lambda f: {'pk': f['pet'].pk}),
+    endpoint('pet-image.not-modified', 'pets:pet-image', 'get', 'client', kwargs=lambda f: {'pk': f['pet'].pk},
+             headers=lambda f: {'HTTP_IF_NONE_MATCH': file_signature(f['pet'].profile_image)[0]}),
+    endpoint('pet-thumbnail', 'pets:pet-thumbnail', 'get', 'client',
+             kwargs=lambda f: {'pk': f['pet'].pk, 'size': 'small', 'image_format': 'webp'}),
+    endpoint('my-pets', 'pets:my-pets', 'get', 'client'),
+    endpoint('active-pets', 'pets:active-pets', 'get', 'vet'),
+    endpoint('pets-by-species', 'pets:pets-by-species', 'get', 'vet', kwargs=lambda f: {'species': 'Dog'}),
+
+    # notifications
+    endpoint('notification-list', 'notification-list', 'get', 'client'),
+    endpoint('notification-detail', 'notification-detail', 'get', 'client',
+             kwargs=lambda f: {'pk': f['notification'].pk}),
+    endpoint('notification-read', 'notification-detail', 'patch', 'client',
+             kwargs=lambda f: {'pk': f['notification'].pk}, data=lambda f: {'read': True}),
+    endpoint('notification-unread-count', 'notification-unread-count', 'get', 'client'),
+    endpoint('notification-mark-read', 'notification-mark-read', 'post', 'client', data=lambda f: {}),
+    endpoint('notification-poll', 'notification-poll', 'get', 'client', query=lambda f: {'after': 0, 'timeout': 0}),
+]
+
+# Routes that cannot be measured as one request, and why
+UNBENCHMARKED = {
+    'notification-stream': "an open-ended event stream; notification-poll covers the same reads",
+}
+
+
+def url_names():
+    """Fully qualified names of every route in URL_MODULES"""
+    names = set()
+    for module_path in URL_MODULES:
+        module = import_module(module_path)
+        namespace = getattr(module, 'app_name', None)
+        for pattern in module.urlpatterns:
+            names.add(f'{namespace}:{pattern.name}' if namespace else pattern.name)
+    return names
+
+
+class QueryTimer:
+    """
+    connection.execute_wrapper that adds up time spent executing SQL.
+    CaptureQueriesContext rounds each query to whole milliseconds, which
+    sums sub-millisecond queries to zero.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+def load_baseline():
+    if not BASELINE_PATH.exists():
+        return None
+    with open(BASELINE_PATH) as handle:
+        return json.load(handle)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBenchmarkTests(APITestCase):
+    """Measure every endpoint and fail on regressions against the stored baseline"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Stored files and upload chunks live on disk, outside the rolled-back transaction
+        media = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, TEST_RESULT_UPLOAD_DIR=os.path.join(media.name, 'partial'))
+        settings.enable()
+        cls.addClassCleanup(settings.disable)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = build_fixture(scale=SCALE)
+        cls.fixture['refresh'] = str(RefreshToken.for_user(cls.fixture['client']))
+        cls.fixture['record'].test_results.save('bloods.pdf', ContentFile(STORED_FILE), save=False)
+        cls.fixture['pet'].profile_image.save('rex.png', ContentFile(pet_photo()), save=False)
+        cls.fixture['pet'].thumbnail_digest = thumbnails.render(cls.fixture['pet'].profile_image.name)
+        MedicalRecord.objects.filter(pk=cls.fixture['record'].pk).update(test_results=cls.fixture['record'].test_results.name)
+        PetProfile.objects.filter(pk=cls.fixture['pet'].pk).update(
+            profile_image=cls.fixture['pet'].profile_image.name, thumbnail_digest=cls.fixture['pet'].thumbnail_digest
+        )
+
+    def request(self, spec):
+        """Send the request described by `spec` and return the response"""
+        fixture = self.fixture
+        url = reverse(spec['name'], kwargs=spec['kwargs'](fixture) if spec['kwargs'] else None)
+        data = spec['data'](fixture) if spec['data'] else None
+        if spec['query']:
+            data = spec['query'](fixture)
+
+        user = fixture[spec['user']] if spec['user'] else None
+        self.client.force_authenticate(user)
+        headers = spec['headers'](fixture) if spec['headers'] else {}
+        if isinstance(data, bytes):
+            return self.client.generic(
+                spec['method'].upper(), url, data, content_type='application/offset+octet-stream', **headers
+            )
+        return getattr(self.client, spec['method'])(
+            url, data, format=None if spec['method'] == 'get' else 'json', **headers
+        )
+
+    def measure(self, spec):
+        """
+        Run `spec` once to warm caches, then REPEATS more times, keeping the
+        fastest run. Each run, on_commit callbacks included, is rolled back
+        so writes are repeatable.
+        """
+        best = None
+        for attempt in range(REPEATS + 1):
+            timer = QueryTimer()
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries, connection.execute_wrapper(timer):
+                    started = time.perf_counter()
+                    with self.captureOnCommitCallbacks(execute=True):
+                        response = self.request(spec)
+                    body = response.getvalue()
+                    wall_ms = (time.perf_counter() - started) * 1000
+                transaction.set_rollback(True)
+
+            run = {
+                'status': response.status_code,
+                'queries': len(queries.captured_queries),
+                'sql_ms': round(timer.seconds * 1000, 3),
+                'wall_ms': round(wall_ms, 3),
+                'bytes': len(body),
+            }
+            if attempt and (best is None or run['wall_ms'] < best['wall_ms']):
+                best = run
+        return best
+
+    def regressions(self, measured, baseline):
+        """List the ways `measured` is worse than `baseline` for one endpoint"""
+        problems = []
+        if measured['status'] != baseline['status']:
+            problems.append(f"status {measured['status']} != {baseline['status']}")
+        if measured['queries'] > baseline['queries']:
+            problems.append(f"queries {measured['queries']} > {baseline['queries']}")
+        if measured['bytes'] > baseline['bytes'] * BYTES_TOLERANCE + BYTES_SLACK:
+            problems.append(f"bytes {measured['bytes']} > {baseline['bytes']}")
+        if measured['sql_ms'] > baseline['sql_ms'] * TIME_TOLERANCE + SQL_SLACK_MS:
+            problems.append(f"sql_ms {measured['sql_ms']} > {baseline['sql_ms']}")
+        if measured['wall_ms'] > baseline['wall_ms'] * TIME_TOLERANCE + WALL_SLACK_MS:
+            problems.append(f"wall_ms {measured['wall_ms']} > {baseline['wall_ms']}")
+        return problems
+
+    def test_every_url_is_benchmarked(self):
+        missing = url_names() - {spec['name'] for spec in ENDPOINTS} - set(UNBENCHMARKED)
+        self.assertFalse(missing, f"Add benchmarks for: {sorted(missing)}")
+
+    def test_endpoints_within_baseline(self):
+        results = {spec['label']: self.measure(spec) for spec in ENDPOINTS}
+        report = {'scale': SCALE, 'endpoints': results}
+
+        if os.environ.get('BENCHMARK_OUTPUT'):
+            with open(os.environ['BENCHMARK_OUTPUT'], 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+
+        baseline = load_baseline()
+        if os.environ.get('BENCHMARK_UPDATE_BASELINE') == '1':
+            accepted = set(filter(None, os.environ.get('BENCHMARK_ACCEPT_QUERIES', '').split(',')))
+            raised = sorted(
+                f"{label} {baseline['endpoints'][label]['queries']} -> {measured['queries']}"
+                for label, measured in results.items()
+                if baseline and label in baseline['endpoints'] and label not in accepted
+                and measured['queries'] > baseline['endpoints'][label]['queries']
+            )
+            self.assertFalse(raised, f"Query counts rose; list the labels in BENCHMARK_ACCEPT_QUERIES to accept: {raised}")
+            with open(BASELINE_PATH, 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+                handle.write('\n')
+            return
+
+        if baseline is None or baseline['scale'] != SCALE:
+            self.skipTest(f"No baseline recorded for scale {SCALE}")
+
+        for label, measured in results.items():
+            with self.subTest(endpoint=label):
+                self.assertIn(label, baseline['endpoints'], "New endpoint; update the baseline")
+                problems = self.regressions(measured, baseline['endpoints'][label])
+                self.assertFalse(problems, f"{label} regressed: {', '.join(problems)}")
+
+
+class SeederTests(APITestCase):
+    """Seeded bookings respect the vets' calendars"""
+
+    def test_no_double_booking(self):
+        # Far more bookings than two vets' diaries hold, so full days spill over
+        Seeder(seed=7, vets=2, clients=20, appointments=600, notifications_per_user=0, history_days=20).run()
+        booked = Appointment.objects.filter(status__in=Appointment.BOOKED_STATUSES)
+        self.assertTrue(booked.exists())
+        self.assertFalse(booked.filter(time__isnull=True).exists())
+
+        slots = list(booked.values_list('veterinarian_id', 'date', 'time'))
+        self.assertEqual(len(slots), len(set(slots)))
+        hours = set(WeeklyAvailability.objects.values_list('schedule__veterinarian_id', 'weekday'))
+        for vet_id, day, start in slots:
+            self.assertIn((vet_id, day.weekday()), hours)
+            self.assertTrue(WORKING_HOURS[0] <= start.hour < WORKING_HOURS[1])
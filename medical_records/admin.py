@@ -1,6 +1,11 @@
 from django.contrib import admin
-from .models import MedicalRecord
+from .models import MedicalRecord, MedicalRecordRevision, SpeciesVitalsReference, TestResultUpload, Vaccination, VaccineSchedule
 # Register your models here.
 
 
-admin.site.register(MedicalRecord)
\ No newline at end of file
+admin.site.register(MedicalRecord)
+admin.site.register(MedicalRecordRevision)
+admin.site.register(TestResultUpload)
+admin.site.register(SpeciesVitalsReference)
+admin.site.register(Vaccination)
+admin.site.register(VaccineSchedule)
@@ -0,0 +1,256 @@
+"""
+Vitals anomaly scoring for triage.
+
+Each medical record with a weight or temperature gets up to three robust
+z-scores (0.6745 * (x - median) / MAD):
+
+- weight: log weight against the pet's species;
+- temperature: against the pet's species;
+- weight change: relative change from the mean of the pet's previous
+  BASELINE_VISITS weighed visits, against the species' usual change.
+
+``anomaly_score`` is the largest absolute z-score and ``anomaly_flags`` marks
+the checks above THRESHOLD. Species ranges live in SpeciesVitalsReference
+and are recomputed from the whole table on a full run or once they are
+older than the allowed age. Incremental runs only rescore pets with records
+whose ``anomaly_scored_at`` is empty (new or edited records), found through
+a partial index. All arithmetic is vectorized with NumPy over one pet chunk
+at a time.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import MedicalRecord, SpeciesVitalsReference
+
+
+THRESHOLD = 3.5
+BASELINE_VISITS = 5
+
+# Species with fewer records than this get no reference of their own
+MIN_REFERENCE_RECORDS = 30
+
+# Lower bounds for the MADs, so near-identical readings do not give huge scores
+MAD_FLOORS = {
+    'log_weight': 0.05,
+    'temperature': 0.2,
+    'weight_change': 0.02,
+}
+
+WEIGHT = 1
+TEMPERATURE = 2
+WEIGHT_CHANGE = 4
+
+FLAG_NAMES = {
+    WEIGHT: 'weight',
+    TEMPERATURE: 'temperature',
+    WEIGHT_CHANGE: 'weight_change',
+}
+
+METRICS = ['log_weight', 'temperature', 'weight_change']
+
+POOLED = '*'
+
+# Rows edited after their vitals were loaded are left unscored (and queued) for the next run
+UPDATE_SQL = (
+    f"UPDATE {MedicalRecord._meta.db_table} "
+    f"SET anomaly_score = %s, anomaly_flags = %s, anomaly_scored_at = %s WHERE id = %s AND updated_at <= %s"
+)
+
+
+def flag_names(flags):
+    return [name for bit, name in FLAG_NAMES.items() if flags & bit]
+
+
+class Vitals:
+    """Column arrays for a set of records, sorted by pet then visit date"""
+
+    def __init__(self, rows):
+        pks, pets, species, weights, temperatures = zip(*rows) if rows else ([], [], [], [], [])
+        self.pk = np.array(pks, dtype=np.int64)
+        self.pet = np.array(pets, dtype=np.int64)
+        self.species_names, self.species = np.unique(np.array(species, dtype=object).astype(str), return_inverse=True)
+        # None (missing reading) becomes NaN
+        self.weight = np.array(weights, dtype=float)
+        self.temperature = np.array(temperatures, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.log_weight = np.where(self.weight > 0, np.log(self.weight), np.nan)
+        self.weight_change = relative_change(self.pet, self.weight)
+
+    @classmethod
+    def load(cls, records):
+        rows = records.order_by('pet_id', 'visit_date', 'pk').values_list(
+            'pk', 'pet_id', 'pet__species', 'weight', 'temperature'
+        )
+        return cls(list(rows.iterator(chunk_size=5000)))
+
+    def __len__(self):
+        return len(self.pk)
+
+
+def relative_change(pets, weights):
+    """
+    Relative change of each weight from the mean of the same pet's previous
+    BASELINE_VISITS weights. NaN for a pet's first weighed visit.
+    `pets` must be grouped and each group in visit order.
+    """
+    change = np.full(len(weights), np.nan)
+    weighed = np.flatnonzero(~np.isnan(weights))
+    if not len(weighed):
+        return change
+    values, owners = weights[weighed], pets[weighed]
+
+    # Index of the first weighed visit of each row's pet
+    starts = np.r_[0, np.flatnonzero(owners[1:] != owners[:-1]) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(values)]))
+
+    position = np.arange(len(values))
+    low = np.maximum(position - BASELINE_VISITS, group_start)
+    totals = np.r_[0.0, np.cumsum(values)]
+    counts = position - low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        baseline = (totals[position] - totals[low]) / counts
+        change[weighed] = np.where(counts > 0, (values - baseline) / baseline, np.nan)
+    return change
+
+
+def group_medians(values, groups, count):
+    """Median of `values` for each group id in range(count), ignoring NaN; NaN for empty groups"""
+    present = ~np.isnan(values)
+    values, groups = values[present], groups[present]
+    order = np.lexsort((values, groups))
+    values, groups = values[order], groups[order]
+
+    sizes = np.bincount(groups, minlength=count)
+    starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    medians = np.full(count, np.nan)
+    filled = sizes > 0
+    low = starts[filled] + (sizes[filled] - 1) // 2
+    high = starts[filled] + sizes[filled] // 2
+    medians[filled] = (values[low] + values[high]) / 2
+    return medians, sizes
+
+
+def compute_references():
+    """Recompute every species' reference ranges from the whole table"""
+    vitals = Vitals.load(MedicalRecord.objects.exclude(weight__isnull=True, temperature__isnull=True))
+    names = list(vitals.species_names) + [POOLED]
+    pooled = len(names) - 1
+
+    stats = {}
+    for metric in METRICS:
+        values = getattr(vitals, metric)
+        # Every reading counts once for its species and once for the pooled reference
+        values = np.r_[values, values]
+        groups = np.r_[vitals.species, np.full(len(vitals), pooled)]
+        medians, _ = group_medians(values, groups, len(names))
+        mads, _ = group_medians(np.abs(values - medians[groups]), groups, len(names))
+        stats[metric] = (medians, mads)
+    records = np.bincount(np.r_[vitals.species, np.full(len(vitals), pooled)], minlength=len(names))
+
+    now = timezone.now()
+    references = [
+        SpeciesVitalsReference(
+            species=name, records=int(records[index]), computed_at=now,
+            **{
+                f'{metric}_{stat}': _optional(stats[metric][position][index])
+                for metric in METRICS for position, stat in enumerate(('median', 'mad'))
+            },
+        )
+        for index, name in enumerate(names)
+    ]
+    with transaction.atomic():
+        SpeciesVitalsReference.objects.exclude(species__in=names).delete()
+        SpeciesVitalsReference.objects.bulk_create(
+            references, update_conflicts=True, unique_fields=['species'],
+            update_fields=['records', 'computed_at'] + [
+                f'{metric}_{stat}' for metric in METRICS for stat in ('median', 'mad')
+            ],
+        )
+    return {reference.species: reference for reference in references}
+
+
+def load_references(max_age=None):
+    """Stored references, recomputed if missing or older than `max_age`"""
+    references = {reference.species: reference for reference in SpeciesVitalsReference.objects.all()}
+    stale = max_age is not None and any(
+        reference.computed_at < timezone.now() - max_age for reference in references.values()
+    )
+    if POOLED not in references or stale:
+        references = compute_references()
+    return references
+
+
+def score(vitals, references):
+    """Return (scores, flags) arrays for `vitals`; NaN scores where nothing could be checked"""
+    pooled = references[POOLED]
+    scores, flags = np.full(len(vitals), np.nan), np.zeros(len(vitals), dtype=np.int64)
+    for metric, bit in (('log_weight', WEIGHT), ('temperature', TEMPERATURE), ('weight_change', WEIGHT_CHANGE)):
+        medians, mads = _reference_arrays(vitals.species_names, references, pooled, metric)
+        values = getattr(vitals, metric)
+        z = np.abs(0.6745 * (values - medians[vitals.species]) / mads[vitals.species])
+        scores = np.fmax(scores, z)
+        flags |= np.where(z > THRESHOLD, bit, 0)
+    return scores, flags
+
+
+def run(full=False, reference_max_age=timedelta(hours=24), pets_per_chunk=2000, batch_size=1000):
+    """
+    Score records and return (records scored, records flagged).
+    A full run recomputes the references and rescores every record;
+    otherwise only pets with unscored records are rescored.
+    """
+    references = compute_references() if full else load_references(reference_max_age)
+
+    if full:
+        pets = MedicalRecord.objects.all()
+    else:
+        pets = MedicalRecord.objects.filter(anomaly_scored_at__isnull=True)
+    pets = pets.order_by().values_list('pet_id', flat=True).distinct()
+    pet_ids = sorted(pets)
+
+    scored = flagged = 0
+    for start in range(0, len(pet_ids), pets_per_chunk):
+        chunk = pet_ids[start:start + pets_per_chunk]
+        # A pet's whole history is needed for its baselines
+        loaded_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        vitals = Vitals.load(MedicalRecord.objects.filter(pet_id__in=chunk))
+        scores, flags = score(vitals, references)
+
+        scored_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        rows = [
+            (None if np.isnan(value) else round(float(value), 3), int(flag), scored_at, int(pk), loaded_at)
+            for pk, value, flag in zip(vitals.pk, scores, flags)
+        ]
+        # One prepared UPDATE per row: bulk_update's CASE expressions cost far more to build
+        # than to run, and save() would queue the records for scoring again
+        with transaction.atomic(), connection.cursor() as cursor:
+            for batch in range(0, len(rows), batch_size):
+                cursor.executemany(UPDATE_SQL, rows[batch:batch + batch_size])
+        scored += len(rows)
+        flagged += int(np.count_nonzero(flags))
+    return scored, flagged
+
+
+def _reference_arrays(species_names, references, pooled, metric):
+    """
+    Per-species (median, MAD) arrays for `metric`. Species with too few
+    records are not checked on absolute values, which differ too much between
+    species to pool; relative weight change falls back to the pooled reference.
+    """
+    medians, mads = [], []
+    for name in species_names:
+        reference = references.get(name)
+        if reference is None or reference.records < MIN_REFERENCE_RECORDS:
+            reference = pooled if metric == 'weight_change' else None
+        medians.append(getattr(reference, f'{metric}_median', None))
+        mads.append(getattr(reference, f'{metric}_mad', None))
+    medians = np.array(medians, dtype=float)
+    mads = np.fmax(np.array(mads, dtype=float), MAD_FLOORS[metric])
+    return medians, mads
+
+
+def _optional(value):
+    return None if np.isnan(value) else float(value)
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class MedicalRecordsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'medical_records'
+
+    def ready(self):
+        from django.db.models.signals import post_delete
+        from appointments.models import Consultation
+        from .models import MedicalRecord
+        from .search import unindex_deleted
+
+        # A receiver rather than delete(): queryset and cascade deletes never call delete()
+        for model in (MedicalRecord, Consultation):
+            post_delete.connect(unindex_deleted, sender=model, dispatch_uid=f'unindex_{model.__name__}')
@@ -0,0 +1,49 @@
+import os
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from medical_records import uploads
+from medical_records.models import TestResultUpload
+
+
+class Command(BaseCommand):
+    help = "Abort test result uploads with no chunk for a while and delete leftover staging files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help="Abort uploads idle for this many hours")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = TestResultUpload.objects.filter(status=TestResultUpload.ACTIVE, updated_at__lt=cutoff)
+        aborted = 0
+        for upload in stale.iterator():
+            uploads.abort(upload)
+            aborted += 1
+
+        # Staging files whose session is gone or no longer active
+        removed = 0
+        directory = uploads.staging_dir()
+        names = [name for name in os.listdir(directory) if name.endswith('.part')] if os.path.isdir(directory) else []
+        active = {
+            str(pk) for pk in TestResultUpload.objects.filter(
+                pk__in=[name[:-len('.part')] for name in names if _is_uuid(name[:-len('.part')])],
+                status=TestResultUpload.ACTIVE,
+            ).values_list('pk', flat=True)
+        }
+        for name in names:
+            if name[:-len('.part')] not in active:
+                uploads.remove_file(os.path.join(directory, name))
+                removed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Aborted {aborted} stale uploads, removed {removed} staging files."))
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
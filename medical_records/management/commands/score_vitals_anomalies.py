@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from medical_records import anomalies
+
+
+class Command(BaseCommand):
+    help = (
+        "Score medical record vitals against species reference ranges and each pet's recent weights. "
+        "By default only pets with new or edited records are rescored; run it often."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute species references and rescore every record")
+        parser.add_argument('--reference-max-age', type=float, default=24,
+                            help="Recompute species references older than this many hours")
+        parser.add_argument('--pets-per-chunk', type=int, default=2000, help="Pets loaded and scored at a time")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per executemany() call")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        scored, flagged = anomalies.run(
+            full=options['full'],
+            reference_max_age=timedelta(hours=options['reference_max_age']),
+            pets_per_chunk=options['pets_per_chunk'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {scored} records ({flagged} flagged) in {time.perf_counter() - started:.1f}s."
+        ))
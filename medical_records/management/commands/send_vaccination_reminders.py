@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical_records import vaccinations
+
+
+class Command(BaseCommand):
+    help = (
+        "Notify pet owners of vaccine doses falling due soon. Each due date is reminded about once, "
+        "so the command can run daily or more often."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=vaccinations.REMINDER_DAYS,
+                            help="Remind about doses due within this many days")
+        parser.add_argument('--chunk-size', type=int, default=vaccinations.REMINDER_CHUNK_SIZE,
+                            help="Doses handled per transaction")
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['chunk_size'] < 1:
+            raise CommandError("--days cannot be negative and --chunk-size must be positive.")
+
+        started = time.perf_counter()
+        sent = vaccinations.send_reminders(days=options['days'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {sent} vaccination reminders in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+
+# The DDL as it was when this migration was written, so later changes to
+# medical_records.search cannot change what this migration does
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS medical_search USING fts5("
+        "diagnosis, body, veterinarian_id UNINDEXED, owner_id UNINDEXED, "
+        "tokenize='porter unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS medical_search ("
+        "id bigint PRIMARY KEY, veterinarian_id bigint, owner_id bigint, "
+        "diagnosis text NOT NULL, body text NOT NULL, "
+        "document tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', diagnosis), 'A') || "
+        "setweight(to_tsvector('english', body), 'B')) STORED)",
+        "CREATE INDEX IF NOT EXISTS medical_search_document ON medical_search USING gin (document)",
+        "CREATE INDEX IF NOT EXISTS medical_search_vet ON medical_search (veterinarian_id)",
+        "CREATE INDEX IF NOT EXISTS medical_search_owner ON medical_search (owner_id)",
+    ],
+}
+
+DROP_SQL = {
+    'sqlite': ["DROP TABLE IF EXISTS medical_search"],
+    'postgresql': ["DROP TABLE IF EXISTS medical_search"],
+}
+
+
+def create_search_table(apps, schema_editor):
+    for statement in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_table(apps, schema_editor):
+    for statement in DROP_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index for medical records and consultations (see medical_records.search).
+    Populate existing rows afterwards with `manage.py rebuild_search_index`.
+    """
+
+    dependencies = [
+        ('medical_records', '0001_initial'),
+        ('appointments', '0002_vet_schedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
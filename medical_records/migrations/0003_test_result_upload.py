@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:30
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0002_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestResultUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(help_text='Original file name', max_length=255)),
+                ('size', models.BigIntegerField(help_text='Total file size in bytes')),
+                ('sha256', models.CharField(blank=True, help_text='Optional checksum of the whole file, verified on completion', max_length=64)),
+                ('received_size', models.BigIntegerField(default=0, help_text='Bytes stored so far')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('completed', 'Completed'), ('aborted', 'Aborted')], db_index=True, default='active', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_result_uploads', to='medical_records.medicalrecord')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_result_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Test Result Upload',
+                'verbose_name_plural': 'Test Result Uploads',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='medical_rec_status_9d8a5a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:44
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_vet_schedule'),
+        ('medical_records', '0003_test_result_upload'),
+        ('pets', '0003_pet_thumbnail_digest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpeciesVitalsReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('species', models.CharField(max_length=100, unique=True)),
+                ('records', models.PositiveIntegerField(default=0, help_text='Records with vitals the ranges were computed from')),
+                ('log_weight_median', models.FloatField(null=True)),
+                ('log_weight_mad', models.FloatField(null=True)),
+                ('temperature_median', models.FloatField(null=True)),
+                ('temperature_mad', models.FloatField(null=True)),
+                ('weight_change_median', models.FloatField(help_text="Relative change against the pet's recent visits", null=True)),
+                ('weight_change_mad', models.FloatField(null=True)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Species Vitals Reference',
+                'verbose_name_plural': 'Species Vitals References',
+                'ordering': ['species'],
+            },
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='anomaly_flags',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Bitmask of the vitals checks this record failed'),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='anomaly_score',
+            field=models.FloatField(blank=True, editable=False, help_text='Largest robust z-score among the vitals checks', null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='anomaly_scored_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the vitals were last scored; empty until the next batch run', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(condition=models.Q(('anomaly_flags__gt', 0)), fields=['veterinarian', '-anomaly_score'], name='medrec_flagged_vet_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(condition=models.Q(('anomaly_scored_at__isnull', True)), fields=['pet'], name='medrec_unscored_idx'),
+        ),
+    ]
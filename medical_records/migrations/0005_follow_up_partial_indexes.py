@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_vet_schedule'),
+        ('medical_records', '0004_vitals_anomaly_scores'),
+        ('pets', '0003_pet_thumbnail_digest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(condition=models.Q(('follow_up_required', True)), fields=['veterinarian', 'follow_up_date', 'id'], name='medrec_followup_vet_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(condition=models.Q(('follow_up_required', True)), fields=['pet', 'follow_up_date', 'id'], name='medrec_followup_pet_idx'),
+        ),
+    ]
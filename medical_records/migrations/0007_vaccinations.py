@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:20
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0006_follow_up_booking'),
+        ('pets', '0003_pet_thumbnail_digest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VaccineSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('species', models.CharField(choices=[('Dog', 'Dog'), ('Cat', 'Cat'), ('Bird', 'Bird'), ('Rabbit', 'Rabbit'), ('Hamster', 'Hamster'), ('Guinea Pig', 'Guinea Pig'), ('Reptile', 'Reptile'), ('Fish', 'Fish'), ('Other', 'Other')], help_text='Species the schedule applies to', max_length=100)),
+                ('vaccine', models.CharField(help_text='Vaccine name, matched without regard to case', max_length=100)),
+                ('dose', models.PositiveSmallIntegerField(default=1, help_text='Dose the interval counts from', validators=[django.core.validators.MinValueValidator(1)])),
+                ('interval_days', models.PositiveIntegerField(blank=True, help_text='Days until the next dose; empty if none is needed', null=True)),
+            ],
+            options={
+                'verbose_name': 'Vaccine Schedule',
+                'verbose_name_plural': 'Vaccine Schedules',
+                'ordering': ['species', 'vaccine', 'dose'],
+                'constraints': [models.UniqueConstraint(fields=('species', 'vaccine', 'dose'), name='unique_vaccine_schedule_dose')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Vaccination',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vaccine', models.CharField(help_text='Vaccine name', max_length=100)),
+                ('dose', models.PositiveSmallIntegerField(default=1, help_text='Dose number in the course', validators=[django.core.validators.MinValueValidator(1)])),
+                ('batch_number', models.CharField(blank=True, help_text='Manufacturer batch / lot number', max_length=50)),
+                ('administered_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the dose was given')),
+                ('next_due', models.DateField(blank=True, help_text='When the next dose is due; empty once given or if none is needed', null=True)),
+                ('reminded_for', models.DateField(blank=True, editable=False, help_text='The next_due date the owner was last reminded about', null=True)),
+                ('notes', models.TextField(blank=True, help_text='Reactions or other observations')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medical_record', models.ForeignKey(blank=True, help_text='Visit the dose was given at (if recorded)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vaccinations', to='medical_records.medicalrecord')),
+                ('pet', models.ForeignKey(help_text='Vaccinated pet', on_delete=django.db.models.deletion.CASCADE, related_name='vaccinations', to='pets.petprofile')),
+                ('veterinarian', models.ForeignKey(blank=True, help_text='Veterinarian who administered the dose', limit_choices_to={'role': 'VETERINARIAN'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vaccinations_given', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Vaccination',
+                'verbose_name_plural': 'Vaccinations',
+                'ordering': ['-administered_at'],
+                'indexes': [models.Index(fields=['pet', 'administered_at'], name='medical_rec_pet_id_49e62e_idx'), models.Index(condition=models.Q(('next_due__isnull', False)), fields=['next_due', 'id'], name='vacc_due_idx'), models.Index(condition=models.Q(('next_due__isnull', False)), fields=['veterinarian', 'next_due', 'id'], name='vacc_vet_due_idx'), models.Index(condition=models.Q(('next_due__isnull', False)), fields=['pet', 'next_due', 'id'], name='vacc_pet_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+from medical_records.vaccinations import DEFAULT_SCHEDULE
+
+
+def add_default_schedule(apps, schema_editor):
+    VaccineSchedule = apps.get_model('medical_records', 'VaccineSchedule')
+    VaccineSchedule.objects.bulk_create(
+        [
+            VaccineSchedule(species=species, vaccine=vaccine, dose=dose, interval_days=days)
+            for species, vaccine, dose, days in DEFAULT_SCHEDULE
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def remove_default_schedule(apps, schema_editor):
+    VaccineSchedule = apps.get_model('medical_records', 'VaccineSchedule')
+    for species, vaccine, dose, days in DEFAULT_SCHEDULE:
+        VaccineSchedule.objects.filter(species=species, vaccine=vaccine, dose=dose, interval_days=days).delete()
+
+
+class Migration(migrations.Migration):
+    """Core vaccine courses for dogs, cats and rabbits; edit them in the admin."""
+
+    dependencies = [
+        ('medical_records', '0007_vaccinations'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_default_schedule, remove_default_schedule),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0008_default_vaccine_schedule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='revision_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Edits recorded in the revision history'),
+        ),
+        migrations.CreateModel(
+            name='MedicalRecordRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(help_text="1 for the record's first edit; version n + 1 is the record after edit n")),
+                ('changes', models.JSONField(help_text='Old value of each changed field, by field; long text as a line patch')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('edited_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='medical_record_revisions', to=settings.AUTH_USER_MODEL)),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='medical_records.medicalrecord')),
+            ],
+            options={
+                'ordering': ['record', '-number'],
+                'constraints': [models.UniqueConstraint(fields=('record', 'number'), name='unique_medrec_revision_number')],
+            },
+        ),
+    ]
@@ -1,13 +1,16 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 
-from pets.models import PetProfile
+from pets.models import CareSource, CareSourceQuerySet, PetProfile
 from accounts.models import CustomUser
 from appointments.models import Appointment
 
 
-class MedicalRecord(models.Model):
+class MedicalRecord(CareSource, models.Model):
     """
     Model to store medical records for pets after veterinary visits.
     Links to appointments and consultations for comprehensive tracking.
@@ -28,14 +31,33 @@ class MedicalRecord(models.Model):
     prescription = models.TextField(blank=True,help_text="Medications prescribed")
     follow_up_required = models.BooleanField(default=False,help_text="Whether a follow-up consultation is needed")
     follow_up_date = models.DateField(null=True,blank=True,help_text="Scheduled follow-up date")
+    follow_up_appointment = models.ForeignKey(Appointment,on_delete=models.SET_NULL,null=True,blank=True,editable=False,db_index=False,related_name='follow_up_records',help_text="Appointment the follow-up was booked into by the schedule_follow_ups job")
     notes = models.TextField(blank=True,help_text="Additional notes or observations" )
     weight = models.DecimalField(max_digits=6,decimal_places=2,null=True,blank=True,help_text="Pet weight in kg at time of visit")
     temperature = models.DecimalField(max_digits=4,decimal_places=1,null=True,blank=True,help_text="Body temperature in Celsius")
 
     test_results = models.FileField(upload_to='medical_records/tests/%Y/%m/',null=True,blank=True,help_text="Lab test results or medical documents")
+
+    # Set by the score_vitals_anomalies batch job (see medical_records.anomalies)
+    anomaly_score = models.FloatField(null=True,blank=True,editable=False,help_text="Largest robust z-score among the vitals checks")
+    anomaly_flags = models.PositiveSmallIntegerField(default=0,editable=False,help_text="Bitmask of the vitals checks this record failed")
+    anomaly_scored_at = models.DateTimeField(null=True,blank=True,editable=False,help_text="When the vitals were last scored; empty until the next batch run")
+    revision_count = models.PositiveIntegerField(default=0,editable=False,help_text="Edits recorded in the revision history")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Relations reached through properties, for the queryset optimizer
+    PROPERTY_RELATIONS = {'pet_owner': 'pet__owner'}
+
+    # Fields the vitals anomaly score depends on (see medical_records.anomalies)
+    SCORED_FIELDS = ['weight', 'temperature', 'visit_date', 'pet_id']
+
+    # User the next revision is credited to; set by the code making the edit
+    edited_by = None
+    
+    care_date = 'visit_date_local'
+    objects = CareSourceQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Medical Record'
         verbose_name_plural = 'Medical Records'
@@ -44,6 +66,15 @@ class MedicalRecord(models.Model):
             models.Index(fields=['pet', 'visit_date']),
             models.Index(fields=['veterinarian', 'visit_date']),
             models.Index(fields=['appointment']),
+            models.Index(fields=['veterinarian', '-anomaly_score'], condition=models.Q(anomaly_flags__gt=0), name='medrec_flagged_vet_idx'),
+            models.Index(fields=['pet'], condition=models.Q(anomaly_scored_at__isnull=True), name='medrec_unscored_idx'),
+            # Pending follow-ups in date order, per vet and per pet; id keeps keyset pages in index order
+            models.Index(fields=['veterinarian', 'follow_up_date', 'id'], condition=models.Q(follow_up_required=True), name='medrec_followup_vet_idx'),
+            models.Index(fields=['pet', 'follow_up_date', 'id'], condition=models.Q(follow_up_required=True), name='medrec_followup_pet_idx'),
+            # Follow-ups still waiting to be booked, in date order (see appointments.follow_ups)
+            models.Index(fields=['follow_up_date', 'id'], condition=models.Q(follow_up_required=True, follow_up_appointment__isnull=True), name='medrec_followup_unbooked_idx'),
+            # Only booked rows: NULL is nearly every row and would tempt the planner away from the index above
+            models.Index(fields=['follow_up_appointment'], condition=models.Q(follow_up_appointment__isnull=False), name='medrec_followup_booked_idx'),
         ]
     
     def __str__(self):
@@ -77,10 +108,72 @@ class MedicalRecord(models.Model):
                 "veterinarian": "The veterinarian must match the appointment veterinarian."
             })
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Keep the loaded values, so save() can tell what an edit changed"""
+        from .revisions import values as tracked_values
+
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = tracked_values(instance)
+        return instance
+
     def save(self, *args, **kwargs):
-        """Validate before saving"""
+        """Validate, record the changed fields in the revision history and notify the owner of new follow-ups"""
+        from notifications import fanout
+        from . import revisions
+        from .search import index_records
+
         self.full_clean()
-        super().save(*args, **kwargs)
+
+        loaded = getattr(self, '_loaded_values', {})
+        # Queue the vitals for the next anomaly scoring run when an edit changes what they are scored on
+        rescore = self._state.adding or any(
+            name not in loaded or loaded[name] != getattr(self, name) for name in self.SCORED_FIELDS
+        )
+        if rescore and self.anomaly_scored_at is not None:
+            self.anomaly_scored_at = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = [*kwargs['update_fields'], 'anomaly_scored_at']
+        follow_up_requested = self.follow_up_required and self.follow_up_date and (
+            self._state.adding
+            or not loaded.get('follow_up_required')
+            or loaded.get('follow_up_date') != self.follow_up_date
+        )
+        # A changed follow-up no longer matches the appointment booked for it; the next run rebooks
+        follow_up_changed = any(
+            name in loaded and loaded[name] != getattr(self, name) for name in ('follow_up_required', 'follow_up_date')
+        )
+        if follow_up_changed and self.follow_up_appointment_id is not None:
+            self.follow_up_appointment = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = [*kwargs['update_fields'], 'follow_up_appointment']
+
+        changes = {}
+        if not self._state.adding and hasattr(self, '_loaded_values'):
+            update_fields = kwargs.get('update_fields')
+            changes = revisions.diff(self, self._loaded_values, update_fields)
+            if changes:
+                self.revision_count += 1
+                if update_fields is not None:
+                    kwargs['update_fields'] = [*update_fields, 'revision_count']
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if changes:
+                MedicalRecordRevision.objects.create(
+                    record=self, number=self.revision_count, changes=changes, edited_by=self.edited_by,
+                )
+        self._loaded_values = revisions.values(self)
+        self.update_care()
+        index_records([self.pk])
+        if follow_up_requested:
+            fanout.notify([fanout.follow_up_requested(self, self.pet.owner_id)])
+    
+    @property
+    def visit_date_local(self):
+        """Visit date in the current time zone"""
+        if timezone.is_naive(self.visit_date):
+            return self.visit_date.date()
+        return timezone.localdate(self.visit_date)
     
     @property
     def pet_owner(self):
@@ -101,3 +194,219 @@ class MedicalRecord(models.Model):
             return None
         delta = self.follow_up_date - timezone.now().date()
         return delta.days
+
+    @property
+    def anomaly_reasons(self):
+        """Names of the vitals checks this record failed"""
+        from .anomalies import flag_names
+        return flag_names(self.anomaly_flags)
+
+
+class MedicalRecordRevision(models.Model):
+    """
+    One edit of a medical record: the values the changed fields had before it.
+    Append-only; see medical_records.revisions.
+    """
+
+    record = models.ForeignKey(MedicalRecord,on_delete=models.CASCADE,related_name='revisions')
+    number = models.PositiveIntegerField(help_text="1 for the record's first edit; version n + 1 is the record after edit n")
+    edited_by = models.ForeignKey(CustomUser,on_delete=models.SET_NULL,null=True,blank=True,related_name='medical_record_revisions')
+    changes = models.JSONField(help_text="Old value of each changed field, by field; long text as a line patch")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['record', '-number']
+        constraints = [
+            # Also the index for rebuilding a version: the record's revisions from a number on
+            models.UniqueConstraint(fields=['record', 'number'], name='unique_medrec_revision_number'),
+        ]
+
+    def __str__(self):
+        return f"Revision {self.number} of medical record {self.record_id}"
+
+    def save(self, *args, **kwargs):
+        """Revisions are written once and never changed"""
+        if not self._state.adding:
+            raise ValidationError("Medical record revisions cannot be changed.")
+        super().save(*args, **kwargs)
+
+    @property
+    def changed_fields(self):
+        return sorted(self.changes)
+
+
+class SpeciesVitalsReference(models.Model):
+    """
+    Robust reference ranges per species, recomputed by the anomaly scoring job.
+    Weight is kept on a log scale, where species spreads are comparable.
+    """
+
+    species = models.CharField(max_length=100,unique=True)
+    records = models.PositiveIntegerField(default=0,help_text="Records with vitals the ranges were computed from")
+    log_weight_median = models.FloatField(null=True)
+    log_weight_mad = models.FloatField(null=True)
+    temperature_median = models.FloatField(null=True)
+    temperature_mad = models.FloatField(null=True)
+    weight_change_median = models.FloatField(null=True,help_text="Relative change against the pet's recent visits")
+    weight_change_mad = models.FloatField(null=True)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Species Vitals Reference'
+        verbose_name_plural = 'Species Vitals References'
+        ordering = ['species']
+
+    def __str__(self):
+        return f"Vitals reference for {self.species} ({self.records} records)"
+
+
+class TestResultUpload(models.Model):
+    """
+    Resumable, chunked upload of a test results file for a medical record.
+    Chunks are appended to a staging file (see medical_records.uploads);
+    `received_size` is the offset the next chunk must start at.
+    """
+
+    ACTIVE = 'active'
+    COMPLETED = 'completed'
+    ABORTED = 'aborted'
+
+    STATUS_CHOICES = [
+        (ACTIVE, 'Active'),
+        (COMPLETED, 'Completed'),
+        (ABORTED, 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    record = models.ForeignKey(MedicalRecord,on_delete=models.CASCADE,related_name='test_result_uploads')
+    uploaded_by = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name='test_result_uploads')
+    filename = models.CharField(max_length=255,help_text="Original file name")
+    size = models.BigIntegerField(help_text="Total file size in bytes")
+    sha256 = models.CharField(max_length=64,blank=True,help_text="Optional checksum of the whole file, verified on completion")
+    received_size = models.BigIntegerField(default=0,help_text="Bytes stored so far")
+    status = models.CharField(max_length=20,choices=STATUS_CHOICES,default=ACTIVE,db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Test Result Upload'
+        verbose_name_plural = 'Test Result Uploads'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.filename} for record {self.record_id} ({self.received_size}/{self.size})"
+
+    @property
+    def is_complete(self):
+        return self.received_size >= self.size
+
+
+class VaccineSchedule(models.Model):
+    """
+    Days from one dose of a vaccine to the next, per species. Doses past the
+    highest listed dose repeat its interval (e.g. yearly boosters); an empty
+    interval means the course is complete.
+    """
+
+    species = models.CharField(max_length=100,choices=PetProfile.SPECIES_CHOICES,help_text="Species the schedule applies to")
+    vaccine = models.CharField(max_length=100,help_text="Vaccine name, matched without regard to case")
+    dose = models.PositiveSmallIntegerField(default=1,validators=[MinValueValidator(1)],help_text="Dose the interval counts from")
+    interval_days = models.PositiveIntegerField(null=True,blank=True,help_text="Days until the next dose; empty if none is needed")
+
+    class Meta:
+        verbose_name = 'Vaccine Schedule'
+        verbose_name_plural = 'Vaccine Schedules'
+        ordering = ['species', 'vaccine', 'dose']
+        constraints = [
+            models.UniqueConstraint(fields=['species', 'vaccine', 'dose'], name='unique_vaccine_schedule_dose'),
+        ]
+
+    def __str__(self):
+        return f"{self.species} {self.vaccine} dose {self.dose}: {self.interval_days or 'no'} days"
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+
+class Vaccination(CareSource, models.Model):
+    """
+    A vaccine dose given to a pet. `next_due` is filled from the species'
+    VaccineSchedule when the dose is saved (unless the vet sets it) and
+    cleared once a later dose of the same vaccine is recorded, so the doses
+    still owed are exactly the rows with a `next_due`.
+    """
+
+    pet = models.ForeignKey(PetProfile,on_delete=models.CASCADE,related_name='vaccinations',help_text="Vaccinated pet")
+    veterinarian = models.ForeignKey(CustomUser,on_delete=models.SET_NULL,null=True,blank=True,limit_choices_to={'role': 'VETERINARIAN'},related_name='vaccinations_given',help_text="Veterinarian who administered the dose")
+    medical_record = models.ForeignKey(MedicalRecord,on_delete=models.SET_NULL,null=True,blank=True,related_name='vaccinations',help_text="Visit the dose was given at (if recorded)")
+    vaccine = models.CharField(max_length=100,help_text="Vaccine name")
+    dose = models.PositiveSmallIntegerField(default=1,validators=[MinValueValidator(1)],help_text="Dose number in the course")
+    batch_number = models.CharField(max_length=50,blank=True,help_text="Manufacturer batch / lot number")
+    administered_at = models.DateTimeField(default=timezone.now,help_text="When the dose was given")
+    next_due = models.DateField(null=True,blank=True,help_text="When the next dose is due; empty once given or if none is needed")
+    reminded_for = models.DateField(null=True,blank=True,editable=False,help_text="The next_due date the owner was last reminded about")
+    notes = models.TextField(blank=True,help_text="Reactions or other observations")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    care_date = 'administered_date'
+    objects = CareSourceQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Vaccination'
+        verbose_name_plural = 'Vaccinations'
+        ordering = ['-administered_at']
+        indexes = [
+            models.Index(fields=['pet', 'administered_at']),
+            # Outstanding doses only, in due order: the reminder sweep and the per vet / per pet due lists
+            models.Index(fields=['next_due', 'id'], condition=models.Q(next_due__isnull=False), name='vacc_due_idx'),
+            models.Index(fields=['veterinarian', 'next_due', 'id'], condition=models.Q(next_due__isnull=False), name='vacc_vet_due_idx'),
+            models.Index(fields=['pet', 'next_due', 'id'], condition=models.Q(next_due__isnull=False), name='vacc_pet_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.vaccine} dose {self.dose} for {self.pet.name}"
+
+    def clean(self):
+        """Validate vaccination data"""
+        super().clean()
+
+        if self.medical_record and self.medical_record.pet_id != self.pet_id:
+            raise ValidationError({
+                "medical_record": "The medical record must be for the same pet as this vaccination."
+            })
+
+        if self.next_due and self.administered_at and self.next_due <= self.administered_date:
+            raise ValidationError({
+                "next_due": "The next dose must be due after this one was given."
+            })
+
+    def save(self, *args, **kwargs):
+        """Fill in next_due, then close the earlier doses of the same vaccine"""
+        from .vaccinations import close_earlier_doses, expected_next_due
+
+        self.vaccine = self.vaccine.strip()
+        if self.next_due is None:
+            self.next_due = expected_next_due(self)
+        self.full_clean()
+        super().save(*args, **kwargs)
+        close_earlier_doses(self)
+        self.update_care()
+
+    @property
+    def administered_date(self):
+        """Administration date in the current time zone"""
+        if timezone.is_naive(self.administered_at):
+            return self.administered_at.date()
+        return timezone.localdate(self.administered_at)
+
+    @property
+    def days_until_due(self):
+        """Days until the next dose (negative when overdue)"""
+        if not self.next_due:
+            return None
+        return (self.next_due - timezone.now().date()).days
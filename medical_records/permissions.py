@@ -147,25 +147,12 @@ class CanAccessPetMedicalHistory(permissions.BasePermission):
         if not pet_id:
             return False
         
-        from pets.models import PetProfile
-        try:
-            pet = PetProfile.objects.get(id=pet_id)
-        except PetProfile.DoesNotExist:
-            return False
-        
+        from pets.models import CareRelationship, PetProfile
         user = request.user
         
-        # Pet owner has access
-        if pet.owner == user:
-            return True
-        
         # Veterinarians who have treated this pet have access
         if user.role == 'VETERINARIAN':
-            from .models import MedicalRecord
-            has_treated = MedicalRecord.objects.filter(
-                pet=pet,
-                veterinarian=user
-            ).exists()
-            return has_treated
+            return CareRelationship.has_treated(user, pet_id)
         
-        return False
\ No newline at end of file
+        # Pet owner has access
+        return PetProfile.objects.filter(id=pet_id, owner=user).exists()
\ No newline at end of file
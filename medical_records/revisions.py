@@ -0,0 +1,106 @@
+"""
+Medical record revision history.
+
+Records are edited in place, so every save that changes an editable field
+also inserts one MedicalRecordRevision, in the same transaction, holding
+only the values the changed fields had *before* the edit. Walking the
+revisions backwards from the current row rebuilds any past version:
+version 1 is the record as created, and revision n turned version n into
+version n + 1.
+
+The values a record was loaded with are kept on the instance (see
+``MedicalRecord.from_db``), so finding the changes costs no extra query.
+Long text fields that were only partly edited are stored as a line patch
+against the new text instead of the whole old text.
+"""
+import difflib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models.fields.files import FieldFile
+
+
+# Text shorter than this is always stored whole
+PATCH_MIN_LENGTH = 200
+
+
+def tracked_fields(model):
+    """Fields a revision covers: every editable concrete field but the primary key"""
+    return [field for field in model._meta.concrete_fields if field.editable and not field.primary_key]
+
+
+def values(instance):
+    """Current values of the instance's loaded tracked fields, by attname"""
+    deferred = instance.get_deferred_fields()
+    loaded = {}
+    for field in tracked_fields(type(instance)):
+        if field.attname in deferred:
+            continue
+        value = getattr(instance, field.attname)
+        loaded[field.attname] = (value.name or '') if isinstance(value, FieldFile) else value
+    return loaded
+
+
+def diff(instance, base, fields=None):
+    """
+    {attname: encoded old value} for the fields that differ from `base`,
+    the values the instance was loaded with, optionally limited to `fields`.
+    """
+    changes = {}
+    for attname, new in values(instance).items():
+        if attname not in base or (fields is not None and attname not in fields):
+            continue
+        old = base[attname]
+        if old != new:
+            changes[attname] = _encode(old, new)
+    return changes
+
+
+def rebuild(record, revisions):
+    """
+    Set `record`'s tracked fields to their values before the oldest of
+    `revisions`, which must be every revision from that one to the latest.
+    """
+    fields = {field.attname: field for field in tracked_fields(type(record))}
+    for revision in sorted(revisions, key=lambda revision: revision.number, reverse=True):
+        for attname, old in revision.changes.items():
+            field = fields.get(attname)
+            if field is None:
+                # A field dropped from the model since
+                continue
+            if isinstance(old, dict):
+                old = _unpatch(getattr(record, attname) or '', old['patch'])
+            setattr(record, attname, None if old is None else field.to_python(old))
+    return record
+
+
+def _encode(old, new):
+    if isinstance(old, str) and isinstance(new, str) and len(old) >= PATCH_MIN_LENGTH:
+        patch = _patch(new, old)
+        if len(json.dumps(patch)) < len(json.dumps(old)):
+            return {'patch': patch}
+    if isinstance(old, (date, datetime)):
+        return old.isoformat()
+    if isinstance(old, Decimal):
+        return str(old)
+    return old
+
+
+def _patch(new, old):
+    """[start, end, text] line replacements that turn `new` back into `old`"""
+    new_lines = new.splitlines(keepends=True)
+    old_lines = old.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, new_lines, old_lines, autojunk=False)
+    return [
+        [i1, i2, ''.join(old_lines[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal'
+    ]
+
+
+def _unpatch(new, patch):
+    lines = new.splitlines(keepends=True)
+    # Back to front, so earlier line numbers stay valid
+    for start, end, text in reversed(patch):
+        lines[start:end] = [text]
+    return ''.join(lines)
@@ -0,0 +1,273 @@
+"""
+Full-text search over medical records and consultations.
+
+Both kinds of document live in one ``medical_search`` table keyed by
+``object id * 2 + kind``. On SQLite it is an FTS5 virtual table ranked with
+bm25(); on PostgreSQL it is a plain table with a generated, GIN-indexed
+tsvector ranked with ts_rank_cd(). The diagnosis is indexed separately from
+the rest of the text so matches on it rank higher.
+
+Documents are rebuilt from the source tables with INSERT ... SELECT, so an
+incremental update after save() is two statements and never loads the pet
+or appointment. Deleted records and consultations drop their documents from
+a post_delete receiver, which also runs for queryset and cascade deletes,
+and a pet's records are reindexed when it changes owner. Each document carries the veterinarian and client ids used
+for role scoping, so the MATCH only ranks rows the user may see.
+"""
+import re
+
+from django.db import connection
+
+from appointments.models import Appointment, Consultation
+from pets.models import PetProfile
+from .models import MedicalRecord
+
+
+TABLE = 'medical_search'
+
+RECORD = 0
+CONSULTATION = 1
+
+MAX_TERMS = 8
+
+# Search terms are plain words; everything else in the query is ignored
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def document_id(kind, pk):
+    return pk * 2 + kind
+
+
+def split_document_id(doc_id):
+    """Return (kind, object id) for a document id"""
+    return doc_id % 2, doc_id // 2
+
+
+def parse_terms(query):
+    """Split a user query into at most MAX_TERMS lowercase words"""
+    return [term.lower() for term in TERM_RE.findall(query or '')][:MAX_TERMS]
+
+
+def _record_select(where=''):
+    """SELECT producing one search row per medical record"""
+    return (
+        f"SELECT r.id * 2 + {RECORD}, r.veterinarian_id, p.owner_id, r.diagnosis, "
+        f"r.symptoms || ' ' || r.treatment || ' ' || r.prescription || ' ' || r.notes "
+        f"FROM {MedicalRecord._meta.db_table} r "
+        f"JOIN {PetProfile._meta.db_table} p ON p.id = r.pet_id {where}"
+    )
+
+
+def _consultation_select(where=''):
+    """SELECT producing one search row per consultation"""
+    return (
+        f"SELECT c.id * 2 + {CONSULTATION}, c.veterinarian_id, a.client_id, c.diagnosis, "
+        f"c.symptoms || ' ' || c.notes || ' ' || c.prescription "
+        f"FROM {Consultation._meta.db_table} c "
+        f"JOIN {Appointment._meta.db_table} a ON a.id = c.appointment_id {where}"
+    )
+
+
+class SQLiteBackend:
+    """FTS5 virtual table; rowid is the document id"""
+
+    create_sql = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        f"diagnosis, body, veterinarian_id UNINDEXED, owner_id UNINDEXED, "
+        f"tokenize='porter unicode61 remove_diacritics 2')",
+    ]
+    drop_sql = [f"DROP TABLE IF EXISTS {TABLE}"]
+
+    def reindex(self, cursor, select, params, doc_ids=None):
+        if doc_ids is not None:
+            self.delete(cursor, doc_ids)
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, veterinarian_id, owner_id, diagnosis, body) {select}", params
+        )
+
+    def delete(self, cursor, doc_ids):
+        placeholders = ', '.join(['%s'] * len(doc_ids))
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({placeholders})", doc_ids)
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {TABLE}")
+
+    def search(self, cursor, terms, scope_column, user_id, kinds, limit):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        kind_filter = '' if len(kinds) > 1 else f"AND (rowid & 1) = {kinds[0]}"
+        cursor.execute(
+            f"SELECT rowid, -bm25({TABLE}, 2.0, 1.0), "
+            f"snippet({TABLE}, -1, '[', ']', '...', 12) "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s AND {scope_column} = %s {kind_filter} "
+            f"ORDER BY bm25({TABLE}, 2.0, 1.0) LIMIT %s",
+            [match, user_id, limit],
+        )
+        return cursor.fetchall()
+
+
+class PostgresBackend:
+    """Regular table with a stored tsvector column and a GIN index"""
+
+    create_sql = [
+        f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+        f"id bigint PRIMARY KEY, veterinarian_id bigint, owner_id bigint, "
+        f"diagnosis text NOT NULL, body text NOT NULL, "
+        f"document tsvector GENERATED ALWAYS AS ("
+        f"setweight(to_tsvector('english', diagnosis), 'A') || "
+        f"setweight(to_tsvector('english', body), 'B')) STORED)",
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING gin (document)",
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_vet ON {TABLE} (veterinarian_id)",
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_owner ON {TABLE} (owner_id)",
+    ]
+    drop_sql = [f"DROP TABLE IF EXISTS {TABLE}"]
+
+    def reindex(self, cursor, select, params, doc_ids=None):
+        cursor.execute(
+            f"INSERT INTO {TABLE} (id, veterinarian_id, owner_id, diagnosis, body) {select} "
+            f"ON CONFLICT (id) DO UPDATE SET veterinarian_id = EXCLUDED.veterinarian_id, "
+            f"owner_id = EXCLUDED.owner_id, diagnosis = EXCLUDED.diagnosis, body = EXCLUDED.body",
+            params,
+        )
+
+    def delete(self, cursor, doc_ids):
+        placeholders = ', '.join(['%s'] * len(doc_ids))
+        cursor.execute(f"DELETE FROM {TABLE} WHERE id IN ({placeholders})", doc_ids)
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {TABLE}")
+
+    def search(self, cursor, terms, scope_column, user_id, kinds, limit):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        kind_filter = '' if len(kinds) > 1 else f"AND (id & 1) = {kinds[0]}"
+        cursor.execute(
+            f"SELECT id, ts_rank_cd(document, q), "
+            f"ts_headline('english', diagnosis || ' ' || body, q, "
+            f"'StartSel=[, StopSel=], MaxWords=12, MinWords=4') "
+            f"FROM {TABLE}, to_tsquery('english', %s) q "
+            f"WHERE document @@ q AND {scope_column} = %s {kind_filter} "
+            f"ORDER BY ts_rank_cd(document, q) DESC, id LIMIT %s",
+            [query, user_id, limit],
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgresBackend,
+}
+
+
+def get_backend(conn=None):
+    """Search backend for `conn`, or None if the database has no full-text support here"""
+    backend = BACKENDS.get((conn or connection).vendor)
+    return backend() if backend else None
+
+
+def index_records(pks):
+    """(Re)index the given medical records"""
+    _reindex(RECORD, _record_select, 'r', pks)
+
+
+def index_consultations(pks):
+    """(Re)index the given consultations"""
+    _reindex(CONSULTATION, _consultation_select, 'c', pks)
+
+
+def index_pet_records(pet_ids):
+    """Reindex every record of the given pets, e.g. after a change of owner"""
+    index_records(MedicalRecord.objects.filter(pet_id__in=pet_ids).values_list('pk', flat=True))
+
+
+def unindex(kind, pks):
+    """Drop the documents of deleted records or consultations"""
+    backend = get_backend()
+    if backend is None or not pks:
+        return
+    with connection.cursor() as cursor:
+        backend.delete(cursor, [document_id(kind, pk) for pk in pks])
+
+
+def unindex_deleted(sender, instance, **kwargs):
+    """post_delete receiver for MedicalRecord and Consultation (see MedicalRecordsConfig.ready)"""
+    unindex(RECORD if sender is MedicalRecord else CONSULTATION, [instance.pk])
+
+
+def _reindex(kind, select, alias, pks):
+    backend = get_backend()
+    pks = list(pks)
+    if backend is None or not pks:
+        return
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        backend.reindex(
+            cursor,
+            select(f"WHERE {alias}.id IN ({placeholders})"),
+            pks,
+            doc_ids=[document_id(kind, pk) for pk in pks],
+        )
+
+
+def rebuild():
+    """Rebuild the whole index from the source tables"""
+    backend = get_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+        backend.reindex(cursor, _record_select(), [])
+        backend.reindex(cursor, _consultation_select(), [])
+
+
+def search(user, query, kinds=(RECORD, CONSULTATION), limit=20):
+    """
+    Rank documents matching `query` among those `user` may see.
+    Returns a list of (kind, object id, score, snippet), best first.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return []
+
+    if user.role == 'VETERINARIAN':
+        scope_column = 'veterinarian_id'
+    elif user.role == 'CLIENT':
+        scope_column = 'owner_id'
+    else:
+        return []
+
+    backend = get_backend()
+    if backend is None:
+        return _fallback_search(user, terms, kinds, limit)
+
+    with connection.cursor() as cursor:
+        rows = backend.search(cursor, terms, scope_column, user.pk, list(kinds), limit)
+    return [(*split_document_id(doc_id), score, snippet) for doc_id, score, snippet in rows]
+
+
+def _fallback_search(user, terms, kinds, limit):
+    """Unranked substring search for databases without a full-text backend"""
+    from django.db.models import Q
+
+    def matching(queryset, fields):
+        for term in terms:
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    results = []
+    if RECORD in kinds:
+        records = MedicalRecord.objects.filter(
+            **({'veterinarian': user} if user.role == 'VETERINARIAN' else {'pet__owner': user})
+        )
+        fields = ['diagnosis', 'symptoms', 'treatment', 'prescription', 'notes']
+        results += [(RECORD, pk, 0.0, '') for pk in matching(records, fields).values_list('pk', flat=True)[:limit]]
+    if CONSULTATION in kinds:
+        consultations = Consultation.objects.filter(
+            **({'veterinarian': user} if user.role == 'VETERINARIAN' else {'appointment__client': user})
+        )
+        fields = ['diagnosis', 'symptoms', 'notes', 'prescription']
+        results += [
+            (CONSULTATION, pk, 0.0, '') for pk in matching(consultations, fields).values_list('pk', flat=True)[:limit]
+        ]
+    return results[:limit]
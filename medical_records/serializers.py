@@ -1,7 +1,10 @@
+import os
+
 from rest_framework import serializers
 from django.utils import timezone
 
-from .models import MedicalRecord
+from .models import MedicalRecord, MedicalRecordRevision, TestResultUpload, Vaccination
+from . import search, uploads, vitals
 from appointments.models import Appointment
 from pets.models import PetProfile
 
@@ -22,6 +25,17 @@ class MedicalRecordListSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class FlaggedMedicalRecordSerializer(MedicalRecordListSerializer):
+    """Record list entry with the vitals that were flagged"""
+
+    anomaly_reasons = serializers.ListField(child=serializers.CharField(), read_only=True)
+
+    class Meta(MedicalRecordListSerializer.Meta):
+        fields = MedicalRecordListSerializer.Meta.fields + [
+            'weight', 'temperature', 'anomaly_score', 'anomaly_reasons', 'anomaly_scored_at'
+        ]
+
+
 class MedicalRecordDetailSerializer(serializers.ModelSerializer):
 
     pet_name = serializers.CharField(source='pet.name', read_only=True)
@@ -37,6 +51,7 @@ class MedicalRecordDetailSerializer(serializers.ModelSerializer):
     
     is_follow_up_pending = serializers.BooleanField(read_only=True)
     days_until_follow_up = serializers.IntegerField(read_only=True)
+    anomaly_reasons = serializers.ListField(child=serializers.CharField(), read_only=True)
     
     class Meta:
         model = MedicalRecord
@@ -49,6 +64,7 @@ class MedicalRecordDetailSerializer(serializers.ModelSerializer):
             'prescription', 'follow_up_required', 'follow_up_date',
             'notes', 'weight', 'temperature', 'test_results',
             'is_follow_up_pending', 'days_until_follow_up',
+            'anomaly_score', 'anomaly_reasons',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
@@ -170,3 +186,206 @@ class MedicalRecordUpdateSerializer(serializers.ModelSerializer):
             })
         
         return data
+
+
+class MedicalRecordRevisionSerializer(serializers.ModelSerializer):
+    """One edit in a record's history; GET the version endpoint for the values"""
+
+    edited_by_name = serializers.CharField(source='edited_by.get_full_name', read_only=True)
+    changed_fields = serializers.ListField(child=serializers.CharField(), read_only=True)
+
+    class Meta:
+        model = MedicalRecordRevision
+        fields = ['id', 'number', 'edited_by', 'edited_by_name', 'changed_fields', 'created_at']
+        read_only_fields = fields
+
+
+class MedicalSearchQuerySerializer(serializers.Serializer):
+    """Query parameters for full-text search"""
+
+    ALL = 'all'
+    RECORDS = 'records'
+    CONSULTATIONS = 'consultations'
+    MAX_LIMIT = 100
+
+    q = serializers.CharField(help_text="Words to search for; each is matched as a prefix")
+    type = serializers.ChoiceField(choices=[ALL, RECORDS, CONSULTATIONS], default=ALL)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_LIMIT, default=20)
+
+    def validate_q(self, value):
+        """Ensure the query has at least one searchable word"""
+        if not search.parse_terms(value):
+            raise serializers.ValidationError("Enter at least one word to search for.")
+        return value
+
+    def get_kinds(self):
+        kind = self.validated_data['type']
+        if kind == self.RECORDS:
+            return [search.RECORD]
+        if kind == self.CONSULTATIONS:
+            return [search.CONSULTATION]
+        return [search.RECORD, search.CONSULTATION]
+
+
+class TestResultUploadSerializer(serializers.ModelSerializer):
+    """Open a resumable upload session and report its progress"""
+
+    class Meta:
+        model = TestResultUpload
+        fields = [
+            'id', 'record', 'filename', 'size', 'sha256',
+            'received_size', 'status', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'record', 'received_size', 'status', 'created_at', 'updated_at']
+
+    def validate_filename(self, value):
+        """Keep only the base name of the uploaded file"""
+        name = os.path.basename(value.replace('\\', '/')).strip()
+        if not name or name in ('.', '..'):
+            raise serializers.ValidationError("Enter a valid file name.")
+        return name
+
+    def validate_size(self, value):
+        """Ensure the file is not empty and within the size limit"""
+        if value <= 0:
+            raise serializers.ValidationError("Size must be greater than zero.")
+        if value > uploads.max_size():
+            raise serializers.ValidationError(f"Files may be at most {uploads.max_size()} bytes.")
+        return value
+
+    def validate_sha256(self, value):
+        """Ensure the checksum is a hex SHA-256 digest"""
+        value = value.strip().lower()
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value)):
+            raise serializers.ValidationError("Enter a hex SHA-256 digest.")
+        return value
+
+
+class VitalsQuerySerializer(serializers.Serializer):
+    """Query parameters for a pet's vitals series"""
+
+    ALL = 'all'
+    NO_BUCKET = 'none'
+    MAX_POINTS = 5000
+
+    metric = serializers.ChoiceField(choices=[ALL, *vitals.METRICS], default=ALL)
+    bucket = serializers.ChoiceField(choices=[NO_BUCKET, *vitals.BUCKETS], default=NO_BUCKET)
+    points = serializers.IntegerField(
+        min_value=3, max_value=MAX_POINTS, default=500,
+        help_text="Most points per metric for unbucketed series"
+    )
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        """Ensure the date range is not reversed"""
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError({"end": "End date must be on or after the start date."})
+        return data
+
+    def get_metrics(self):
+        metric = self.validated_data['metric']
+        return list(vitals.METRICS) if metric == self.ALL else [metric]
+
+
+class VaccinationSerializer(serializers.ModelSerializer):
+    pet_name = serializers.CharField(source='pet.name', read_only=True)
+    pet_species = serializers.CharField(source='pet.species', read_only=True)
+    vet_name = serializers.CharField(source='veterinarian.get_full_name', read_only=True)
+    days_until_due = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Vaccination
+        fields = [
+            'id', 'pet', 'pet_name', 'pet_species', 'veterinarian', 'vet_name',
+            'medical_record', 'vaccine', 'dose', 'batch_number', 'administered_at',
+            'next_due', 'days_until_due', 'notes', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class VaccinationCreateSerializer(serializers.ModelSerializer):
+    pet = serializers.PrimaryKeyRelatedField(queryset=PetProfile.objects.all(),help_text="Vaccinated pet")
+    medical_record = serializers.PrimaryKeyRelatedField(
+        queryset=MedicalRecord.objects.all(),
+        required=False,
+        allow_null=True,
+        help_text="Optional: the visit the dose was given at"
+    )
+    next_due = serializers.DateField(
+        required=False,
+        allow_null=True,
+        help_text="Leave empty to use the species' vaccine schedule"
+    )
+
+    class Meta:
+        model = Vaccination
+        fields = [
+            'id', 'pet', 'medical_record', 'vaccine', 'dose', 'batch_number',
+            'administered_at', 'next_due', 'notes'
+        ]
+        read_only_fields = ['id']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+
+        # Vets can only vaccinate pets they have seen, and link their own records
+        if request and request.user.is_authenticated:
+            self.fields['pet'].queryset = PetProfile.objects.filter(care_relationships__veterinarian=request.user)
+            self.fields['medical_record'].queryset = MedicalRecord.objects.filter(veterinarian=request.user)
+
+    def validate_administered_at(self, value):
+        """Ensure the dose was not given in the future"""
+        if value > timezone.now():
+            raise serializers.ValidationError("Administration time cannot be in the future.")
+        return value
+
+    def validate(self, data):
+        """Ensure the linked record is for the same pet"""
+        record = data.get('medical_record')
+        if record and record.pet_id != data['pet'].pk:
+            raise serializers.ValidationError({
+                "medical_record": "The medical record must be for the same pet as this vaccination."
+            })
+        return data
+
+
+class VaccinationUpdateSerializer(serializers.ModelSerializer):
+    next_due = serializers.DateField(
+        required=False,
+        allow_null=True,
+        help_text="Leave empty to use the species' vaccine schedule"
+    )
+
+    class Meta:
+        model = Vaccination
+        fields = ['vaccine', 'dose', 'batch_number', 'administered_at', 'next_due', 'notes']
+
+    # Changing these moves the schedule's due date
+    SCHEDULE_FIELDS = ['vaccine', 'dose', 'administered_at']
+
+    def validate_administered_at(self, value):
+        """Ensure the dose was not given in the future"""
+        if value > timezone.now():
+            raise serializers.ValidationError("Administration time cannot be in the future.")
+        return value
+
+    def update(self, instance, validated_data):
+        """Recompute next_due from the schedule when the dose changes, unless one is given"""
+        changed = any(
+            field in validated_data and validated_data[field] != getattr(instance, field)
+            for field in self.SCHEDULE_FIELDS
+        )
+        if changed and 'next_due' not in validated_data:
+            validated_data['next_due'] = None
+        return super().update(instance, validated_data)
+
+
+class VaccinationsDueQuerySerializer(serializers.Serializer):
+    """Query parameters for the vaccinations due list"""
+
+    MAX_DAYS = 365
+
+    days = serializers.IntegerField(min_value=0, max_value=MAX_DAYS, default=30, help_text="Look this many days ahead")
+    overdue = serializers.BooleanField(default=False, help_text="Also list doses that are already overdue")
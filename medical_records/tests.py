@@ -1,3 +1,784 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from accounts.models import CustomUser
+from appointments.models import Appointment, Consultation
+from notifications import digests
+from notifications.models import Notification
+from pets.models import CareRelationship, PetProfile
+from . import anomalies, search, vaccinations
+from .models import MedicalRecord, MedicalRecordRevision, TestResultUpload, Vaccination
+from .views import MedicalRecordDetailView
+from .vitals import lttb
+
+
+class MedicalRecordQueryCountTests(APITestCase):
+    """
+    Medical record endpoints must run a fixed number of queries regardless
+    of how many records they return.
+    """
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user(
+            'vet@example.com', 'password123', role=CustomUser.VETERINARIAN, first_name='Vera'
+        )
+        self.owner = CustomUser.objects.create_user(
+            'owner@example.com', 'password123', role=CustomUser.CLIENT, first_name='Otto'
+        )
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=4)
+
+    def add_records(self, count):
+        follow_up = timezone.now().date() + timedelta(days=14)
+        for i in range(count):
+            MedicalRecord.objects.create(
+                pet=self.pet, veterinarian=self.vet,
+                diagnosis='Otitis', treatment='Drops',
+                follow_up_required=True, follow_up_date=follow_up,
+            )
+
+    def assertConstantQueries(self, user, url, expected):
+        """Check `url` runs `expected` queries with both few and many rows"""
+        self.client.force_authenticate(user)
+        for count in (2, 6):
+            self.add_records(count)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def test_record_list(self):
+        self.assertConstantQueries(self.vet, '/vetcare/medical-records/', 1)
+        self.assertConstantQueries(self.owner, '/vetcare/medical-records/', 1)
+
+    def test_pet_history(self):
+        # Permission check loads the pet, then one query for the page
+        self.assertConstantQueries(self.owner, f'/vetcare/medical-records/pet/{self.pet.pk}/history/', 2)
+
+    def test_my_pets_records(self):
+        self.assertConstantQueries(self.owner, '/vetcare/medical-records/my-pets/', 1)
+
+    def test_recent_records(self):
+        self.assertConstantQueries(self.vet, '/vetcare/medical-records/recent/', 1)
+
+    def test_follow_ups(self):
+        self.assertConstantQueries(self.vet, '/vetcare/medical-records/follow-ups/', 1)
+
+    @skipUnless(connection.vendor == 'sqlite', "Query plan text is backend specific")
+    def test_follow_ups_use_partial_indexes(self):
+        self.add_records(2)
+        pending = MedicalRecord.objects.filter(follow_up_required=True, follow_up_date__gte=timezone.now().date())
+        for queryset, index in (
+            (pending.filter(veterinarian=self.vet), 'medrec_followup_vet_idx'),
+            (pending.filter(pet__owner=self.owner), 'medrec_followup_pet_idx'),
+        ):
+            plan = queryset.order_by('follow_up_date', 'pk')[:51].explain()
+            self.assertIn(f'USING INDEX {index}', plan)
+
+    def test_record_detail(self):
+        self.add_records(1)
+        record = MedicalRecord.objects.get()
+        self.client.force_authenticate(self.owner)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/vetcare/medical-records/{record.pk}/')
+        self.assertEqual(response.data['pet_owner_email'], self.owner.email)
+
+
+class MedicalSearchTests(APITestCase):
+    """
+    Search must rank matches, follow saves incrementally and only return
+    documents the user could already see through the list endpoints.
+    """
+
+    url = '/vetcare/medical-records/search/'
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.other_vet = CustomUser.objects.create_user('other@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.stranger = CustomUser.objects.create_user('stranger@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=1)
+
+    def add_record(self, vet, **fields):
+        values = {'diagnosis': 'Healthy', 'treatment': 'None'}
+        values.update(fields)
+        return MedicalRecord.objects.create(pet=self.pet, veterinarian=vet, **values)
+
+    def search(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(result['type'], result['id']) for result in response.data['results']]
+
+    def test_ranks_diagnosis_matches_first(self):
+        mention = self.add_record(self.vet, notes='Rule out parvovirus if vomiting continues')
+        diagnosis = self.add_record(self.vet, diagnosis='Parvovirus', treatment='Fluids')
+        self.add_record(self.vet, diagnosis='Otitis externa')
+
+        self.assertEqual(
+            self.search(self.vet, q='parvo'),
+            [('medical_record', diagnosis.pk), ('medical_record', mention.pk)],
+        )
+
+    def test_results_are_role_scoped(self):
+        mine = self.add_record(self.vet, diagnosis='Parvovirus')
+        self.add_record(self.other_vet, diagnosis='Parvovirus')
+
+        self.assertEqual(self.search(self.vet, q='parvovirus'), [('medical_record', mine.pk)])
+        self.assertEqual(len(self.search(self.owner, q='parvovirus')), 2)
+        self.assertEqual(self.search(self.stranger, q='parvovirus'), [])
+
+    def test_index_follows_updates_and_consultations(self):
+        record = self.add_record(self.vet, diagnosis='Dermatitis')
+        record.diagnosis = 'Ringworm'
+        record.save()
+
+        appointment = Appointment.objects.create(
+            client=self.owner, veterinarian=self.vet, pet=self.pet,
+            date=timezone.now().date(), reason='Itchy skin',
+        )
+        Appointment.objects.filter(pk=appointment.pk).update(status=Appointment.COMPLETED)
+        appointment.refresh_from_db()
+        consultation = Consultation.objects.create(
+            appointment=appointment, veterinarian=self.vet, diagnosis='Ringworm', notes='Fungal culture sent',
+        )
+
+        self.assertEqual(self.search(self.vet, q='dermatitis'), [])
+        self.assertEqual(
+            sorted(self.search(self.owner, q='ringworm')),
+            [('consultation', consultation.pk), ('medical_record', record.pk)],
+        )
+        self.assertEqual(self.search(self.owner, q='fungal', type='records'), [])
+
+    def test_index_follows_deletes_and_owner_changes(self):
+        kept, deleted = self.add_record(self.vet, diagnosis='Parvovirus'), self.add_record(self.vet, diagnosis='Parvovirus')
+        appointment = Appointment.objects.create(client=self.owner, veterinarian=self.vet, pet=self.pet, reason='Vomiting')
+        Appointment.objects.filter(pk=appointment.pk).update(status=Appointment.COMPLETED)
+        Consultation.objects.create(appointment=Appointment.objects.get(pk=appointment.pk), veterinarian=self.vet,
+                                    diagnosis='Parvovirus', notes='Isolated')
+
+        deleted.delete()
+        Consultation.objects.all().delete()
+        self.assertEqual([(kind, pk) for kind, pk, _, _ in search.search(self.vet, 'parvovirus')], [(search.RECORD, kept.pk)])
+
+        self.pet.owner = self.stranger
+        self.pet.save()
+        self.assertEqual(self.search(self.owner, q='parvovirus'), [])
+        self.assertEqual(self.search(self.stranger, q='parvovirus'), [('medical_record', kept.pk)])
+
+    def test_stale_hits_do_not_use_up_the_limit(self):
+        stale = [self.add_record(self.vet, diagnosis='Parvovirus') for _ in range(3)]
+        visible = self.add_record(self.vet, diagnosis='Parvovirus')
+        # A bypassing update leaves the index scoped to the old vet
+        MedicalRecord.objects.filter(pk__in=[record.pk for record in stale]).update(veterinarian=self.other_vet)
+        self.assertEqual(self.search(self.vet, q='parvovirus', limit=1), [('medical_record', visible.pk)])
+
+    def test_query_count(self):
+        for _ in range(3):
+            self.add_record(self.vet, diagnosis='Parvovirus')
+        self.client.force_authenticate(self.vet)
+        # FTS match, then one query to load the records
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'q': 'parvovirus'})
+        self.assertEqual(response.data['count'], 3)
+
+    def test_rejects_empty_query(self):
+        self.client.force_authenticate(self.vet)
+        self.assertEqual(self.client.get(self.url, {'q': '  ?! '}).status_code, 400)
+
+
+class MedicalHistoryExportTests(APITestCase):
+    """Exports must stream every record in a constant number of queries"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=12)
+        for i in range(7):
+            MedicalRecord.objects.create(
+                pet=self.pet, veterinarian=self.vet, diagnosis=f'Visit {i}, "annual"', treatment='None'
+            )
+        self.history_url = f'/vetcare/medical-records/pet/{self.pet.pk}/history/'
+        self.client.force_authenticate(self.owner)
+
+    def test_ndjson_export(self):
+        # Permission check, then a single streamed query
+        with self.assertNumQueries(2):
+            response = self.client.get(self.history_url, {'export': 'ndjson'})
+            body = response.getvalue().decode()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]['pet_name'], 'Rex')
+
+    def test_gzipped_csv_export(self):
+        response = self.client.get('/vetcare/medical-records/my-pets/', {'export': 'csv', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('my-pets-medical-records.csv.gz', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.getvalue()).decode())))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual({row['diagnosis'] for row in rows}, {f'Visit {i}, "annual"' for i in range(7)})
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(self.history_url, {'export': 'xml'}).status_code, 400)
+
+
+class TestResultUploadTests(APITestCase):
+    """Chunked, resumable uploads of a record's test results"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.staging = os.path.join(media.name, 'partial')
+        settings = override_settings(
+            MEDIA_ROOT=media.name, TEST_RESULT_UPLOAD_DIR=self.staging, TEST_RESULT_UPLOAD_MAX_CHUNK_SIZE=1024
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=5)
+        self.record = MedicalRecord.objects.create(
+            pet=self.pet, veterinarian=self.vet, diagnosis='Anaemia', treatment='Iron'
+        )
+        self.content = bytes(range(256)) * 10
+        self.client.force_authenticate(self.vet)
+
+    def start(self, **extra):
+        data = {'filename': 'bloods.pdf', 'size': len(self.content), **extra}
+        response = self.client.post(f'/vetcare/medical-records/{self.record.pk}/uploads/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response['Location']
+
+    def send(self, url, offset, chunk, checksum=None):
+        return self.client.generic(
+            'PATCH', url, chunk, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_CHECKSUM=f'sha256 {checksum or hashlib.sha256(chunk).hexdigest()}',
+        )
+
+    def test_upload_in_chunks(self):
+        url = self.start(sha256=hashlib.sha256(self.content).hexdigest())
+        for offset in range(0, len(self.content), 1000):
+            response = self.send(url, offset, self.content[offset:offset + 1000])
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(int(response['Upload-Offset']), min(offset + 1000, len(self.content)))
+
+        self.assertEqual(response.data['status'], TestResultUpload.COMPLETED)
+        self.record.refresh_from_db()
+        with self.record.test_results.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertTrue(self.record.test_results.name.endswith('bloods.pdf'))
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def test_replacing_file_keeps_revision_and_deletes_old_file(self):
+        url = self.start()
+        for offset in range(0, len(self.content), 1000):
+            self.send(url, offset, self.content[offset:offset + 1000])
+        self.record.refresh_from_db()
+        first = self.record.test_results.name
+
+        url = self.start()
+        with self.captureOnCommitCallbacks(execute=True):
+            for offset in range(0, len(self.content), 1000):
+                self.send(url, offset, self.content[offset:offset + 1000])
+        self.record.refresh_from_db()
+        self.assertNotEqual(self.record.test_results.name, first)
+        self.assertFalse(self.record.test_results.storage.exists(first))
+        self.assertTrue(self.record.test_results.storage.exists(self.record.test_results.name))
+
+        revisions = list(self.record.revisions.order_by('number'))
+        self.assertEqual([revision.changed_fields for revision in revisions], [['test_results'], ['test_results']])
+        self.assertEqual(revisions[1].changes['test_results'], first)
+        self.assertEqual(revisions[1].edited_by, self.vet)
+
+    def test_bad_chunk_checksum_keeps_offset(self):
+        url = self.start()
+        self.send(url, 0, self.content[:1000])
+        response = self.send(url, 1000, self.content[1000:2000], checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(int(response['Upload-Offset']), 1000)
+        self.assertEqual(os.path.getsize(os.path.join(self.staging, f'{url.rstrip("/").split("/")[-1]}.part')), 1000)
+
+    def test_resume_after_interruption(self):
+        url = self.start()
+        self.send(url, 0, self.content[:1000])
+
+        # The client lost track: it asks where to resume, and a replayed chunk is refused
+        self.assertEqual(self.send(url, 0, self.content[:1000]).status_code, 409)
+        offset = self.client.get(url).data['received_size']
+        self.assertEqual(offset, 1000)
+
+        for start in range(offset, len(self.content), 1000):
+            self.send(url, start, self.content[start:start + 1000])
+        self.record.refresh_from_db()
+        with self.record.test_results.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_wrong_file_checksum_discards_upload(self):
+        url = self.start(sha256='0' * 64)
+        for offset in range(0, len(self.content), 1000):
+            response = self.send(url, offset, self.content[offset:offset + 1000])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).data['status'], TestResultUpload.ABORTED)
+        self.record.refresh_from_db()
+        self.assertFalse(self.record.test_results)
+
+    def test_chunk_size_limit(self):
+        url = self.start()
+        self.assertEqual(self.send(url, 0, self.content[:2000]).status_code, 400)
+
+    def test_only_record_vet_can_upload(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.post(
+            f'/vetcare/medical-records/{self.record.pk}/uploads/', {'filename': 'x.pdf', 'size': 10}, format='json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_abort(self):
+        url = self.start()
+        self.send(url, 0, self.content[:1000])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(os.listdir(self.staging), [])
+        self.assertEqual(self.send(url, 1000, self.content[1000:2000]).status_code, 409)
+
+
+class TestResultsDownloadTests(APITestCase):
+    """Conditional and range downloads of a record's test results"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.other = CustomUser.objects.create_user('other@example.com', 'password123', role=CustomUser.CLIENT)
+        pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=5)
+        self.record = MedicalRecord.objects.create(pet=pet, veterinarian=self.vet, diagnosis='Anaemia', treatment='Iron')
+        self.content = bytes(range(256)) * 40
+        self.record.test_results.save('bloods.pdf', ContentFile(self.content))
+        self.url = f'/vetcare/medical-records/{self.record.pk}/test-results/'
+        self.client.force_authenticate(self.owner)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.getvalue(), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-299')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-299/{len(self.content)}')
+        self.assertEqual(response.getvalue(), self.content[100:300])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(response.getvalue(), self.content[-10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.getvalue(), self.content)
+
+    def test_only_participants(self):
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class PetVitalsTests(APITestCase):
+    """Charting series for weight and temperature"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=5)
+        start = timezone.make_aware(timezone.datetime(2025, 1, 6, 10))
+        MedicalRecord.objects.bulk_create([
+            MedicalRecord(
+                pet=self.pet, veterinarian=self.vet, diagnosis='Checkup', treatment='None',
+                visit_date=start + timedelta(days=3 * i),
+                # A single spike at visit 50; temperature only every other visit
+                weight=30 if i == 50 else 20 + i / 100,
+                temperature=38.5 if i % 2 == 0 else None,
+            )
+            for i in range(120)
+        ])
+        self.url = f'/vetcare/medical-records/pet/{self.pet.pk}/vitals/'
+        self.client.force_authenticate(self.owner)
+
+    def test_raw_series_downsampled(self):
+        # Permission check, then one values_list query
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'points': 20})
+        self.assertEqual(response.status_code, 200)
+        weight = response.data['series']['weight']
+        self.assertEqual(weight['count'], 120)
+        self.assertEqual(len(weight['points']), 20)
+        self.assertIn(30.0, [point['value'] for point in weight['points']])
+        self.assertEqual(weight['points'][0]['value'], 20.0)
+        self.assertEqual(response.data['series']['temperature']['count'], 60)
+
+    def test_monthly_buckets(self):
+        response = self.client.get(self.url, {'bucket': 'month', 'metric': 'weight', 'end': '2025-02-28'})
+        self.assertEqual(list(response.data['series']), ['weight'])
+        buckets = response.data['series']['weight']['buckets']
+        self.assertEqual([str(bucket['start']) for bucket in buckets], ['2025-01-01', '2025-02-01'])
+        self.assertEqual(buckets[0]['count'], 9)
+        self.assertEqual((buckets[0]['min'], buckets[0]['max']), (20.0, 20.08))
+        self.assertEqual(buckets[0]['mean'], 20.04)
+
+    def test_weekly_buckets_start_on_monday(self):
+        response = self.client.get(self.url, {'bucket': 'week', 'metric': 'temperature', 'end': '2025-01-19'})
+        buckets = response.data['series']['temperature']['buckets']
+        self.assertEqual([str(bucket['start']) for bucket in buckets], ['2025-01-06', '2025-01-13'])
+
+    def test_other_clients_cannot_read(self):
+        other = CustomUser.objects.create_user('other@example.com', 'password123', role=CustomUser.CLIENT)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_lttb_keeps_ends_and_extremes(self):
+        points = [(x, 100 if x == 37 else 0) for x in range(100)]
+        sampled = lttb(points, 10)
+        self.assertEqual(len(sampled), 10)
+        self.assertEqual((sampled[0], sampled[-1]), (points[0], points[-1]))
+        self.assertIn((37, 100), sampled)
+        self.assertEqual(lttb(points[:5], 10), points[:5])
+
+
+class VitalsAnomalyTests(APITestCase):
+    """Batch scoring of vitals against species ranges and the pet's own history"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.dogs = [
+            PetProfile.objects.create(owner=self.owner, name=f'Dog {i}', species=PetProfile.DOG, age=3)
+            for i in range(4)
+        ]
+        self.cat = PetProfile.objects.create(owner=self.owner, name='Tom', species=PetProfile.CAT, age=3)
+        start = timezone.now() - timedelta(days=400)
+        records = []
+        for i in range(12):
+            for n, dog in enumerate(self.dogs):
+                records.append(self.record(
+                    dog, start + timedelta(days=30 * i), weight=20 + n + (i % 3) / 10, temperature=38.4 + (i % 4) / 10
+                ))
+        # Too few cats for a species range; only the change check applies
+        records += [self.record(self.cat, start + timedelta(days=30 * i), weight=4.2, temperature=38.6) for i in range(3)]
+        MedicalRecord.objects.bulk_create(records)
+
+    def record(self, pet, visit_date, **vitals):
+        return MedicalRecord(
+            pet=pet, veterinarian=self.vet, diagnosis='Checkup', treatment='None', visit_date=visit_date, **vitals
+        )
+
+    def add(self, pet, weight, temperature):
+        return MedicalRecord.objects.create(
+            pet=pet, veterinarian=self.vet, diagnosis='Checkup', treatment='None',
+            weight=Decimal(str(weight)), temperature=Decimal(str(temperature)),
+        )
+
+    def test_scores_every_record(self):
+        scored, flagged = anomalies.run()
+        self.assertEqual((scored, flagged), (51, 0))
+        self.assertFalse(MedicalRecord.objects.filter(anomaly_scored_at__isnull=True).exists())
+        self.assertLess(MedicalRecord.objects.filter(pet=self.dogs[0]).latest('visit_date').anomaly_score, anomalies.THRESHOLD)
+
+    def test_flags_fever_and_weight_jump(self):
+        anomalies.run()
+        fever = self.add(self.dogs[0], weight=20.1, temperature=41.5)
+        jump = self.add(self.dogs[1], weight=26.5, temperature=38.5)
+        cat = self.add(self.cat, weight=6.0, temperature=38.6)
+
+        # Only the three pets with new records are rescored
+        scored, flagged = anomalies.run()
+        self.assertEqual((scored, flagged), (13 + 13 + 4, 3))
+
+        fever.refresh_from_db()
+        jump.refresh_from_db()
+        cat.refresh_from_db()
+        self.assertEqual(fever.anomaly_reasons, ['temperature'])
+        self.assertIn('weight_change', jump.anomaly_reasons)
+        self.assertEqual(cat.anomaly_reasons, ['weight_change'])
+        self.assertGreater(fever.anomaly_score, anomalies.THRESHOLD)
+
+    def test_edit_queues_rescore(self):
+        anomalies.run()
+        record = MedicalRecord.objects.filter(pet=self.dogs[2]).first()
+        record.temperature = 41
+        record.save()
+        self.assertIsNone(record.anomaly_scored_at)
+        self.assertEqual(anomalies.run(), (12, 1))
+
+    def test_edit_during_run_stays_queued(self):
+        record = MedicalRecord.objects.filter(pet=self.dogs[2]).first()
+        # An edit saved after the run loaded the vitals carries a later updated_at
+        MedicalRecord.objects.filter(pk=record.pk).update(
+            temperature=41, updated_at=timezone.now() + timedelta(minutes=1)
+        )
+        anomalies.run()
+        record.refresh_from_db()
+        self.assertIsNone(record.anomaly_scored_at)
+        self.assertIsNone(record.anomaly_score)
+        self.assertEqual(MedicalRecord.objects.filter(anomaly_scored_at__isnull=True).count(), 1)
+
+    def test_edit_without_vitals_change_keeps_score(self):
+        anomalies.run()
+        record = MedicalRecord.objects.filter(pet=self.dogs[2]).first()
+        record.notes = 'Owner called back'
+        record.temperature = Decimal(str(record.temperature))
+        record.save()
+        record.refresh_from_db()
+        self.assertIsNotNone(record.anomaly_scored_at)
+        self.assertEqual(anomalies.run(), (0, 0))
+
+    def test_flagged_endpoint(self):
+        anomalies.run()
+        fever = self.add(self.dogs[0], weight=20.1, temperature=41.5)
+        self.add(self.dogs[3], weight=23.1, temperature=42.5)
+        anomalies.run()
+
+        self.client.force_authenticate(self.vet)
+        results = self.client.get('/vetcare/medical-records/flagged/').data['results']
+        self.assertEqual(len(results), 2)
+        self.assertGreater(results[0]['anomaly_score'], results[1]['anomaly_score'])
+        self.assertEqual(results[1]['id'], fever.pk)
+
+        results = self.client.get('/vetcare/medical-records/flagged/', {'min_score': results[0]['anomaly_score']}).data['results']
+        self.assertEqual(len(results), 1)
+
+        other = CustomUser.objects.create_user('other@example.com', 'password123', role=CustomUser.CLIENT)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/vetcare/medical-records/flagged/').data['results'], [])
+
+    def test_relative_change(self):
+        pets = np.array([1, 1, 1, 2, 2])
+        weights = np.array([10.0, np.nan, 12.0, 5.0, 4.0])
+        change = anomalies.relative_change(pets, weights)
+        self.assertTrue(np.isnan(change[[0, 1, 3]]).all())
+        self.assertAlmostEqual(change[2], 0.2)
+        self.assertAlmostEqual(change[4], -0.2)
+
+
+class MedicalRecordRevisionTests(APITestCase):
+    """Edits are logged as diffs of the changed fields and past versions rebuilt from them"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=2)
+        self.notes = '\n'.join(f"Line {number} of the examination notes." for number in range(40))
+        self.record = MedicalRecord.objects.create(
+            pet=self.pet, veterinarian=self.vet, diagnosis='Otitis', treatment='Ear drops',
+            notes=self.notes, weight=Decimal('12.50'),
+        )
+        self.url = f'/vetcare/medical-records/{self.record.pk}/'
+
+    def test_edits_store_only_changed_fields(self):
+        self.client.force_authenticate(self.vet)
+        edited_notes = self.notes.replace('Line 20 ', 'Line twenty ')
+        self.client.patch(self.url, {'diagnosis': 'Otitis externa', 'notes': edited_notes}, format='json')
+        self.client.patch(self.url, {'weight': '13.10', 'treatment': 'Ear drops'}, format='json')
+        # Nothing changed: no revision
+        self.client.patch(self.url, {'diagnosis': 'Otitis externa'}, format='json')
+
+        first, second = MedicalRecordRevision.objects.filter(record=self.record).order_by('number')
+        self.assertEqual(first.edited_by, self.vet)
+        self.assertEqual(first.changed_fields, ['diagnosis', 'notes'])
+        self.assertEqual(first.changes['diagnosis'], 'Otitis')
+        # A one-line edit of long text is kept as a patch, not a copy
+        self.assertEqual(first.changes['notes'], {'patch': [[20, 21, 'Line 20 of the examination notes.\n']]})
+        self.assertEqual(second.changes, {'weight': '12.50'})
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.revision_count, 2)
+
+        response = self.client.get(f'{self.url}revisions/')
+        self.assertEqual([row['number'] for row in response.data['results']], [2, 1])
+
+    def test_edits_lock_the_record(self):
+        # Two concurrent edits must not both number their revision from the same loaded row
+        for method, locked in [('get', False), ('patch', True)]:
+            view = MedicalRecordDetailView(request=getattr(APIRequestFactory(), method)(self.url))
+            self.assertEqual(view.get_queryset().query.select_for_update, locked)
+
+    def test_rebuild_past_versions(self):
+        self.record.diagnosis = 'Otitis externa'
+        self.record.notes = 'Rewritten'
+        self.record.save()
+        self.record.notes = self.notes + '\nRecheck in two weeks.'
+        self.record.weight = None
+        self.record.save()
+
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(f'{self.url}versions/1/')
+        self.assertEqual(response.data['latest_version'], 3)
+        self.assertEqual(response.data['record']['diagnosis'], 'Otitis')
+        self.assertEqual(response.data['record']['notes'], self.notes)
+        self.assertEqual(response.data['record']['weight'], '12.50')
+
+        response = self.client.get(f'{self.url}versions/2/')
+        self.assertEqual(response.data['record']['notes'], 'Rewritten')
+        self.assertEqual(response.data['record']['diagnosis'], 'Otitis externa')
+
+        response = self.client.get(f'{self.url}versions/3/')
+        self.assertIsNone(response.data['record']['weight'])
+        self.assertEqual(self.client.get(f'{self.url}versions/4/').status_code, 404)
+
+        # Append-only
+        revision = self.record.revisions.first()
+        revision.changes = {}
+        with self.assertRaises(Exception):
+            revision.save()
+
+        stranger = CustomUser.objects.create_user('other@example.com', 'password123', role=CustomUser.CLIENT)
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get(f'{self.url}versions/1/').status_code, 403)
+        self.assertEqual(self.client.get(f'{self.url}revisions/').status_code, 403)
+
+    def test_edit_costs_one_insert(self):
+        self.client.force_authenticate(self.vet)
+        with CaptureQueriesContext(connection) as unchanged:
+            self.client.patch(self.url, {'diagnosis': 'Otitis'}, format='json')
+        with CaptureQueriesContext(connection) as edited:
+            self.client.patch(self.url, {'diagnosis': 'Otitis media'}, format='json')
+        self.assertEqual(len(edited), len(unchanged) + 1)
+        table = MedicalRecordRevision._meta.db_table
+        self.assertEqual(len([query for query in edited if query['sql'].startswith(f'INSERT INTO "{table}"')]), 1)
+
+
+class VaccinationTests(APITestCase):
+    """Due dates from the species schedule, the due lists and reminders"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.dog = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=2)
+        self.today = timezone.now().date()
+
+    def vaccinate(self, vaccine, dose, days_ago, pet=None, **fields):
+        return Vaccination.objects.create(
+            pet=pet or self.dog, veterinarian=self.vet, vaccine=vaccine, dose=dose,
+            administered_at=timezone.now() - timedelta(days=days_ago), **fields
+        )
+
+    def test_next_due_follows_schedule(self):
+        first = self.vaccinate('dhpp', 1, days_ago=30)
+        self.assertEqual(first.next_due, first.administered_date + timedelta(days=21))
+
+        # The second dose settles the first
+        second = self.vaccinate('DHPP', 2, days_ago=5)
+        first.refresh_from_db()
+        self.assertIsNone(first.next_due)
+        self.assertEqual(second.next_due, second.administered_date + timedelta(days=21))
+
+        # Doses past the last listed one repeat its interval
+        booster = self.vaccinate('Rabies', 5, days_ago=1)
+        self.assertEqual(booster.next_due, booster.administered_date + timedelta(days=3 * 365))
+
+        # No schedule: only an explicit date
+        self.assertIsNone(self.vaccinate('Bordetella', 1, days_ago=1).next_due)
+        explicit = self.vaccinate('Bordetella', 2, days_ago=1, next_due=self.today + timedelta(days=180))
+        self.assertEqual(explicit.next_due, self.today + timedelta(days=180))
+        self.assertTrue(CareRelationship.has_treated(self.vet, self.dog))
+
+    def test_due_lists(self):
+        soon = self.vaccinate('Rabies', 1, days_ago=355)
+        self.vaccinate('DHPP', 3, days_ago=30)
+        overdue = self.vaccinate('Leptospirosis', 1, days_ago=40)
+        cat = PetProfile.objects.create(owner=self.owner, name='Tom', species=PetProfile.CAT, age=2)
+        self.vaccinate('FeLV', 1, days_ago=10, pet=cat)
+
+        self.client.force_authenticate(self.owner)
+        response = self.client.get('/vetcare/medical-records/vaccinations/due/', {'days': 30})
+        self.assertEqual([row['vaccine'] for row in response.data['results']], ['Rabies', 'FeLV'])
+        self.assertEqual(response.data['results'][0]['days_until_due'], (soon.next_due - self.today).days)
+
+        response = self.client.get('/vetcare/medical-records/vaccinations/due/', {'days': 30, 'overdue': 'true'})
+        self.assertEqual(response.data['results'][0]['id'], overdue.pk)
+        self.assertEqual(self.client.get('/vetcare/medical-records/vaccinations/due/', {'days': 'x'}).status_code, 400)
+
+        self.client.force_authenticate(self.vet)
+        response = self.client.get('/vetcare/medical-records/vaccinations/due/', {'days': 365})
+        self.assertEqual(len(response.data['results']), 3)
+
+        other = CustomUser.objects.create_user('other@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/vetcare/medical-records/vaccinations/due/').data['results'], [])
+
+    def test_create_and_update(self):
+        self.client.force_authenticate(self.vet)
+        url = '/vetcare/medical-records/vaccinations/create/'
+        # Only pets the vet has seen
+        response = self.client.post(url, {'pet': self.dog.pk, 'vaccine': 'Rabies'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        CareRelationship.record(self.vet.pk, self.dog.pk, self.today)
+        response = self.client.post(url, {'pet': self.dog.pk, 'vaccine': 'Rabies'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        vaccination = Vaccination.objects.get(pk=response.data['id'])
+        self.assertEqual(vaccination.next_due, self.today + timedelta(days=365))
+
+        detail = f'/vetcare/medical-records/vaccinations/{vaccination.pk}/'
+        response = self.client.patch(detail, {'dose': 2}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        vaccination.refresh_from_db()
+        self.assertEqual(vaccination.next_due, self.today + timedelta(days=3 * 365))
+
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get(detail).data['vaccine'], 'Rabies')
+        self.assertEqual(self.client.patch(detail, {'dose': 3}, format='json').status_code, 403)
+        self.assertEqual(self.client.post(url, {'pet': self.dog.pk, 'vaccine': 'Rabies'}, format='json').status_code, 403)
+        self.assertEqual(len(self.client.get(f'/vetcare/medical-records/pet/{self.dog.pk}/vaccinations/').data['results']), 1)
+
+    def test_reminders_sent_once(self):
+        self.vaccinate('Rabies', 1, days_ago=355)
+        self.vaccinate('DHPP', 3, days_ago=30)
+        self.assertEqual(vaccinations.send_reminders(days=14, chunk_size=1), 1)
+        self.assertEqual(vaccinations.send_reminders(days=14), 0)
+
+        # A lone reminder opens the owner's window and is delivered at once
+        self.assertEqual(digests.flush(timezone.now() + timedelta(days=1)), (0, 0))
+        notification = Notification.objects.get()
+        self.assertEqual((notification.recipient, notification.notification_type), (self.owner, 'vaccination'))
+        self.assertIn('Rabies', notification.title)
+
+        # A later window picks up the next dose
+        self.assertEqual(vaccinations.send_reminders(days=400), 1)
+
+    @skipUnless(connection.vendor == 'sqlite', "Query plan text is backend specific")
+    def test_sweep_uses_due_index(self):
+        plan = vaccinations.due(Vaccination.objects.all(), 14)[:500].explain()
+        self.assertIn('USING INDEX vacc_due_idx', plan)
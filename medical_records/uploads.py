@@ -0,0 +1,213 @@
+"""
+Chunked, resumable uploads of test result files.
+
+A client opens a ``TestResultUpload`` session with the file's name and size,
+then sends the file in order as raw chunks, each carrying its offset and a
+SHA-256 of the chunk. Chunks are streamed from the request straight into a
+staging file under ``TEST_RESULT_UPLOAD_DIR``, so memory use is bounded by
+``READ_SIZE`` whatever the file size. A chunk whose checksum does not match
+is cut off again, leaving the session at its previous offset; after an
+interruption the client asks for the current offset and carries on from it.
+
+Once the last byte arrives the staging file is handed to the record's
+storage (a rename on ``FileSystemStorage``) and set as its ``test_results``
+through ``save()``, so the change is kept in the revision history. The file
+it replaces is deleted once that transaction commits.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MedicalRecord, TestResultUpload
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+READ_SIZE = 64 * 1024
+
+CHECKSUM_ALGORITHM = 'sha256'
+
+
+class UploadError(Exception):
+    """A chunk was rejected; the session keeps its previous offset"""
+
+    status_code = 400
+
+
+class OffsetMismatch(UploadError):
+    status_code = 409
+
+
+class UploadBusy(UploadError):
+    status_code = 409
+
+
+class StagedFile(File):
+    """
+    Staging file passed to storage.save(). Exposing temporary_file_path()
+    lets FileSystemStorage move it into place instead of copying it.
+    """
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def staging_dir():
+    return str(getattr(settings, 'TEST_RESULT_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'partial')))
+
+
+def staging_path(upload):
+    return os.path.join(staging_dir(), f'{upload.pk}.part')
+
+
+def max_size():
+    return getattr(settings, 'TEST_RESULT_UPLOAD_MAX_SIZE', 200 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'TEST_RESULT_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def parse_checksum(header):
+    """Return the hex digest from an ``Upload-Checksum: sha256 <hex>`` header"""
+    algorithm, _, digest = (header or '').strip().partition(' ')
+    digest = digest.strip().lower()
+    if algorithm.lower() != CHECKSUM_ALGORITHM or len(digest) != 64:
+        raise UploadError(f"Upload-Checksum must be '{CHECKSUM_ALGORITHM} <hex digest>'.")
+    try:
+        int(digest, 16)
+    except ValueError:
+        raise UploadError(f"Upload-Checksum must be '{CHECKSUM_ALGORITHM} <hex digest>'.")
+    return digest
+
+
+def write_chunk(upload, offset, length, stream, checksum):
+    """
+    Append `length` bytes read from `stream` at `offset` and return the new
+    offset. The chunk is only kept if its SHA-256 equals `checksum`; the
+    session is finalized when this chunk completes the file.
+    """
+    if upload.status != TestResultUpload.ACTIVE:
+        raise OffsetMismatch(f"This upload is {upload.status}.")
+    if length <= 0:
+        raise UploadError("The chunk is empty.")
+    if length > max_chunk_size():
+        raise UploadError(f"Chunks may be at most {max_chunk_size()} bytes.")
+
+    os.makedirs(staging_dir(), exist_ok=True)
+    path = staging_path(upload)
+    with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as part:
+        _lock(part)
+
+        # Another request may have moved the session on while this one waited
+        upload.refresh_from_db(fields=['received_size', 'status'])
+        if upload.status != TestResultUpload.ACTIVE:
+            raise OffsetMismatch(f"This upload is {upload.status}.")
+        if offset != upload.received_size:
+            raise OffsetMismatch(f"Expected a chunk at offset {upload.received_size}.")
+        if offset + length > upload.size:
+            raise UploadError(f"The chunk ends past the declared size of {upload.size} bytes.")
+
+        # Drop any bytes left over from an interrupted chunk
+        part.truncate(offset)
+        part.seek(offset)
+
+        digest = hashlib.sha256()
+        remaining = length
+        while remaining:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            part.write(data)
+            digest.update(data)
+            remaining -= len(data)
+
+        if remaining or digest.hexdigest() != checksum:
+            part.truncate(offset)
+            if remaining:
+                raise UploadError(f"The chunk ended after {length - remaining} of {length} bytes.")
+            raise UploadError("The chunk checksum does not match; send it again.")
+
+        part.flush()
+        os.fsync(part.fileno())
+        upload.received_size = offset + length
+        TestResultUpload.objects.filter(pk=upload.pk).update(
+            received_size=upload.received_size, updated_at=timezone.now()
+        )
+
+        if upload.is_complete:
+            _finish(upload, part)
+    return upload.received_size
+
+
+def abort(upload):
+    """Mark the session aborted and delete what was staged"""
+    TestResultUpload.objects.filter(pk=upload.pk).update(
+        status=TestResultUpload.ABORTED, updated_at=timezone.now()
+    )
+    upload.status = TestResultUpload.ABORTED
+    remove_file(staging_path(upload))
+
+
+def _finish(upload, part):
+    """Verify the whole file if a checksum was given, then attach it to the record"""
+    if upload.sha256:
+        part.seek(0)
+        digest = hashlib.sha256()
+        for data in iter(lambda: part.read(READ_SIZE), b''):
+            digest.update(data)
+        if digest.hexdigest() != upload.sha256:
+            abort(upload)
+            raise UploadError("The file checksum does not match; the upload was discarded.")
+
+    field = MedicalRecord._meta.get_field('test_results')
+    name = field.generate_filename(upload.record, upload.filename)
+    with StagedFile(staging_path(upload), upload.filename) as staged:
+        name = field.storage.save(name, staged, max_length=field.max_length)
+
+    try:
+        with transaction.atomic():
+            # save() on the locked row, so the replaced file lands in the revision history
+            record = MedicalRecord.objects.select_for_update().get(pk=upload.record_id)
+            replaced = record.test_results.name
+            record.test_results = name
+            record.edited_by = upload.uploaded_by
+            record.save(update_fields=['test_results', 'updated_at'])
+            TestResultUpload.objects.filter(pk=upload.pk).update(
+                status=TestResultUpload.COMPLETED, updated_at=timezone.now()
+            )
+            if replaced and replaced != name:
+                transaction.on_commit(lambda: field.storage.delete(replaced))
+    except Exception:
+        field.storage.delete(name)
+        raise
+    upload.status = TestResultUpload.COMPLETED
+    remove_file(staging_path(upload))
+
+
+def _lock(part):
+    """Serialize writers of one session; a second concurrent chunk is refused"""
+    if fcntl is None:
+        return
+    try:
+        fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise UploadBusy("Another chunk for this upload is still being written.")
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -5,8 +5,21 @@ from .views import (
     MedicalRecordCreateView,
     PetMedicalHistoryView,
     MyPetsMedicalRecordsView,
+    PetVitalsView,
     RecentMedicalRecordsView,
     FollowUpRequiredView,
+    FlaggedVitalsView,
+    MedicalSearchView,
+    MedicalRecordRevisionListView,
+    MedicalRecordVersionView,
+    MedicalRecordTestResultsView,
+    TestResultUploadCreateView,
+    TestResultUploadView,
+    VaccinationListView,
+    VaccinationCreateView,
+    VaccinationDetailView,
+    PetVaccinationsView,
+    VaccinationsDueView,
 )
 
 app_name = 'medical_records'
@@ -17,8 +30,24 @@ urlpatterns = [
     path('<int:pk>/', MedicalRecordDetailView.as_view(), name='medical-record-detail'),
     
     path('pet/<int:pet_id>/history/', PetMedicalHistoryView.as_view(), name='pet-medical-history'),
+    path('pet/<int:pet_id>/vitals/', PetVitalsView.as_view(), name='pet-vitals'),
     path('my-pets/', MyPetsMedicalRecordsView.as_view(), name='my-pets-records'),
 
     path('recent/', RecentMedicalRecordsView.as_view(), name='recent-records'),
     path('follow-ups/', FollowUpRequiredView.as_view(), name='follow-up-required'),
+    path('flagged/', FlaggedVitalsView.as_view(), name='flagged-records'),
+    path('search/', MedicalSearchView.as_view(), name='medical-search'),
+
+    path('<int:pk>/revisions/', MedicalRecordRevisionListView.as_view(), name='medical-record-revisions'),
+    path('<int:pk>/versions/<int:version>/', MedicalRecordVersionView.as_view(), name='medical-record-version'),
+
+    path('<int:pk>/test-results/', MedicalRecordTestResultsView.as_view(), name='medical-record-test-results'),
+    path('<int:pk>/uploads/', TestResultUploadCreateView.as_view(), name='test-result-upload-create'),
+    path('uploads/<uuid:upload_id>/', TestResultUploadView.as_view(), name='test-result-upload'),
+
+    path('vaccinations/', VaccinationListView.as_view(), name='vaccination-list'),
+    path('vaccinations/create/', VaccinationCreateView.as_view(), name='vaccination-create'),
+    path('vaccinations/due/', VaccinationsDueView.as_view(), name='vaccinations-due'),
+    path('vaccinations/<int:pk>/', VaccinationDetailView.as_view(), name='vaccination-detail'),
+    path('pet/<int:pet_id>/vaccinations/', PetVaccinationsView.as_view(), name='pet-vaccinations'),
 ]
\ No newline at end of file
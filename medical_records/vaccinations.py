@@ -0,0 +1,118 @@
+"""
+Vaccination due dates and reminders.
+
+A dose's next due date is worked out once, when it is saved, from the
+species' VaccineSchedule and stored in ``Vaccination.next_due``; recording
+a later dose of the same vaccine clears it on the earlier ones. Every "what
+is due" question - a vet's or a client's list, the reminder sweep over all
+patients - is then a range scan over the partial ``next_due`` indexes
+instead of replaying each pet's history against the schedule.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from pets.models import PetProfile
+from .models import Vaccination, VaccineSchedule
+
+
+# (species, vaccine, dose, days to the next dose) installed by the 0008 migration
+DEFAULT_SCHEDULE = [
+    (PetProfile.DOG, 'DHPP', 1, 21),
+    (PetProfile.DOG, 'DHPP', 2, 21),
+    (PetProfile.DOG, 'DHPP', 3, 365),
+    (PetProfile.DOG, 'DHPP', 4, 3 * 365),
+    (PetProfile.DOG, 'Rabies', 1, 365),
+    (PetProfile.DOG, 'Rabies', 2, 3 * 365),
+    (PetProfile.DOG, 'Leptospirosis', 1, 21),
+    (PetProfile.DOG, 'Leptospirosis', 2, 365),
+    (PetProfile.CAT, 'FVRCP', 1, 21),
+    (PetProfile.CAT, 'FVRCP', 2, 21),
+    (PetProfile.CAT, 'FVRCP', 3, 365),
+    (PetProfile.CAT, 'FVRCP', 4, 3 * 365),
+    (PetProfile.CAT, 'Rabies', 1, 365),
+    (PetProfile.CAT, 'Rabies', 2, 3 * 365),
+    (PetProfile.CAT, 'FeLV', 1, 21),
+    (PetProfile.CAT, 'FeLV', 2, 365),
+    (PetProfile.RABBIT, 'RHDV2', 1, 365),
+    (PetProfile.RABBIT, 'Myxomatosis', 1, 365),
+]
+
+REMINDER_DAYS = 14
+REMINDER_CHUNK_SIZE = 500
+
+
+def interval_days(species, vaccine, dose):
+    """Days from `dose` to the next one, or None if the schedule has no further dose"""
+    return (
+        VaccineSchedule.objects.filter(species=species, vaccine__iexact=vaccine, dose__lte=dose)
+        .order_by('-dose').values_list('interval_days', flat=True).first()
+    )
+
+
+def expected_next_due(vaccination):
+    """Due date of the dose after `vaccination`, or None if not needed or already given"""
+    later = Vaccination.objects.filter(
+        pet_id=vaccination.pet_id, vaccine__iexact=vaccination.vaccine,
+        administered_at__gt=vaccination.administered_at,
+    ).exclude(pk=vaccination.pk)
+    if later.exists():
+        return None
+    days = interval_days(vaccination.pet.species, vaccination.vaccine, vaccination.dose)
+    if days is None:
+        return None
+    return vaccination.administered_date + timedelta(days=days)
+
+
+def close_earlier_doses(vaccination):
+    """Clear next_due on the pet's earlier doses of the same vaccine"""
+    Vaccination.objects.filter(
+        pet_id=vaccination.pet_id, vaccine__iexact=vaccination.vaccine,
+        administered_at__lt=vaccination.administered_at, next_due__isnull=False,
+    ).exclude(pk=vaccination.pk).update(next_due=None)
+
+
+def due(queryset, days, today=None, overdue=False):
+    """Doses in `queryset` due within `days`, also earlier ones if `overdue`, soonest first"""
+    today = today or timezone.now().date()
+    end = today + timedelta(days=days)
+    if overdue:
+        queryset = queryset.filter(next_due__lte=end)
+    else:
+        queryset = queryset.filter(next_due__range=(today, end))
+    return queryset.order_by('next_due', 'pk')
+
+
+def send_reminders(days=REMINDER_DAYS, today=None, chunk_size=REMINDER_CHUNK_SIZE):
+    """
+    Notify owners of doses due within `days` that they have not been reminded
+    about yet, `chunk_size` doses per transaction. Returns the number sent.
+    """
+    from notifications import digests
+    from notifications.models import Notification
+
+    today = today or timezone.now().date()
+    sent = 0
+    after = None
+    while True:
+        with transaction.atomic():
+            doses = due(Vaccination.objects.all(), days, today).exclude(reminded_for=F('next_due'))
+            if after:
+                doses = doses.filter(Q(next_due__gt=after[0]) | Q(next_due=after[0], pk__gt=after[1]))
+            doses = list(doses.values_list('pk', 'next_due', 'vaccine', 'pet__name', 'pet__owner_id')[:chunk_size])
+            if not doses:
+                return sent
+            after = doses[-1][1], doses[-1][0]
+
+            digests.deliver([
+                Notification(
+                    recipient_id=owner_id, notification_type='vaccination',
+                    title=f"{vaccine} due for {pet_name}",
+                    message=f"{pet_name}'s next {vaccine} dose is due on {next_due:%Y-%m-%d}.",
+                )
+                for _, next_due, vaccine, pet_name, owner_id in doses
+            ])
+            Vaccination.objects.filter(pk__in=[dose[0] for dose in doses]).update(reminded_for=F('next_due'))
+        sent += len(doses)
@@ -1,16 +1,28 @@
-from rest_framework import generics, permissions
-from rest_framework.exceptions import PermissionDenied
+from datetime import datetime, time, timedelta
+
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
 
-from .models import MedicalRecord
-from .serializers import (MedicalRecordListSerializer,MedicalRecordDetailSerializer,MedicalRecordCreateSerializer,MedicalRecordUpdateSerializer)
-from .permissions import (IsMedicalRecordParticipant,CanCreateMedicalRecord,CanAccessPetMedicalHistory)
+from . import revisions, search, uploads, vaccinations, vitals
+from .models import MedicalRecord, MedicalRecordRevision, TestResultUpload, Vaccination
+from .serializers import (MedicalRecordListSerializer,MedicalRecordDetailSerializer,FlaggedMedicalRecordSerializer,MedicalRecordCreateSerializer,MedicalRecordUpdateSerializer,MedicalRecordRevisionSerializer,MedicalSearchQuerySerializer,TestResultUploadSerializer,VaccinationCreateSerializer,VaccinationSerializer,VaccinationsDueQuerySerializer,VaccinationUpdateSerializer,VitalsQuerySerializer)
+from .permissions import (IsMedicalRecordParticipant,CanCreateMedicalRecord,CanAccessPetMedicalHistory,CanModifyVaccination,CanViewVaccination)
 from accounts.permissions import IsVeterinarian
+from appointments.models import Consultation
+from appointments.serializers import ConsultationListSerializer
+from Vetcare.downloads import file_response
+from Vetcare.exports import StreamingExportMixin
+from Vetcare.query_optimizer import OptimizedQuerysetMixin, optimize_queryset
 
 
 #MEDICAL RECORD VIEWS 
 
-class MedicalRecordListView(generics.ListAPIView):
+class MedicalRecordListView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     - Veterinarians see records they created
     - Clients see records for their pets
@@ -25,21 +37,22 @@ class MedicalRecordListView(generics.ListAPIView):
         if user.role == 'VETERINARIAN':
             return MedicalRecord.objects.filter(
                 veterinarian=user
-            ).select_related('pet', 'veterinarian', 'appointment').order_by('-visit_date')
+            ).order_by('-visit_date')
         
         elif user.role == 'CLIENT':
             return MedicalRecord.objects.filter(
                 pet__owner=user
-            ).select_related('pet', 'veterinarian', 'appointment').order_by('-visit_date')
+            ).order_by('-visit_date')
         
         return MedicalRecord.objects.none()
 
 
-class MedicalRecordDetailView(generics.RetrieveUpdateAPIView):
+class MedicalRecordDetailView(OptimizedQuerysetMixin, generics.RetrieveUpdateAPIView):
     """
     View or update a specific medical record.
     """
-    queryset = MedicalRecord.objects.select_related('pet', 'veterinarian', 'appointment').all()
+    # pet owner and vet are read by the permission check on writes too
+    queryset = MedicalRecord.objects.select_related('pet__owner', 'veterinarian').all()
     permission_classes = [permissions.IsAuthenticated, IsMedicalRecordParticipant]
 
     def get_serializer_class(self):
@@ -48,6 +61,22 @@ class MedicalRecordDetailView(generics.RetrieveUpdateAPIView):
             return MedicalRecordUpdateSerializer
         return MedicalRecordDetailSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in ['PUT', 'PATCH']:
+            # The revision number and diff are taken from the row as loaded, so hold it until the edit commits
+            queryset = queryset.select_for_update(of=('self',))
+        return queryset
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        """Credit the revision to the logged-in veterinarian"""
+        serializer.instance.edited_by = self.request.user
+        serializer.save()
+
 
 class MedicalRecordCreateView(generics.CreateAPIView):
     """
@@ -61,27 +90,64 @@ class MedicalRecordCreateView(generics.CreateAPIView):
         serializer.save(veterinarian=self.request.user)
 
 
-class PetMedicalHistoryView(generics.ListAPIView):
+class PetMedicalHistoryView(StreamingExportMixin, OptimizedQuerysetMixin, generics.ListAPIView):
     """
     View complete medical history for a specific pet.
+    Add ?export=ndjson|csv (and &gzip=1) to stream the whole history as a file.
     """
     serializer_class = MedicalRecordListSerializer
     permission_classes = [permissions.IsAuthenticated, CanAccessPetMedicalHistory]
 
+    def get_export_filename(self):
+        return f"pet-{self.kwargs.get('pet_id')}-medical-history"
+
     def get_queryset(self):
         """Return all medical records for the specified pet"""
         pet_id = self.kwargs.get('pet_id')
         return MedicalRecord.objects.filter(
             pet_id=pet_id
-        ).select_related('veterinarian', 'appointment').order_by('-visit_date')
+        ).order_by('-visit_date')
+
 
+class PetVitalsView(generics.GenericAPIView):
+    """
+    Weight and temperature over time for one pet, for charting.
+    - bucket=none: visit readings, downsampled to `points` per metric
+    - bucket=week|month: min / mean / max per period
+    """
+    serializer_class = VitalsQuerySerializer
+    permission_classes = [permissions.IsAuthenticated, CanAccessPetMedicalHistory]
+    pagination_class = None
+
+    def get(self, request, pet_id):
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
 
-class MyPetsMedicalRecordsView(generics.ListAPIView):
+        records = MedicalRecord.objects.filter(pet_id=pet_id)
+        # Compare visit_date with datetimes so the (pet, visit_date) index still applies
+        if options.get('start'):
+            records = records.filter(visit_date__gte=timezone.make_aware(datetime.combine(options['start'], time.min)))
+        if options.get('end'):
+            records = records.filter(
+                visit_date__lt=timezone.make_aware(datetime.combine(options['end'] + timedelta(days=1), time.min))
+            )
+
+        if options['bucket'] == VitalsQuerySerializer.NO_BUCKET:
+            series = vitals.raw_series(records, params.get_metrics(), options['points'])
+        else:
+            series = vitals.bucketed_series(records, params.get_metrics(), options['bucket'])
+        return Response({'pet': pet_id, 'bucket': options['bucket'], 'series': series})
+
+
+class MyPetsMedicalRecordsView(StreamingExportMixin, OptimizedQuerysetMixin, generics.ListAPIView):
     """
     View all medical records for all pets owned by the client.
+    Add ?export=ndjson|csv (and &gzip=1) to stream every record as a file.
     """
     serializer_class = MedicalRecordListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    export_filename = 'my-pets-medical-records'
 
     def get_queryset(self):
         """Return records for all pets owned by the client"""
@@ -92,10 +158,10 @@ class MyPetsMedicalRecordsView(generics.ListAPIView):
         
         return MedicalRecord.objects.filter(
             pet__owner=user
-        ).select_related('pet', 'veterinarian', 'appointment').order_by('-visit_date')
+        ).order_by('-visit_date')
 
 
-class RecentMedicalRecordsView(generics.ListAPIView):
+class RecentMedicalRecordsView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     View recent medical records (last 30 days).
     """
@@ -112,7 +178,7 @@ class RecentMedicalRecordsView(generics.ListAPIView):
         
         base_query = MedicalRecord.objects.filter(
             visit_date__gte=thirty_days_ago
-        ).select_related('pet', 'veterinarian', 'appointment')
+        )
         
         if user.role == 'VETERINARIAN':
             return base_query.filter(veterinarian=user).order_by('-visit_date')
@@ -123,7 +189,7 @@ class RecentMedicalRecordsView(generics.ListAPIView):
         return MedicalRecord.objects.none()
 
 
-class FollowUpRequiredView(generics.ListAPIView):
+class FollowUpRequiredView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     List medical records that require follow-up.
     """
@@ -137,10 +203,11 @@ class FollowUpRequiredView(generics.ListAPIView):
         user = self.request.user
         today = timezone.now().date()
         
+        # Matches the partial follow-up indexes: a range scan on (vet or pet, follow_up_date)
         base_query = MedicalRecord.objects.filter(
             follow_up_required=True,
             follow_up_date__gte=today
-        ).select_related('pet', 'veterinarian', 'appointment')
+        )
         
         if user.role == 'VETERINARIAN':
             return base_query.filter(veterinarian=user).order_by('follow_up_date')
@@ -148,4 +215,323 @@ class FollowUpRequiredView(generics.ListAPIView):
         elif user.role == 'CLIENT':
             return base_query.filter(pet__owner=user).order_by('follow_up_date')
         
-        return MedicalRecord.objects.none()
\ No newline at end of file
+        return MedicalRecord.objects.none()
+
+class FlaggedVitalsView(OptimizedQuerysetMixin, generics.ListAPIView):
+    """
+    Records whose vitals were flagged by the anomaly scoring job, highest score first.
+    ?min_score= narrows the list further.
+    """
+    serializer_class = FlaggedMedicalRecordSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """Return flagged records based on user role"""
+        user = self.request.user
+        base_query = MedicalRecord.objects.filter(anomaly_flags__gt=0)
+
+        min_score = self.request.query_params.get('min_score')
+        if min_score:
+            try:
+                base_query = base_query.filter(anomaly_score__gte=float(min_score))
+            except ValueError:
+                raise ValidationError({"min_score": "Enter a number."})
+
+        if user.role == 'VETERINARIAN':
+            return base_query.filter(veterinarian=user).order_by('-anomaly_score')
+
+        elif user.role == 'CLIENT':
+            return base_query.filter(pet__owner=user).order_by('-anomaly_score')
+
+        return MedicalRecord.objects.none()
+
+
+class MedicalSearchView(generics.GenericAPIView):
+    """
+    Ranked full-text search over the user's medical records and consultations.
+    - Veterinarians search what they wrote
+    - Clients search their pets' records and consultations
+    """
+    serializer_class = MedicalSearchQuerySerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
+
+    def get(self, request):
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        user = request.user
+        limit = params.validated_data['limit']
+        fetch = limit
+        while True:
+            hits = search.search(user, params.validated_data['q'], params.get_kinds(), fetch)
+            results = self.visible_results(user, hits)
+            # Stale index rows are dropped before the limit: fetch more until it is filled or the index runs out
+            if len(results) >= limit or len(hits) < fetch:
+                break
+            fetch *= 2
+        results = results[:limit]
+
+        return Response({'query': params.validated_data['q'], 'count': len(results), 'results': results})
+
+    def visible_results(self, user, hits):
+        """Serialized hits, re-checked against the role-scoped querysets so stale index rows never leak"""
+        records, consultations = {}, {}
+        record_ids = [pk for kind, pk, _, _ in hits if kind == search.RECORD]
+        consultation_ids = [pk for kind, pk, _, _ in hits if kind == search.CONSULTATION]
+        if record_ids:
+            records = optimize_queryset(
+                MedicalRecord.objects.filter(**self.owner_filter(user, 'pet__owner')),
+                MedicalRecordListSerializer,
+            ).in_bulk(record_ids)
+        if consultation_ids:
+            consultations = optimize_queryset(
+                Consultation.objects.filter(**self.owner_filter(user, 'appointment__client')),
+                ConsultationListSerializer,
+            ).in_bulk(consultation_ids)
+
+        results = []
+        for kind, pk, score, snippet in hits:
+            if kind == search.RECORD and pk in records:
+                result_type, data = 'medical_record', MedicalRecordListSerializer(records[pk]).data
+            elif kind == search.CONSULTATION and pk in consultations:
+                result_type, data = 'consultation', ConsultationListSerializer(consultations[pk]).data
+            else:
+                continue
+            results.append({'type': result_type, 'id': pk, 'score': score, 'snippet': snippet, 'object': data})
+        return results
+
+    def owner_filter(self, user, client_lookup):
+        """Filter kwargs for the rows `user` may search"""
+        if user.role == 'VETERINARIAN':
+            return {'veterinarian': user}
+        return {client_lookup: user}
+
+
+class MedicalRecordRevisionListView(OptimizedQuerysetMixin, generics.ListAPIView):
+    """
+    Edit history of a medical record, newest first.
+    Only the record's participants can access it.
+    """
+    serializer_class = MedicalRecordRevisionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsMedicalRecordParticipant]
+
+    def get_queryset(self):
+        """Return the record's revisions after checking access to the record"""
+        record = get_object_or_404(MedicalRecord.objects.select_related('pet__owner', 'veterinarian'), pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, record)
+        return MedicalRecordRevision.objects.filter(record=record).order_by('-number')
+
+
+class MedicalRecordVersionView(generics.GenericAPIView):
+    """
+    A medical record as it was at a past version: 1 is the record as created,
+    each edit adds one. Only the record's participants can access it.
+    """
+    queryset = MedicalRecord.objects.select_related('pet__owner', 'veterinarian', 'appointment').all()
+    permission_classes = [permissions.IsAuthenticated, IsMedicalRecordParticipant]
+    serializer_class = MedicalRecordDetailSerializer
+
+    def get(self, request, pk, version):
+        record = self.get_object()
+        latest = record.revision_count + 1
+        if not 1 <= version <= latest:
+            return Response(
+                {"error": f"This record has versions 1 to {latest}."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        # One range read on the (record, number) constraint index
+        revisions.rebuild(record, record.revisions.filter(number__gte=version))
+        return Response({
+            "version": version,
+            "latest_version": latest,
+            "record": self.get_serializer(record).data,
+        })
+
+
+class MedicalRecordTestResultsView(generics.GenericAPIView):
+    """
+    Download a record's test results file.
+    Supports Range, If-Range and If-None-Match; only the record's participants can access it.
+    """
+    queryset = MedicalRecord.objects.select_related('pet__owner', 'veterinarian').all()
+    permission_classes = [permissions.IsAuthenticated, IsMedicalRecordParticipant]
+
+    def get(self, request, *args, **kwargs):
+        record = self.get_object()
+        if not record.test_results:
+            return Response(
+                {"error": "This record has no test results."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return file_response(request, record.test_results, as_attachment=True)
+
+
+class TestResultUploadCreateView(generics.CreateAPIView):
+    """
+    Open a resumable upload session for a record's test results.
+    Only the veterinarian who wrote the record can upload.
+    """
+    serializer_class = TestResultUploadSerializer
+    permission_classes = [permissions.IsAuthenticated, IsMedicalRecordParticipant]
+
+    def perform_create(self, serializer):
+        record = get_object_or_404(MedicalRecord.objects.select_related('pet__owner', 'veterinarian'), pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, record)
+        serializer.save(record=record, uploaded_by=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response['Location'] = reverse('medical_records:test-result-upload', kwargs={'upload_id': response.data['id']})
+        response['Upload-Offset'] = 0
+        return response
+
+
+class TestResultUploadView(generics.GenericAPIView):
+    """
+    One upload session, open to the user who started it.
+    - GET: progress; resume by sending the chunk at `received_size`
+    - PATCH: raw chunk body with `Upload-Offset` and `Upload-Checksum: sha256 <hex>` headers
+    - DELETE: abort the upload
+    """
+    serializer_class = TestResultUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'pk'
+    lookup_url_kwarg = 'upload_id'
+
+    def get_queryset(self):
+        return TestResultUpload.objects.filter(uploaded_by=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        upload = self.get_object()
+        response = Response(self.get_serializer(upload).data)
+        response['Upload-Offset'] = upload.received_size
+        return response
+
+    def patch(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response(
+                {"error": "Upload-Offset must be the byte offset of this chunk."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            checksum = uploads.parse_checksum(request.headers.get('Upload-Checksum'))
+            # Read the body straight from the request so it is never held in memory
+            uploads.write_chunk(upload, offset, length, request.stream, checksum)
+        except uploads.UploadError as error:
+            response = Response(
+                {"error": str(error), "received_size": upload.received_size},
+                status=error.status_code
+            )
+        else:
+            response = Response(self.get_serializer(upload).data)
+        response['Upload-Offset'] = upload.received_size
+        return response
+
+    def delete(self, request, *args, **kwargs):
+        upload = self.get_object()
+        if upload.status == TestResultUpload.COMPLETED:
+            return Response(
+                {"error": "This upload is already complete."},
+                status=status.HTTP_409_CONFLICT
+            )
+        uploads.abort(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+#VACCINATION VIEWS
+
+class VaccinationListView(OptimizedQuerysetMixin, generics.ListAPIView):
+    """
+    - Veterinarians see doses they administered
+    - Clients see doses given to their pets
+    """
+    serializer_class = VaccinationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """Return vaccinations based on user role"""
+        user = self.request.user
+
+        if user.role == 'VETERINARIAN':
+            return Vaccination.objects.filter(veterinarian=user).order_by('-administered_at')
+
+        elif user.role == 'CLIENT':
+            return Vaccination.objects.filter(pet__owner=user).order_by('-administered_at')
+
+        return Vaccination.objects.none()
+
+
+class VaccinationCreateView(generics.CreateAPIView):
+    """
+    Record a vaccination (Veterinarians only). The next due date comes from
+    the species' vaccine schedule unless one is given.
+    """
+    serializer_class = VaccinationCreateSerializer
+    permission_classes = [permissions.IsAuthenticated, CanModifyVaccination]
+
+    def perform_create(self, serializer):
+        """Save the dose with the logged-in veterinarian"""
+        serializer.save(veterinarian=self.request.user)
+
+
+class VaccinationDetailView(OptimizedQuerysetMixin, generics.RetrieveUpdateAPIView):
+    """
+    View a vaccination (pet owner or administering vet) or correct it (administering vet only).
+    """
+    queryset = Vaccination.objects.select_related('pet__owner', 'veterinarian').all()
+
+    def get_permissions(self):
+        """Anyone involved can read; only the administering vet can write"""
+        if self.request.method in permissions.SAFE_METHODS:
+            return [permissions.IsAuthenticated(), CanViewVaccination()]
+        return [permissions.IsAuthenticated(), CanModifyVaccination()]
+
+    def get_serializer_class(self):
+        """Use different serializers for read vs write"""
+        if self.request.method in ['PUT', 'PATCH']:
+            return VaccinationUpdateSerializer
+        return VaccinationSerializer
+
+
+class PetVaccinationsView(OptimizedQuerysetMixin, generics.ListAPIView):
+    """
+    Vaccination history for a specific pet.
+    """
+    serializer_class = VaccinationSerializer
+    permission_classes = [permissions.IsAuthenticated, CanAccessPetMedicalHistory]
+
+    def get_queryset(self):
+        """Return all vaccinations for the specified pet"""
+        return Vaccination.objects.filter(pet_id=self.kwargs.get('pet_id')).order_by('-administered_at')
+
+
+class VaccinationsDueView(OptimizedQuerysetMixin, generics.ListAPIView):
+    """
+    Doses due in the next ?days= days (default 30), soonest first.
+    ?overdue=true also lists doses that are past due.
+    - Veterinarians see doses following ones they administered
+    - Clients see doses for their pets
+    """
+    serializer_class = VaccinationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """Return outstanding doses in the window based on user role"""
+        user = self.request.user
+        params = VaccinationsDueQuerySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+
+        # Each role's filter leads the matching partial next_due index
+        if user.role == 'VETERINARIAN':
+            doses = Vaccination.objects.filter(veterinarian=user)
+        elif user.role == 'CLIENT':
+            doses = Vaccination.objects.filter(pet__owner=user)
+        else:
+            return Vaccination.objects.none()
+        return vaccinations.due(doses, params.validated_data['days'], overdue=params.validated_data['overdue'])
@@ -0,0 +1,112 @@
+"""
+Weight and temperature series for charting.
+
+Raw series read only ``visit_date`` and the vitals columns through the
+``(pet, visit_date)`` index and are thinned to a target number of points
+with Largest-Triangle-Three-Buckets, which keeps peaks and dips that plain
+every-nth sampling would drop. Weekly and monthly series are aggregated by
+the database into min / mean / max per bucket.
+"""
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import MedicalRecord
+
+
+METRICS = ['weight', 'temperature']
+
+BUCKETS = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def raw_series(records, metrics, points):
+    """Per-metric visit points, downsampled to at most `points` each"""
+    rows = records.order_by('visit_date').values_list('visit_date', *metrics)
+    series = {metric: [] for metric in metrics}
+    for visit_date, *values in rows.iterator(chunk_size=2000):
+        timestamp = visit_date.timestamp()
+        for metric, value in zip(metrics, values):
+            if value is not None:
+                series[metric].append((timestamp, float(value), visit_date))
+
+    return {
+        metric: {
+            'count': len(values),
+            'points': [{'visit_date': visit_date, 'value': value} for _, value, visit_date in lttb(values, points)],
+        }
+        for metric, values in series.items()
+    }
+
+
+def bucketed_series(records, metrics, bucket):
+    """Per-metric min / mean / max for each week or month with a reading"""
+    aggregates = {}
+    for metric in metrics:
+        aggregates[f'{metric}_min'] = Min(metric)
+        aggregates[f'{metric}_mean'] = Avg(metric)
+        aggregates[f'{metric}_max'] = Max(metric)
+        aggregates[f'{metric}_count'] = Count(metric)
+    rows = (
+        records.annotate(bucket=BUCKETS[bucket]('visit_date'))
+        .order_by()
+        .values('bucket')
+        .annotate(**aggregates)
+        .order_by('bucket')
+    )
+
+    series = {metric: {'count': 0, 'buckets': []} for metric in metrics}
+    for row in rows:
+        for metric in metrics:
+            count = row[f'{metric}_count']
+            if not count:
+                continue
+            series[metric]['count'] += count
+            series[metric]['buckets'].append({
+                'start': row['bucket'].date(),
+                'min': float(row[f'{metric}_min']),
+                'mean': round(float(row[f'{metric}_mean']), 2),
+                'max': float(row[f'{metric}_max']),
+                'count': count,
+            })
+    return series
+
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of (x, y, ...) tuples sorted
+    by x. Keeps the first and last point and, from each of threshold - 2
+    equal buckets in between, the point forming the largest triangle with
+    the previously kept point and the mean of the next bucket.
+    """
+    size = len(points)
+    if threshold >= size or threshold < 3:
+        return points
+
+    sampled = [points[0]]
+    every = (size - 2) / (threshold - 2)
+    kept = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+
+        # Mean of the following bucket (the last point for the final bucket)
+        next_start, next_end = end, min(int((i + 2) * every) + 1, size)
+        if next_start >= next_end:
+            next_start, next_end = size - 1, size
+        span = next_end - next_start
+        mean_x = sum(p[0] for p in points[next_start:next_end]) / span
+        mean_y = sum(p[1] for p in points[next_start:next_end]) / span
+
+        ax, ay = points[kept][0], points[kept][1]
+        best_area, best = -1.0, start
+        for j in range(start, end):
+            area = abs((ax - mean_x) * (points[j][1] - ay) - (ax - points[j][0]) * (mean_y - ay))
+            if area > best_area:
+                best_area, best = area, j
+        sampled.append(points[best])
+        kept = best
+
+    sampled.append(points[-1])
+    return sampled
@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import Notification, NotificationArchive, NotificationCounter, PendingNotification
 
 # Register your models here.
+admin.site.register(Notification)
+admin.site.register(NotificationCounter)
+admin.site.register(PendingNotification)
+admin.site.register(NotificationArchive)
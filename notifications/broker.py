@@ -0,0 +1,167 @@
+"""
+Pub/sub between code that creates notifications and the live streams.
+
+Publishers only say *who* has something new; each woken stream reads its
+user's new rows itself, so the broker carries no payloads and a missed
+wake-up costs latency, not data. LocalBroker reaches the streams served by
+the same process. TableBroker also reaches streams served apart from the
+processes creating notifications (the ASGI stream process, see the
+Procfile) by watching the notification table, one read per serving event
+loop however many streams are open. A broker on Redis or Postgres
+LISTEN/NOTIFY can replace either through the NOTIFICATION_BROKER setting by
+providing the same publish() and subscribe().
+"""
+import asyncio
+import threading
+from collections import Counter, defaultdict
+from functools import cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """One stream's interest in a user's notifications"""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    async def wait(self, timeout):
+        """True if woken by a publish within `timeout` seconds"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+    def wake(self):
+        # Publishers run in other threads (sync views, on_commit callbacks)
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalBroker:
+    """In-process broker: a set of subscriptions per user id"""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Start listening for `user_id`; call from the stream's event loop"""
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop listening; True if the subscription was still active"""
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is None or subscription not in subscriptions:
+                return False
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+            return True
+
+    def publish(self, user_ids):
+        """Wake every stream of the given users; safe to call from any thread"""
+        with self._lock:
+            woken = [
+                subscription for user_id in set(user_ids)
+                for subscription in self._subscriptions.get(user_id, ())
+            ]
+        for subscription in woken:
+            try:
+                subscription.wake()
+            except RuntimeError:
+                # Its event loop has closed; the stream is gone
+                subscription.close()
+
+    def listeners(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+class TableBroker(LocalBroker):
+    """
+    LocalBroker plus one watcher task per event loop with subscribers: every
+    NOTIFICATION_BROKER_POLL seconds it reads the ids of the notifications
+    created since its last read and wakes their recipients' streams.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._loops = Counter()
+        self._watchers = {}
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        with self._lock:
+            self._loops[subscription.loop] += 1
+            if subscription.loop not in self._watchers:
+                self._watchers[subscription.loop] = subscription.loop.create_task(self._watch(subscription.loop))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if not super().unsubscribe(subscription):
+            return False
+        with self._lock:
+            self._loops[subscription.loop] -= 1
+            if self._loops[subscription.loop] <= 0:
+                del self._loops[subscription.loop]
+                watcher = self._watchers.pop(subscription.loop, None)
+                if watcher is not None:
+                    try:
+                        subscription.loop.call_soon_threadsafe(watcher.cancel)
+                    except RuntimeError:
+                        # The loop has closed, and the watcher with it
+                        pass
+        return True
+
+    async def _watch(self, loop):
+        from .models import Notification
+
+        def latest():
+            return Notification.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        def created_after(last):
+            return list(Notification.objects.filter(pk__gt=last).order_by('pk').values_list('pk', 'recipient_id'))
+
+        last = await sync_to_async(latest)()
+        # Rows committed while the first streams were reading came before `last`; one wake-up covers them
+        self._wake_loop(loop)
+        while True:
+            await asyncio.sleep(settings.NOTIFICATION_BROKER_POLL)
+            rows = await sync_to_async(created_after)(last)
+            if rows:
+                last = rows[-1][0]
+                self.publish(recipient_id for _, recipient_id in rows)
+
+    def _wake_loop(self, loop):
+        with self._lock:
+            woken = [
+                subscription for subscriptions in self._subscriptions.values()
+                for subscription in subscriptions if subscription.loop is loop
+            ]
+        for subscription in woken:
+            subscription.wake()
+
+
+@cache
+def get_broker():
+    return import_string(settings.NOTIFICATION_BROKER)()
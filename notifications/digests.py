@@ -0,0 +1,153 @@
+"""
+Coalescing of notification bursts into digests.
+
+Notifications of a type listed in NOTIFICATION_DIGEST_WINDOWS open a window
+of that many seconds for their recipient. The first one is delivered at
+once; those that arrive while the window is open (a notification of the
+type reached the recipient within the window, or some are already staged)
+are staged as PendingNotification rows. Once the oldest staged row of a
+recipient and type is older than the type's window, flush() merges the
+recipient's staged rows of that type into one Notification carrying their
+count and a summary of their titles, so a vet with 40 booking requests in
+a window gets two rows and two pushes instead of 40, and a lone request is
+not held back at all. A group of one is delivered unchanged. Other types
+are written at once. Two deliveries racing for a closed window may both go
+out at once; that costs one extra row, never a lost notification.
+
+flush() is run in the background by the flush_notification_digests command.
+"""
+from collections import Counter
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Notification, PendingNotification
+
+
+BATCH_SIZE = 500
+
+# Recipients whose staged rows are merged per transaction
+FLUSH_CHUNK_SIZE = 200
+
+# Distinct titles spelled out in a digest's message
+SUMMARY_TITLES = 5
+
+TYPE_LABELS = dict(Notification.NOTIFICATION_TYPES)
+
+
+def window(notification_type):
+    """Seconds notifications of this type are held for a digest; 0 delivers them at once"""
+    return settings.NOTIFICATION_DIGEST_WINDOWS.get(notification_type, 0)
+
+
+def deliver(notifications):
+    """
+    Write unsaved `notifications`, staging those of a type whose window is
+    open for their recipient. Returns (written, staged).
+    """
+    open_windows = _open_windows(notifications)
+    immediate, staged = [], []
+    for notification in notifications:
+        key = (notification.notification_type, notification.recipient_id)
+        if key in open_windows:
+            staged.append(PendingNotification(
+                recipient_id=notification.recipient_id, sender_id=notification.sender_id,
+                notification_type=notification.notification_type,
+                title=notification.title, message=notification.message,
+            ))
+        else:
+            immediate.append(notification)
+            if window(notification.notification_type):
+                open_windows.add(key)
+    with transaction.atomic():
+        if immediate:
+            Notification.objects.bulk_create(immediate, batch_size=BATCH_SIZE)
+        if staged:
+            PendingNotification.objects.bulk_create(staged, batch_size=BATCH_SIZE)
+    return len(immediate), len(staged)
+
+
+def _open_windows(notifications, now=None):
+    """(type, recipient id) pairs among `notifications` with a window open: staged rows, or a recent delivery"""
+    now = now or timezone.now()
+    pairs = {
+        (notification.notification_type, notification.recipient_id)
+        for notification in notifications if window(notification.notification_type)
+    }
+    if not pairs:
+        return set()
+    types = {notification_type for notification_type, _ in pairs}
+    recipients = {recipient_id for _, recipient_id in pairs}
+    recent = Q()
+    for notification_type in types:
+        recent |= Q(notification_type=notification_type, created_at__gt=now - timedelta(seconds=window(notification_type)))
+    found = set(
+        PendingNotification.objects.filter(notification_type__in=types, recipient_id__in=recipients)
+        .order_by().values_list('notification_type', 'recipient_id').distinct()
+    )
+    found |= set(
+        Notification.objects.filter(recent, recipient_id__in=recipients)
+        .order_by().values_list('notification_type', 'recipient_id').distinct()
+    )
+    return found & pairs
+
+
+def flush(now=None, chunk_size=FLUSH_CHUNK_SIZE):
+    """
+    Deliver a digest for every recipient and type whose oldest staged
+    notification has waited out the type's window.
+    Returns (digests written, staged notifications merged into them).
+    """
+    now = now or timezone.now()
+    written = merged = 0
+    # Types with staged rows, including any whose window has since been removed
+    types = list(PendingNotification.objects.order_by().values_list('notification_type', flat=True).distinct())
+    for notification_type in types:
+        cutoff = now - timedelta(seconds=window(notification_type))
+        recipients = list(
+            PendingNotification.objects.filter(notification_type=notification_type)
+            .order_by().values('recipient_id').annotate(oldest=Min('created_at'))
+            .filter(oldest__lte=cutoff).values_list('recipient_id', flat=True)
+        )
+        for start in range(0, len(recipients), chunk_size):
+            with transaction.atomic():
+                rows = list(
+                    PendingNotification.objects.filter(
+                        notification_type=notification_type, recipient_id__in=recipients[start:start + chunk_size],
+                    )
+                    .order_by('recipient_id', 'created_at', 'pk')
+                    # Concurrent flushes on Postgres take different rows instead of doubling digests
+                    .select_for_update(skip_locked=True)
+                )
+                digests = [digest(list(group)) for _, group in groupby(rows, key=attrgetter('recipient_id'))]
+                Notification.objects.bulk_create(digests, batch_size=BATCH_SIZE)
+                pks = [row.pk for row in rows]
+                for batch in range(0, len(pks), BATCH_SIZE):
+                    PendingNotification.objects.filter(pk__in=pks[batch:batch + BATCH_SIZE]).delete()
+            written += len(digests)
+            merged += len(rows)
+    return written, merged
+
+
+def digest(rows):
+    """One notification standing for a recipient's staged `rows` of one type, oldest first"""
+    first = rows[0]
+    senders = {row.sender_id for row in rows}
+    if len(rows) == 1:
+        title, message = first.title, first.message
+    else:
+        titles = Counter(row.title for row in rows)
+        title = f"{len(rows)} {TYPE_LABELS.get(first.notification_type, first.notification_type).lower()} updates"
+        lines = [f"{text} ({count})" if count > 1 else text for text, count in titles.most_common(SUMMARY_TITLES)]
+        if len(titles) > SUMMARY_TITLES:
+            lines.append(f"and {len(titles) - SUMMARY_TITLES} more")
+        message = "; ".join(lines) + "."
+    return Notification(
+        recipient_id=first.recipient_id, sender_id=senders.pop() if len(senders) == 1 else None,
+        notification_type=first.notification_type, title=title, message=message, count=len(rows),
+    )
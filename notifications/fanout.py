@@ -0,0 +1,120 @@
+"""
+Notification fan-out for appointment and medical record events.
+
+Code that changes an appointment's status, records a consultation or asks
+for a follow-up describes what happened as an Event and hands it to
+notify(). The recipients of each event are coalesced (duplicates and the
+user who caused the event are dropped), and every notification for the
+events passed in one call is written by a single bulk_create once the
+surrounding transaction commits, so a rolled back change notifies nobody
+and the request does not wait on one INSERT per recipient. Types with a
+digest window are staged for their recipient's next digest instead (see
+notifications.digests).
+"""
+import logging
+
+from django.db import transaction
+
+from appointments.models import Appointment
+from . import digests
+from .models import Notification
+
+
+logger = logging.getLogger(__name__)
+
+APPOINTMENT_EVENTS = {
+    Appointment.CONFIRMED: ("Appointment confirmed", "Your appointment on {date} has been confirmed{time}."),
+    Appointment.COMPLETED: ("Appointment completed", "Your appointment on {date} has been marked as completed."),
+    Appointment.CANCELLED: ("Appointment cancelled", "The appointment on {date} has been cancelled."),
+}
+
+
+class Event:
+    """Something that happened, who it concerns and what to tell them"""
+
+    def __init__(self, notification_type, title, message, recipients, sender=None):
+        self.notification_type = notification_type
+        self.title = title
+        self.message = message
+        self.recipients = recipients
+        self.sender = sender
+
+    def recipient_ids(self):
+        """Distinct recipients in first-seen order, without the sender"""
+        ids = dict.fromkeys(recipient for recipient in self.recipients if recipient is not None)
+        ids.pop(self.sender, None)
+        return list(ids)
+
+    def notifications(self):
+        return [
+            Notification(
+                recipient_id=recipient, sender_id=self.sender, notification_type=self.notification_type,
+                title=self.title, message=self.message,
+            )
+            for recipient in self.recipient_ids()
+        ]
+
+
+def notify(events):
+    """Deliver the notifications for `events` together (see digests.deliver) after the current transaction commits"""
+    events = [event for event in events if event is not None]
+    if events:
+        transaction.on_commit(lambda: _write(events), robust=True)
+
+
+def _write(events):
+    notifications = [notification for event in events for notification in event.notifications()]
+    written, staged = digests.deliver(notifications)
+    logger.debug("Sent %d notifications and staged %d for digests for %d events", written, staged, len(events))
+
+
+def appointment_requested(appointment):
+    return Event(
+        'appointment', "New appointment request",
+        f"A new appointment has been requested for {appointment.date:%Y-%m-%d}.",
+        [appointment.veterinarian_id], sender=appointment.client_id,
+    )
+
+
+def appointment_status_changed(appointment, actor_id=None):
+    """
+    Confirmations and completions go to the client; cancellations to both
+    participants. Whoever made the change is not told about it.
+    """
+    if appointment.status not in APPOINTMENT_EVENTS:
+        return None
+    title, message = APPOINTMENT_EVENTS[appointment.status]
+    recipients = [appointment.client_id]
+    if appointment.status == Appointment.CANCELLED:
+        recipients.append(appointment.veterinarian_id)
+    at = f" for {appointment.time:%H:%M}" if appointment.time else ""
+    return Event(
+        'appointment', title, message.format(date=f"{appointment.date:%Y-%m-%d}", time=at),
+        recipients, sender=actor_id,
+    )
+
+
+def follow_up_booked(appointment):
+    return Event(
+        'appointment', "Follow-up appointment booked",
+        f"A follow-up appointment has been booked for {appointment.date:%Y-%m-%d} and is awaiting confirmation.",
+        [appointment.client_id, appointment.veterinarian_id],
+    )
+
+
+def consultation_recorded(consultation, client_id, date):
+    message = f"The consultation notes for your appointment on {date:%Y-%m-%d} are available."
+    if consultation.follow_up_required and consultation.follow_up_date:
+        message += f" A follow-up is recommended on {consultation.follow_up_date:%Y-%m-%d}."
+    return Event(
+        'consultation', "Consultation recorded", message,
+        [client_id], sender=consultation.veterinarian_id,
+    )
+
+
+def follow_up_requested(record, owner_id):
+    return Event(
+        'consultation', "Follow-up needed",
+        f"{record.pet.name} needs a follow-up visit on {record.follow_up_date:%Y-%m-%d}.",
+        [owner_id], sender=record.veterinarian_id,
+    )
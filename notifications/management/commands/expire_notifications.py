@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Move read notifications older than the retention period into the archive table, or delete them, "
+        "one primary key range per short transaction. Safe to run while the API is serving."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=retention.RETENTION_DAYS,
+                            help="Expire read notifications older than this many days")
+        parser.add_argument('--delete', action='store_true', help="Delete instead of archiving")
+        parser.add_argument('--chunk-size', type=int, default=retention.CHUNK_SIZE,
+                            help="Primary key range handled per transaction")
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between ranges, to leave room for other writers")
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['chunk_size'] < 1 or options['pause'] < 0:
+            raise CommandError("--days and --pause cannot be negative and --chunk-size must be positive.")
+
+        started = time.perf_counter()
+        moved = 0
+        chunks = retention.expire_chunks(
+            days=options['days'], archive=not options['delete'],
+            chunk_size=options['chunk_size'], pause=options['pause'],
+        )
+        for last_id, rows in chunks:
+            moved += rows
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Up to id {last_id}: {moved} rows, {_rate(moved, started)} rows/s")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Deleted' if options['delete'] else 'Archived'} {moved} read notifications older than "
+            f"{options['days']} days in {time.perf_counter() - started:.1f}s ({_rate(moved, started)} rows/s)."
+        ))
+
+
+def _rate(rows, started):
+    elapsed = time.perf_counter() - started
+    return f"{rows / elapsed:.0f}" if elapsed else "0"
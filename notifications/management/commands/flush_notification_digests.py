@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications import digests
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver the digests of staged notifications whose window has passed. "
+        "Run once, or keep running with --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=0,
+                            help="Flush again every this many seconds; 0 flushes once and exits")
+        parser.add_argument('--chunk-size', type=int, default=digests.FLUSH_CHUNK_SIZE,
+                            help="Recipients merged per transaction")
+
+    def handle(self, *args, **options):
+        if options['every'] < 0 or options['chunk_size'] < 1:
+            raise CommandError("--every cannot be negative and --chunk-size must be positive.")
+
+        while True:
+            started = time.perf_counter()
+            written, merged = digests.flush(chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written} digests of {merged} notifications in {time.perf_counter() - started:.1f}s."
+            ))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -1,8 +1,47 @@
-from django.db import models
+from collections import Counter, defaultdict
+
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
+def publish_on_commit(recipient_ids):
+    """Wake the recipients' live streams once the new rows are visible to them"""
+    from .broker import get_broker
+
+    recipient_ids = set(recipient_ids)
+    if recipient_ids:
+        transaction.on_commit(lambda: get_broker().publish(recipient_ids), robust=True)
+
+
+class NotificationQuerySet(models.QuerySet):
+
+    def unread(self):
+        # read=False compiles to NOT "read", which SQLite cannot seek the (recipient, read, created_at) index on
+        return self.filter(read=Value(False))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Insert and count the unread notifications on their recipients' badges, in one transaction"""
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            NotificationCounter.add(Counter(obj.recipient_id for obj in created if not obj.read))
+            publish_on_commit(obj.recipient_id for obj in created)
+        return created
+
+    def delete(self):
+        """Delete and take the unread rows off their recipients' badges"""
+        with transaction.atomic(using=self.db):
+            # Locked, so a concurrent read change cannot slip in between the count and the delete
+            rows = self.order_by().select_for_update().values_list('recipient_id', 'read')
+            unread = Counter(recipient_id for recipient_id, read in rows if not read)
+            deleted = super().delete()
+            NotificationCounter.add({user_id: -count for user_id, count in unread.items()})
+        return deleted
+
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = (
         ('appointment', 'Appointment'),
@@ -10,6 +49,7 @@ class Notification(models.Model):
         ('message', 'Message'),
         ('payment', 'Payment'),
         ('system', 'System'),
+        ('vaccination', 'Vaccination'),
     )
 
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -18,10 +58,153 @@ class Notification(models.Model):
     title = models.CharField(max_length=255)
     message = models.TextField()
     read = models.BooleanField(default=False)
+    # More than 1 for a digest of notifications merged by notifications.digests
+    count = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = NotificationQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's unread notifications in date order: counter rebuilds and mark-as-read ranges
+            models.Index(fields=['recipient', 'read', 'created_at'], name='notif_recipient_read_idx'),
+        ]
 
     def __str__(self):
         return f"To {self.recipient.email} - {self.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_read = instance.__dict__.get('read')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Keep the recipient's unread counter in step with inserts and read changes"""
+        adding = self._state.adding
+        was_read = getattr(self, '_loaded_read', None)
+        with transaction.atomic():
+            if not adding and was_read is not None and was_read != self.read:
+                # Only the request that actually flips the stored value moves the counter
+                flipped = type(self).objects.filter(pk=self.pk, read=was_read).update(read=self.read)
+                NotificationCounter.add({self.recipient_id: -flipped if self.read else flipped})
+            super().save(*args, **kwargs)
+            if adding:
+                publish_on_commit([self.recipient_id])
+            if adding and not self.read:
+                NotificationCounter.add({self.recipient_id: 1})
+        self._loaded_read = self.read
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            read = type(self).objects.select_for_update().filter(pk=self.pk).values_list('read', flat=True).first()
+            deleted = super().delete(*args, **kwargs)
+            if read is False:
+                NotificationCounter.add({self.recipient_id: -1})
+        return deleted
+
+
+class PendingNotification(models.Model):
+    """A notification held back to be merged into its recipient's next digest"""
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_notifications')
+    sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The flush groups by type then recipient and reads each group oldest first
+            models.Index(fields=['notification_type', 'recipient', 'created_at'], name='pending_notif_group_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pending for {self.recipient_id} - {self.title}"
+
+
+class NotificationArchive(models.Model):
+    """A read notification moved out of the live table by notifications.retention, keeping its id"""
+
+    id = models.BigIntegerField(primary_key=True)
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'created_at'], name='notif_archive_recipient_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived for {self.recipient_id} - {self.title}"
+
+
+class NotificationCounter(models.Model):
+    """
+    Unread notifications per user, for the app badge. Kept up to date by
+    every insert, read change and delete, and rebuilt from the notifications table
+    with rebuild() or lazily for users who have no row yet.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+    @classmethod
+    def add(cls, changes, batch_size=500):
+        """
+        Apply {user id: change} to the counters, one UPDATE per distinct change.
+        Users without a counter yet are skipped: theirs is counted in full when first read.
+        """
+        by_change = defaultdict(list)
+        for user_id, change in changes.items():
+            if change:
+                by_change[change].append(user_id)
+        for change, user_ids in by_change.items():
+            for start in range(0, len(user_ids), batch_size):
+                cls.objects.filter(user_id__in=user_ids[start:start + batch_size]).update(
+                    unread=Greatest(F('unread') + change, Value(0))
+                )
+
+    @classmethod
+    def unread_for(cls, user_id):
+        """The user's unread count; the first call for a user counts it from the notifications"""
+        unread = cls.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+        if unread is not None:
+            return unread
+        # Create the row before counting, so inserts from here on update it rather than skip it
+        counter, created = cls.objects.get_or_create(user_id=user_id)
+        if not created:
+            return counter.unread
+        with transaction.atomic():
+            # Inserts committed before the count are in it; later ones wait on the lock and add to it
+            cls.objects.select_for_update().filter(user_id=user_id).values_list('pk', flat=True).first()
+            unread = Notification.objects.unread().filter(recipient_id=user_id).count()
+            cls.objects.filter(user_id=user_id).update(unread=unread)
+        return unread
+
+    @classmethod
+    def rebuild(cls, batch_size=2000):
+        """Recount every user's unread notifications; returns the number of counters written"""
+        counts = dict(
+            Notification.objects.unread().order_by().values_list('recipient_id').annotate(total=models.Count('pk'))
+        )
+        with transaction.atomic():
+            cls.objects.exclude(user_id__in=list(counts)).update(unread=0)
+            rows = list(counts.items())
+            for start in range(0, len(rows), batch_size):
+                cls.objects.bulk_create(
+                    [cls(user_id=user_id, unread=unread) for user_id, unread in rows[start:start + batch_size]],
+                    update_conflicts=True, unique_fields=['user'], update_fields=['unread'],
+                )
+        return len(counts)
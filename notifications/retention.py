@@ -0,0 +1,73 @@
+"""
+Retention of read notifications.
+
+Read notifications older than the retention period are moved into
+NotificationArchive (or deleted) so the live table that the list, stream
+and counter queries read stays small. The job walks primary key ranges of
+`chunk_size` ids, oldest first, with one short transaction per range, so
+it holds locks on at most one range at a time. It can run alongside the
+API. Ids are allocated in created_at order, so every expired row has an
+id no higher than the newest expired row, and the walk stops there.
+
+Only read rows are touched, so the unread counters stay as they are.
+"""
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationArchive
+
+
+RETENTION_DAYS = 90
+
+# Primary key range handled per transaction
+CHUNK_SIZE = 1000
+
+ARCHIVED_FIELDS = [
+    'id', 'recipient_id', 'sender_id', 'notification_type', 'title', 'message', 'count', 'created_at',
+]
+
+
+def expired(days=RETENTION_DAYS, now=None):
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return Notification.objects.filter(read=True, created_at__lt=cutoff).order_by()
+
+
+def expire_chunks(days=RETENTION_DAYS, archive=True, chunk_size=CHUNK_SIZE, pause=0, now=None):
+    """
+    Archive (or with archive=False delete) read notifications older than
+    `days`, one primary key range per transaction, sleeping `pause` seconds
+    between ranges. Yields (last id of the range, rows moved) per range.
+    """
+    candidates = expired(days, now)
+    first = candidates.order_by('pk').values_list('pk', flat=True).first()
+    if first is None:
+        return
+    last = candidates.order_by('-pk').values_list('pk', flat=True).first()
+    for start in range(first, last + 1, chunk_size):
+        stop = min(start + chunk_size, last + 1)
+        yield stop - 1, _expire_range(candidates.filter(pk__gte=start, pk__lt=stop), archive)
+        if pause and stop <= last:
+            time.sleep(pause)
+
+
+def expire(**kwargs):
+    """Run expire_chunks to the end; returns the number of rows moved"""
+    return sum(moved for _, moved in expire_chunks(**kwargs))
+
+
+def _expire_range(rows, archive):
+    with transaction.atomic():
+        # Rows the API is writing to right now are left for the next run on backends with row locks
+        rows = rows.select_for_update(skip_locked=True)
+        if archive:
+            rows = list(rows.values(*ARCHIVED_FIELDS))
+            NotificationArchive.objects.bulk_create([NotificationArchive(**row) for row in rows])
+            pks = [row['id'] for row in rows]
+        else:
+            pks = list(rows.values_list('pk', flat=True))
+        if pks:
+            Notification.objects.filter(pk__in=pks).delete()
+    return len(pks)
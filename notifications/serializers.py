@@ -9,6 +9,18 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notification
         fields = [
             'id', 'recipient', 'recipient_name', 'sender', 'sender_name',
-            'notification_type', 'title', 'message', 'read', 'created_at'
+            'notification_type', 'title', 'message', 'count', 'read', 'created_at'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'count', 'created_at']
+
+
+class MarkReadSerializer(serializers.Serializer):
+    """Optional created_at range; without one every unread notification is marked"""
+
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if 'since' in data and 'until' in data and data['since'] > data['until']:
+            raise serializers.ValidationError({"since": "since must not be after until."})
+        return data
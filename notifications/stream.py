@@ -0,0 +1,79 @@
+"""
+Live delivery of new notifications to connected users.
+
+The stream endpoints are async views: an idle connection is one coroutine
+waiting on its broker subscription (see notifications.broker), not a
+client re-polling the list endpoint. A woken stream reads the user's rows
+after the last id it sent, one seek on the recipient index. An idle stream
+only sends a keep-alive comment every NOTIFICATION_STREAM_HEARTBEAT
+seconds; rows created by other processes reach it through the broker
+(see notifications.broker.TableBroker).
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .broker import get_broker
+from .models import Notification
+from .serializers import NotificationSerializer
+
+
+# Rows sent per read; a stream that fills one reads again straight away
+BATCH_SIZE = 50
+
+RETRY_MILLISECONDS = 5000
+
+
+def authenticate(request):
+    """The user DRF's configured authenticators find on `request`, or None"""
+    request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = request.user
+    except APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+def latest_id(user_id):
+    return Notification.objects.filter(recipient_id=user_id).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def fetch(user_id, after):
+    """The user's notifications with ids above `after`, oldest first, serialized"""
+    rows = (
+        Notification.objects.filter(recipient_id=user_id, pk__gt=after)
+        .select_related('sender', 'recipient').order_by('pk')[:BATCH_SIZE]
+    )
+    return NotificationSerializer(rows, many=True).data
+
+
+async def wait_for_notifications(user_id, after, timeout):
+    """The user's notifications after `after`, waiting up to `timeout` seconds for one to arrive"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    with get_broker().subscribe(user_id) as subscription:
+        # Subscribed before reading, so nothing published in between is missed
+        rows = await sync_to_async(fetch)(user_id, after)
+        # A wake-up can find nothing new (the broker carries no payloads); wait out the rest then
+        while not rows and await subscription.wait(deadline - asyncio.get_running_loop().time()):
+            rows = await sync_to_async(fetch)(user_id, after)
+    return rows
+
+
+async def events(user_id, after, heartbeat):
+    """Server-sent events for each new notification, with keep-alive comments while idle"""
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+    with get_broker().subscribe(user_id) as subscription:
+        while True:
+            rows = await sync_to_async(fetch)(user_id, after)
+            for row in rows:
+                after = row['id']
+                yield f"id: {after}\nevent: notification\ndata: {json.dumps(row, default=str)}\n\n"
+            if len(rows) == BATCH_SIZE:
+                continue
+            # Nothing to read until the broker wakes the stream
+            while not await subscription.wait(heartbeat):
+                yield ": keep-alive\n\n"
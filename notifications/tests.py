@@ -1,3 +1,414 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import time
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import CustomUser
+from appointments.models import Appointment, Consultation
+from medical_records.models import MedicalRecord
+from pets.models import PetProfile
+from . import digests, fanout, retention, stream
+from .broker import get_broker
+from .models import Notification, NotificationArchive, NotificationCounter, PendingNotification
+
+
+class NotificationQueryCountTests(APITestCase):
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+
+    def test_notification_list(self):
+        """Sender and recipient are joined, not fetched per row"""
+        self.client.force_authenticate(self.owner)
+        for count in (2, 6):
+            Notification.objects.bulk_create([
+                Notification(recipient=self.owner, sender=self.vet, notification_type='appointment',
+                             title='Booked', message='Your appointment was confirmed.')
+                for _ in range(count)
+            ])
+            with self.assertNumQueries(1):
+                response = self.client.get('/vetcare/notifications/notification')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['results'][0]['sender_name'], self.vet.email)
+
+
+@override_settings(NOTIFICATION_DIGEST_WINDOWS={})
+class FanoutTests(APITestCase):
+    """Appointment and record events notify the people concerned after commit (digests off)"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=2)
+        self.tomorrow = timezone.now().date() + timedelta(days=1)
+
+    def appointment(self, **fields):
+        values = dict(client=self.owner, veterinarian=self.vet, pet=self.pet, date=self.tomorrow, reason='Checkup')
+        values.update(fields)
+        return Appointment.objects.bulk_create([Appointment(**values)])[0]
+
+    def received(self, user):
+        return list(Notification.objects.filter(recipient=user).order_by('pk').values_list('title', flat=True))
+
+    def test_recipients_are_coalesced(self):
+        event = fanout.Event('system', 'Hi', 'Hello', [self.owner.pk, self.vet.pk, self.owner.pk, None], sender=self.vet.pk)
+        self.assertEqual(event.recipient_ids(), [self.owner.pk])
+
+    def test_nothing_is_written_before_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Appointment.objects.create(client=self.owner, veterinarian=self.vet, pet=self.pet, date=self.tomorrow, reason='Checkup')
+            self.assertEqual(Notification.objects.count(), 0)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(self.received(self.vet), ['New appointment request'])
+        self.assertEqual(self.received(self.owner), [])
+
+    def test_status_transitions(self):
+        confirmed, cancelled = self.appointment(), self.appointment()
+        self.client.force_authenticate(self.vet)
+        # The update endpoint cannot change the status, so no change goes by unannounced
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/vetcare/appointments/appointment/{confirmed.pk}/update/', {'status': 'confirmed'}, format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.received(self.owner), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/vetcare/appointments/appointment/{confirmed.pk}/confirm/', {'time': '10:00'}, format='json')
+        self.assertEqual(self.received(self.owner), ['Appointment confirmed'])
+
+        # A client cancelling tells the vet, not themselves
+        self.client.force_authenticate(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/vetcare/appointments/appointment/{cancelled.pk}/cancel/')
+        self.assertEqual(self.received(self.vet), ['Appointment cancelled'])
+        self.assertEqual(len(self.received(self.owner)), 1)
+
+    def test_bulk_transition_writes_once(self):
+        appointments = [self.appointment() for _ in range(5)]
+        self.client.force_authenticate(self.vet)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/vetcare/appointments/appointment/bulk/', {
+                'ids': [appointment.pk for appointment in appointments], 'status': Appointment.CANCELLED,
+            }, format='json')
+        self.assertEqual(response.data['updated'], 5)
+        self.assertEqual(len(callbacks), 1)
+        with CaptureQueriesContext(connection) as queries:
+            callbacks[0]()
+        # One INSERT for all five, plus the recipient's badge counter
+        self.assertEqual([query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']], ['INSERT', 'UPDATE'])
+        self.assertEqual(self.received(self.owner), ['Appointment cancelled'] * 5)
+
+    def test_consultation_and_follow_up(self):
+        completed = self.appointment(status=Appointment.COMPLETED, date=timezone.now().date())
+        with self.captureOnCommitCallbacks(execute=True):
+            Consultation.objects.create(
+                appointment=completed, veterinarian=self.vet, diagnosis='Otitis', notes='Ears',
+                follow_up_required=True, follow_up_date=self.tomorrow,
+            )
+            record = MedicalRecord.objects.create(
+                pet=self.pet, veterinarian=self.vet, diagnosis='Otitis', treatment='Drops',
+                follow_up_required=True, follow_up_date=self.tomorrow,
+            )
+        self.assertEqual(self.received(self.owner), ['Consultation recorded', 'Follow-up needed'])
+
+        # Edits that leave the follow-up alone do not notify again
+        record = MedicalRecord.objects.get(pk=record.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            record.notes = 'Improving'
+            record.save()
+            record.follow_up_date = self.tomorrow + timedelta(days=7)
+            record.save()
+        self.assertEqual(self.received(self.owner)[-1], 'Follow-up needed')
+        self.assertEqual(len(self.received(self.owner)), 3)
+
+
+class UnreadCounterTests(APITestCase):
+    """The badge count is a per-user counter kept in step with inserts and reads"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.client.force_authenticate(self.owner)
+
+    def send(self, count, read=False):
+        return Notification.objects.bulk_create([
+            Notification(recipient=self.owner, sender=self.vet, notification_type='system',
+                         title='Hello', message='Hello', read=read)
+            for _ in range(count)
+        ])
+
+    def unread(self):
+        with self.assertNumQueries(1):
+            return self.client.get('/vetcare/notifications/notification/unread-count/').data['unread']
+
+    def test_counter_follows_inserts_and_reads(self):
+        self.send(3)
+        # Counted from the table the first time
+        response = self.client.get('/vetcare/notifications/notification/unread-count/')
+        self.assertEqual(response.data['unread'], 3)
+
+        self.send(2)
+        self.send(4, read=True)
+        Notification.objects.create(recipient=self.owner, notification_type='system', title='One', message='One')
+        self.assertEqual(self.unread(), 6)
+
+        first = Notification.objects.filter(recipient=self.owner, read=False).first()
+        self.client.patch(f'/vetcare/notifications/notification/{first.pk}/', {'read': True}, format='json')
+        self.client.patch(f'/vetcare/notifications/notification/{first.pk}/', {'read': True}, format='json')
+        self.assertEqual(self.unread(), 5)
+        self.client.patch(f'/vetcare/notifications/notification/{first.pk}/', {'read': False}, format='json')
+        self.assertEqual(self.unread(), 6)
+
+    def test_concurrent_reads_count_once(self):
+        self.send(2)
+        self.assertEqual(NotificationCounter.unread_for(self.owner.pk), 2)
+        # Two requests loaded the same unread row before either saved
+        first = Notification.objects.filter(recipient=self.owner).first()
+        second = Notification.objects.get(pk=first.pk)
+        for copy in (first, second):
+            copy.read = True
+            copy.save()
+        self.assertEqual(self.unread(), 1)
+
+    def test_deletes_update_counter(self):
+        unread = self.send(3)
+        self.send(2, read=True)
+        self.assertEqual(NotificationCounter.unread_for(self.owner.pk), 3)
+
+        Notification.objects.get(pk=unread[0].pk).delete()
+        self.assertEqual(self.unread(), 2)
+        Notification.objects.filter(recipient=self.owner).delete()
+        self.assertEqual(self.unread(), 0)
+
+    def test_mark_read(self):
+        old, new = self.send(2)
+        Notification.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=3))
+        self.assertEqual(NotificationCounter.unread_for(self.owner.pk), 2)
+
+        url = '/vetcare/notifications/notification/read/'
+        response = self.client.post(url, {'until': (timezone.now() - timedelta(days=1)).isoformat()}, format='json')
+        self.assertEqual(response.data, {'marked': 1, 'unread': 1})
+        self.assertEqual(self.client.post(url, {}, format='json').data, {'marked': 1, 'unread': 0})
+        self.assertFalse(Notification.objects.filter(recipient=self.owner, read=False).exists())
+        self.assertEqual(self.client.post(url, {
+            'since': timezone.now().isoformat(), 'until': (timezone.now() - timedelta(days=1)).isoformat(),
+        }, format='json').status_code, 400)
+
+        # Other users' counters are untouched, and a rebuild agrees
+        Notification.objects.create(recipient=self.vet, notification_type='system', title='Hi', message='Hi')
+        self.assertEqual(NotificationCounter.unread_for(self.vet.pk), 1)
+        NotificationCounter.objects.update(unread=42)
+        NotificationCounter.rebuild()
+        self.assertEqual(NotificationCounter.unread_for(self.owner.pk), 0)
+        self.assertEqual(NotificationCounter.unread_for(self.vet.pk), 1)
+
+
+@override_settings(NOTIFICATION_STREAM_HEARTBEAT=0.05, NOTIFICATION_BROKER_POLL=0.05)
+class LiveDeliveryTests(APITestCase):
+    """The async stream and long-poll endpoints wait on the broker, not on the database"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.owner).access_token}'}
+
+    def send(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(recipient=self.owner, notification_type='system', title=title, message=title)
+
+    async def test_long_poll(self):
+        first = await sync_to_async(self.send)('First')
+        url = '/vetcare/notifications/notification/poll/'
+        response = await self.async_client.get(url, {'after': 0, 'timeout': 0}, headers=self.headers)
+        self.assertEqual([row['title'] for row in response.json()['results']], ['First'])
+        self.assertEqual(response.json()['after'], first.pk)
+
+        # Nothing new: empty once the timeout passes
+        response = await self.async_client.get(url, {'timeout': 0}, headers=self.headers)
+        self.assertEqual(response.json(), {'results': [], 'after': first.pk})
+
+        # A waiting poll returns as soon as a notification is committed. Driven directly:
+        # the test client would not run the commit until the request had finished.
+        waiting = asyncio.ensure_future(stream.wait_for_notifications(self.owner.pk, first.pk, 10))
+        while not get_broker().listeners():
+            await asyncio.sleep(0.01)
+        started = time.monotonic()
+        await sync_to_async(self.send)('Second')
+        rows = await waiting
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([row['title'] for row in rows], ['Second'])
+        self.assertEqual(get_broker().listeners(), 0)
+
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, {'after': 'x'}, headers=self.headers)).status_code, 400)
+
+    async def test_event_stream(self):
+        first = await sync_to_async(self.send)('First')
+        response = await self.async_client.get(
+            '/vetcare/notifications/notification/stream/', headers={**self.headers, 'Last-Event-ID': '0'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+        event = await anext(chunks)
+        self.assertTrue(event.startswith(f'id: {first.pk}\nevent: notification\n'.encode()))
+        self.assertEqual(json.loads(event.split(b'data: ')[1])['title'], 'First')
+        # Idle: keep-alives
+        self.assertEqual(await anext(chunks), b': keep-alive\n\n')
+
+        await sync_to_async(self.send)('Second')
+        event = await anext(chunks)
+        while event == b': keep-alive\n\n':
+            event = await anext(chunks)
+        self.assertIn(b'"title": "Second"', event)
+
+    async def test_rows_from_other_processes_wake_the_stream(self):
+        events = stream.events(self.owner.pk, 0, heartbeat=0.05)
+        await anext(events)
+        self.assertEqual(await anext(events), ': keep-alive\n\n')
+
+        # Created as another process would: no publish reaches this one, only the broker's watcher sees it
+        await sync_to_async(Notification.objects.create)(
+            recipient=self.owner, notification_type='system', title='Elsewhere', message='Elsewhere'
+        )
+        started = time.monotonic()
+        event = await anext(events)
+        while event == ': keep-alive\n\n' and time.monotonic() - started < 5:
+            event = await anext(events)
+        self.assertIn('"title": "Elsewhere"', event)
+        await events.aclose()
+        self.assertEqual(get_broker().listeners(), 0)
+
+    async def test_stream_unsubscribes_when_closed(self):
+        events = stream.events(self.owner.pk, 0, heartbeat=0.01)
+        await anext(events)
+        self.assertEqual(await anext(events), ': keep-alive\n\n')
+        self.assertEqual(get_broker().listeners(), 1)
+        # What the ASGI handler's cancellation on disconnect amounts to
+        await events.aclose()
+        self.assertEqual(get_broker().listeners(), 0)
+
+
+@override_settings(NOTIFICATION_DIGEST_WINDOWS={'appointment': 600})
+class DigestTests(APITestCase):
+    """Events arriving inside a recipient's open window are merged into a digest once it has passed"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.clients = [
+            CustomUser.objects.create_user(f'owner{i}@example.com', 'password123', role=CustomUser.CLIENT)
+            for i in range(3)
+        ]
+
+    def notification(self, recipient, title, sender=None, notification_type='appointment'):
+        return Notification(recipient=recipient, sender=sender, notification_type=notification_type, title=title, message=title)
+
+    def test_burst_becomes_one_digest(self):
+        requests = [self.notification(self.vet, 'New appointment request', sender=client) for client in self.clients * 13]
+        requests.append(self.notification(self.vet, 'Appointment cancelled', sender=self.clients[0]))
+        written, staged = digests.deliver(requests + [
+            self.notification(self.clients[0], 'Appointment confirmed', sender=self.vet),
+            self.notification(self.clients[1], 'Consultation recorded', notification_type='consultation'),
+        ])
+        # The first of each recipient's burst opens the window and goes out at once, as do lone events
+        self.assertEqual((written, staged), (3, 37 + 2))
+        self.assertEqual(
+            set(Notification.objects.values_list('recipient', 'title')),
+            {(self.vet.pk, 'New appointment request'), (self.clients[0].pk, 'Appointment confirmed'),
+             (self.clients[1].pk, 'Consultation recorded')},
+        )
+
+        # Nothing is due before the window has passed
+        self.assertEqual(digests.flush(), (0, 0))
+        with self.assertNumQueries(10):
+            self.assertEqual(digests.flush(timezone.now() + timedelta(minutes=11)), (1, 39))
+        self.assertFalse(PendingNotification.objects.exists())
+
+        digest = Notification.objects.get(recipient=self.vet, count__gt=1)
+        self.assertEqual(digest.count, 39)
+        self.assertEqual(digest.title, '39 appointment updates')
+        self.assertEqual(digest.message, 'New appointment request (38); Appointment cancelled.')
+        self.assertIsNone(digest.sender)
+        self.assertEqual(NotificationCounter.unread_for(self.vet.pk), 2)
+
+    def test_events_inside_an_open_window_are_staged(self):
+        self.assertEqual(digests.deliver([self.notification(self.vet, 'First')]), (1, 0))
+        self.assertEqual(digests.deliver([self.notification(self.vet, 'Second')]), (0, 1))
+        # Another recipient's window is separate
+        self.assertEqual(digests.deliver([self.notification(self.clients[0], 'Other')]), (1, 0))
+
+        # Once the window has closed and the staged rows are flushed, the next event is lone again
+        Notification.objects.update(created_at=timezone.now() - timedelta(minutes=11))
+        PendingNotification.objects.update(created_at=timezone.now() - timedelta(minutes=11))
+        self.assertEqual(digests.flush(), (1, 1))
+        Notification.objects.update(created_at=timezone.now() - timedelta(minutes=11))
+        self.assertEqual(digests.deliver([self.notification(self.vet, 'Third')]), (1, 0))
+
+    def test_types_without_a_window_are_flushed(self):
+        digests.deliver([self.notification(self.clients[0], 'Appointment confirmed') for _ in range(2)])
+        with override_settings(NOTIFICATION_DIGEST_WINDOWS={}):
+            self.assertEqual(digests.flush(), (1, 1))
+
+    def test_flush_command(self):
+        digests.deliver([self.notification(self.clients[0], 'Appointment confirmed') for _ in range(3)])
+        PendingNotification.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        out = io.StringIO()
+        call_command('flush_notification_digests', stdout=out)
+        self.assertIn('Wrote 1 digests of 2 notifications', out.getvalue())
+
+
+class RetentionTests(APITestCase):
+    """Old read notifications leave the live table range by range; unread ones stay"""
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        Notification.objects.bulk_create([
+            Notification(recipient=self.owner, sender=self.vet, notification_type='appointment',
+                         title=f"Notification {i}", message="...", read=i % 3 != 0, count=i + 1)
+            for i in range(12)
+        ])
+        self.ids = list(Notification.objects.order_by('pk').values_list('pk', flat=True))
+        # The first 9 are old, the rest recent
+        Notification.objects.filter(pk__in=self.ids[:9]).update(created_at=timezone.now() - timedelta(days=120))
+        self.unread = NotificationCounter.unread_for(self.owner.pk)
+
+    def test_archive_in_ranges(self):
+        chunks = list(retention.expire_chunks(days=90, chunk_size=4))
+        # Ranges start at the oldest expired id and stop at the newest
+        self.assertEqual(chunks, [(self.ids[4], 3), (self.ids[8], 3)])
+
+        expired = [pk for i, pk in enumerate(self.ids[:9]) if i % 3 != 0]
+        self.assertEqual(sorted(NotificationArchive.objects.values_list('pk', flat=True)), expired)
+        self.assertFalse(Notification.objects.filter(pk__in=expired).exists())
+        self.assertEqual(Notification.objects.count(), 6)
+        archived = NotificationArchive.objects.get(pk=self.ids[1])
+        self.assertEqual((archived.title, archived.count, archived.sender), ("Notification 1", 2, self.vet))
+        self.assertEqual(NotificationCounter.unread_for(self.owner.pk), self.unread)
+
+        # Nothing left to do on a second run
+        self.assertEqual(retention.expire(days=90), 0)
+
+    def test_delete(self):
+        self.assertEqual(retention.expire(days=90, archive=False, chunk_size=2), 6)
+        self.assertFalse(NotificationArchive.objects.exists())
+        self.assertEqual(Notification.objects.count(), 6)
+
+    def test_command_reports_rate(self):
+        out = io.StringIO()
+        call_command('expire_notifications', '--days', '90', '--chunk-size', '3', stdout=out)
+        self.assertRegex(out.getvalue(), r"Archived 6 read notifications older than 90 days in .*\(\d+ rows/s\)")
+        self.assertEqual(NotificationArchive.objects.count(), 6)
@@ -1,7 +1,11 @@
 from django.urls import path
-from .views import NotificationListView, NotificationDetailView
+from .views import NotificationListView, NotificationDetailView, UnreadCountView, MarkReadView, notification_stream, notification_poll
 
 urlpatterns = [
     path('notification', NotificationListView.as_view(), name='notification-list'),
+    path('notification/unread-count/', UnreadCountView.as_view(), name='notification-unread-count'),
+    path('notification/read/', MarkReadView.as_view(), name='notification-mark-read'),
+    path('notification/stream/', notification_stream, name='notification-stream'),
+    path('notification/poll/', notification_poll, name='notification-poll'),
     path('notification/<int:pk>/', NotificationDetailView.as_view(), name='notification-detail'),
 ]
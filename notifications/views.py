@@ -1,13 +1,21 @@
-from rest_framework import generics, permissions
-from .models import Notification
-from .serializers import NotificationSerializer
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+
+from . import stream
+from .models import Notification, NotificationCounter
+from .serializers import MarkReadSerializer, NotificationSerializer
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('sender', 'recipient')
 
 
 class NotificationDetailView(generics.RetrieveUpdateAPIView):
@@ -16,4 +24,97 @@ class NotificationDetailView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('sender', 'recipient')
+
+
+class UnreadCountView(generics.GenericAPIView):
+    """Unread notifications for the app badge: one primary key lookup on the user's counter"""
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
+
+    def get(self, request):
+        return Response({"unread": NotificationCounter.unread_for(request.user.pk)})
+
+
+class MarkReadView(generics.GenericAPIView):
+    """
+    Mark the user's unread notifications as read with one UPDATE, all of them
+    or those created in the optional since/until range.
+    """
+    serializer_class = MarkReadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        bounds = serializer.validated_data
+
+        # Range scan on (recipient, read, created_at)
+        unread = Notification.objects.unread().filter(recipient=request.user)
+        if 'since' in bounds:
+            unread = unread.filter(created_at__gte=bounds['since'])
+        if 'until' in bounds:
+            unread = unread.filter(created_at__lte=bounds['until'])
+        with transaction.atomic():
+            marked = unread.update(read=True)
+            NotificationCounter.add({request.user.pk: -marked})
+        return Response(
+            {"marked": marked, "unread": NotificationCounter.unread_for(request.user.pk)},
+            status=status.HTTP_200_OK
+        )
+
+
+# LIVE DELIVERY (async views, routed to the ASGI `stream` process; the rest of the API stays on WSGI)
+
+async def _stream_user(request):
+    """(user, after id) for a stream request, or (None, error response)"""
+    user = await sync_to_async(stream.authenticate)(request)
+    if user is None:
+        return None, JsonResponse(
+            {"error": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED
+        )
+    after = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    if after is None:
+        return user, await sync_to_async(stream.latest_id)(user.pk)
+    try:
+        return user, max(int(after), 0)
+    except ValueError:
+        return None, JsonResponse({"error": "after must be a notification id."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@require_GET
+async def notification_stream(request):
+    """
+    Server-sent events: one `notification` event per new notification.
+    Resumes after Last-Event-ID (or ?after=) when given, else sends only
+    notifications created from now on.
+    """
+    user, after = await _stream_user(request)
+    if user is None:
+        return after
+    response = StreamingHttpResponse(
+        stream.events(user.pk, after, settings.NOTIFICATION_STREAM_HEARTBEAT), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+async def notification_poll(request):
+    """
+    Long poll: notifications after ?after= (default: the latest now), returned as
+    soon as there are any or empty after ?timeout= seconds (default and maximum
+    NOTIFICATION_LONG_POLL_TIMEOUT). Pass the returned `after` to the next call.
+    """
+    user, after = await _stream_user(request)
+    if user is None:
+        return after
+    try:
+        timeout = min(float(request.GET.get('timeout', settings.NOTIFICATION_LONG_POLL_TIMEOUT)),
+                      settings.NOTIFICATION_LONG_POLL_TIMEOUT)
+    except ValueError:
+        return JsonResponse({"error": "timeout must be a number of seconds."}, status=status.HTTP_400_BAD_REQUEST)
+    rows = await stream.wait_for_notifications(user.pk, after, max(timeout, 0))
+    return JsonResponse({"results": rows, "after": rows[-1]['id'] if rows else after})
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from . models import PetProfile
+from . models import PetProfile, CareRelationship
 # Register your models here.
 
-admin.site.register(PetProfile)
\ No newline at end of file
+admin.site.register(PetProfile)
+admin.site.register(CareRelationship)
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pets.models import CareRelationship
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the vet-pet care relationship table from existing appointments and "
+        "medical records. Safe to re-run; existing rows get their first/last seen dates recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per INSERT")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        pairs = CareRelationship.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {pairs} care relationships in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,47 @@
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pets import thumbnails
+from pets.models import PetProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Build thumbnails for pet profile images that have none, using the thumbnail process pool. "
+        "Safe to re-run; derivatives that already exist are not rendered again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Also re-check pets that already have thumbnails")
+        parser.add_argument('--batch-size', type=int, default=200, help="Images handed to the pool at a time")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        pets = PetProfile.objects.exclude(profile_image='').exclude(profile_image__isnull=True)
+        if not options['all']:
+            pets = pets.filter(thumbnail_digest='')
+        # Load the ids up front: updating rows under an open SQLite cursor can skip some
+        rows = iter(list(pets.order_by('pk').values_list('pk', 'profile_image')))
+
+        built = failed = 0
+        while batch := list(islice(rows, options['batch_size'])):
+            if settings.PET_THUMBNAIL_WORKERS:
+                results = [thumbnails.executor().submit(thumbnails.render, name) for _, name in batch]
+            else:
+                results = None
+            for index, (pk, name) in enumerate(batch):
+                try:
+                    digest = results[index].result() if results else thumbnails.render(name)
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f"Pet {pk}: {error}")
+                    continue
+                thumbnails.store(pk, name, digest)
+                built += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built thumbnails for {built} pets ({failed} failed) in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CareRelationship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_seen', models.DateField(help_text='Date of the earliest appointment or record')),
+                ('last_seen', models.DateField(help_text='Date of the latest appointment or record')),
+                ('pet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='care_relationships', to='pets.petprofile')),
+                ('veterinarian', models.ForeignKey(limit_choices_to={'role': 'VETERINARIAN'}, on_delete=django.db.models.deletion.CASCADE, related_name='care_relationships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Care Relationship',
+                'verbose_name_plural': 'Care Relationships',
+                'constraints': [models.UniqueConstraint(fields=('veterinarian', 'pet'), name='unique_care_relationship')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0002_care_relationship'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petprofile',
+            name='thumbnail_digest',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 of the image its thumbnails were built from', max_length=64),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Max, Min, Q
+from django.db.models.functions import Greatest, Least, TruncDate
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
@@ -56,6 +58,7 @@ class PetProfile(models.Model):
     medical_conditions = models.TextField(blank=True,help_text="Existing medical conditions")
     current_medications = models.TextField(blank=True,help_text="Current medications")
     profile_image = models.ImageField(upload_to='pets/profiles/%Y/%m/',blank=True,null=True,help_text="Pet's photo")
+    thumbnail_digest = models.CharField(max_length=64,blank=True,editable=False,help_text="SHA-256 of the image its thumbnails were built from")
     notes = models.TextField(blank=True,help_text="Additional notes about the pet")
     is_active = models.BooleanField( default=True, help_text="Whether this pet is still under care")
 
@@ -108,8 +111,38 @@ class PetProfile(models.Model):
             age_in_days = (today - self.date_of_birth).days
             self.age = age_in_days // 365
         
+        # Thumbnails are rebuilt whenever the stored image changes
+        saved_image = getattr(self, '_saved_image', '')
+        image_changed = saved_image is not None and (self.profile_image.name or '') != saved_image
+        if image_changed:
+            self.thumbnail_digest = ''
+
+        saved_owner_id = getattr(self, '_saved_owner_id', None)
         self.full_clean()
         super().save(*args, **kwargs)
+
+        if saved_owner_id is not None and saved_owner_id != self.owner_id:
+            # Search documents carry the owner id they are scoped by
+            from medical_records.search import index_pet_records
+            index_pet_records([self.pk])
+        self._saved_owner_id = self.owner_id
+
+        if image_changed:
+            self._saved_image = self.profile_image.name or ''
+            if self._saved_image:
+                from .thumbnails import schedule
+                schedule(self)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Raw column value, or None when the field was deferred and is unknown
+        if 'profile_image' in instance.__dict__:
+            instance._saved_image = instance.__dict__['profile_image'] or ''
+        else:
+            instance._saved_image = None
+        instance._saved_owner_id = instance.__dict__.get('owner_id')
+        return instance
     
     @property
     def calculated_age(self):
@@ -134,4 +167,201 @@ class PetProfile(models.Model):
             self.medical_conditions or 
             self.allergies or 
             self.current_medications
-        )
\ No newline at end of file
+        )
+
+class CareSourceQuerySet(models.QuerySet):
+    """
+    QuerySet for the models CareRelationship is derived from: bulk inserts
+    record their visits and deletes recompute the pairs they touched, as
+    save() and delete() do for single rows.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            CareRelationship.record_many(obj.care_visit() for obj in created)
+        return created
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            pairs = set(self.order_by().values_list('veterinarian_id', 'pet_id').distinct())
+            deleted = super().delete()
+            CareRelationship.recompute(pairs)
+        return deleted
+
+
+class CareSource:
+    """
+    Mixin for Appointment, MedicalRecord and Vaccination. `care_date` names
+    the attribute holding the visit date; save() calls update_care().
+    """
+
+    care_date = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Deferred fields read as None, so a partial load never recomputes a pair
+        instance._loaded_care_pair = (instance.__dict__.get('veterinarian_id'), instance.__dict__.get('pet_id'))
+        return instance
+
+    def care_visit(self):
+        return self.veterinarian_id, self.pet_id, getattr(self, self.care_date)
+
+    def update_care(self):
+        """Record this visit, and recompute the pair it was moved away from"""
+        CareRelationship.record(*self.care_visit())
+        pair = (self.veterinarian_id, self.pet_id)
+        loaded = getattr(self, '_loaded_care_pair', pair)
+        if loaded != pair:
+            CareRelationship.recompute([loaded])
+        self._loaded_care_pair = pair
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            CareRelationship.recompute([(self.veterinarian_id, self.pet_id)])
+        return deleted
+
+
+class CareRelationship(models.Model):
+    """
+    Denormalized record of which veterinarians have seen which pets, kept
+    current by Appointment, MedicalRecord and Vaccination saves, bulk
+    inserts and deletes (see CareSource). A pair whose last appointment or
+    record is deleted or moved to another vet or pet is removed. Answers
+    "has this vet treated this pet?" and "which pets has this vet treated?"
+    with one indexed lookup instead of scanning appointments and records.
+    """
+
+    veterinarian = models.ForeignKey(CustomUser,on_delete=models.CASCADE,related_name='care_relationships',limit_choices_to={'role': 'VETERINARIAN'})
+    pet = models.ForeignKey(PetProfile,on_delete=models.CASCADE,related_name='care_relationships')
+    first_seen = models.DateField(help_text="Date of the earliest appointment or record")
+    last_seen = models.DateField(help_text="Date of the latest appointment or record")
+
+    class Meta:
+        verbose_name = 'Care Relationship'
+        verbose_name_plural = 'Care Relationships'
+        constraints = [
+            models.UniqueConstraint(fields=['veterinarian', 'pet'], name='unique_care_relationship'),
+        ]
+
+    def __str__(self):
+        return f"{self.veterinarian.email} - {self.pet.name}"
+
+    @classmethod
+    def has_treated(cls, veterinarian, pet):
+        """Check if `veterinarian` has an appointment or record for `pet` (either may be an id)"""
+        return cls.objects.filter(veterinarian=veterinarian, pet=pet).exists()
+
+    @classmethod
+    def record(cls, veterinarian_id, pet_id, seen_on):
+        """Register a visit on `seen_on`, widening the first/last seen range as needed"""
+        if not veterinarian_id or not pet_id:
+            return
+        seen = models.Value(seen_on, output_field=models.DateField())
+        rows = cls.objects.filter(veterinarian_id=veterinarian_id, pet_id=pet_id)
+        changes = {'first_seen': Least('first_seen', seen), 'last_seen': Greatest('last_seen', seen)}
+        if rows.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(veterinarian_id=veterinarian_id, pet_id=pet_id, first_seen=seen_on, last_seen=seen_on)
+        except IntegrityError:
+            # Another request created it first
+            rows.update(**changes)
+
+    @classmethod
+    def record_many(cls, visits, batch_size=2000):
+        """record() for many (veterinarian_id, pet_id, seen_on) visits, with one read and one upsert per batch"""
+        seen = {}
+        for vet_id, pet_id, seen_on in visits:
+            if vet_id and pet_id:
+                cls._widen(seen, (vet_id, pet_id), seen_on, seen_on)
+        if not seen:
+            return
+        with transaction.atomic():
+            # Pairs that already exist keep their range; locked so a concurrent record() is not overwritten
+            existing = cls.objects.select_for_update().filter(
+                veterinarian_id__in={vet_id for vet_id, _ in seen}, pet_id__in={pet_id for _, pet_id in seen},
+            ).values_list('veterinarian_id', 'pet_id', 'first_seen', 'last_seen')
+            for vet_id, pet_id, first, last in existing:
+                if (vet_id, pet_id) in seen:
+                    cls._widen(seen, (vet_id, pet_id), first, last)
+            cls._upsert(seen, batch_size)
+
+    @classmethod
+    def recompute(cls, pairs):
+        """
+        Recompute the range of each (veterinarian_id, pet_id) pair from its
+        appointments, medical records and vaccinations, deleting the pairs
+        that have none left.
+        """
+        pairs = {(vet_id, pet_id) for vet_id, pet_id in pairs if vet_id and pet_id}
+        if not pairs:
+            return
+        match = Q()
+        for vet_id, pet_id in pairs:
+            match |= Q(veterinarian_id=vet_id, pet_id=pet_id)
+        with transaction.atomic():
+            # Lock first: a visit committed after the read below re-creates its pair in record()
+            list(cls.objects.select_for_update().filter(match).values_list('pk', flat=True))
+            seen = cls._seen(match)
+            gone = Q()
+            for vet_id, pet_id in pairs - set(seen):
+                gone |= Q(veterinarian_id=vet_id, pet_id=pet_id)
+            if gone:
+                cls.objects.filter(gone).delete()
+            cls._upsert(seen)
+
+    @classmethod
+    def rebuild(cls, batch_size=2000):
+        """
+        Recompute every relationship from appointments, medical records and vaccinations.
+        Existing rows are overwritten with the recomputed range; returns the number of pairs.
+        """
+        seen = cls._seen()
+        cls._upsert(seen, batch_size)
+        return len(seen)
+
+    @classmethod
+    def _seen(cls, match=None):
+        """{(veterinarian_id, pet_id): (first, last)} over the source rows matching `match`"""
+        from appointments.models import Appointment
+        from medical_records.models import MedicalRecord, Vaccination
+
+        seen = {}
+        sources = [
+            Appointment.objects.values('veterinarian_id', 'pet_id').annotate(first=Min('date'), last=Max('date')),
+            MedicalRecord.objects.filter(veterinarian__isnull=False).values('veterinarian_id', 'pet_id').annotate(
+                first=Min(TruncDate('visit_date')), last=Max(TruncDate('visit_date'))
+            ),
+            Vaccination.objects.filter(veterinarian__isnull=False).values('veterinarian_id', 'pet_id').annotate(
+                first=Min(TruncDate('administered_at')), last=Max(TruncDate('administered_at'))
+            ),
+        ]
+        for source in sources:
+            if match is not None:
+                source = source.filter(match)
+            for row in source.order_by().iterator():
+                cls._widen(seen, (row['veterinarian_id'], row['pet_id']), row['first'], row['last'])
+        return seen
+
+    @staticmethod
+    def _widen(seen, key, first, last):
+        if key in seen:
+            first, last = min(first, seen[key][0]), max(last, seen[key][1])
+        seen[key] = (first, last)
+
+    @classmethod
+    def _upsert(cls, seen, batch_size=2000):
+        """Write the {(veterinarian_id, pet_id): (first, last)} ranges, overwriting existing rows"""
+        pairs = list(seen.items())
+        for start in range(0, len(pairs), batch_size):
+            cls.objects.bulk_create(
+                [cls(veterinarian_id=vet_id, pet_id=pet_id, first_seen=first, last_seen=last)
+                 for (vet_id, pet_id), (first, last) in pairs[start:start + batch_size]],
+                update_conflicts=True,
+                unique_fields=['veterinarian', 'pet'],
+                update_fields=['first_seen', 'last_seen'],
+            )
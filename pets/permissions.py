@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .models import CareRelationship
+
 
 class IsPetOwner(permissions.BasePermission):
     """
@@ -37,18 +39,12 @@ class IsPetOwnerOrVet(permissions.BasePermission):
         user = request.user
         
         # Pet owner has full access
-        if obj.owner == user:
+        if obj.owner_id == user.pk:
             return True
         
         # Veterinarians can view pets they've treated
         if user.role == 'VETERINARIAN' and request.method in permissions.SAFE_METHODS:
-            # Check if vet has treated this pet
-            from appointments.models import Appointment
-            has_treated = Appointment.objects.filter(
-                pet=obj,
-                veterinarian=user
-            ).exists()
-            return has_treated
+            return CareRelationship.has_treated(user, obj)
         
         return False
 
@@ -107,27 +103,12 @@ class CanViewPet(permissions.BasePermission):
         user = request.user
         
         # Pet owner can view
-        if obj.owner == user:
+        if obj.owner_id == user.pk:
             return True
         
-        # Veterinarians who have treated this pet can view
+        # Veterinarians with an appointment or record for this pet can view
         if user.role == 'VETERINARIAN':
-            from appointments.models import Appointment
-            from medical_records.models import MedicalRecord
-            
-            # Check appointments
-            has_appointment = Appointment.objects.filter(
-                pet=obj,
-                veterinarian=user
-            ).exists()
-            
-            # Check medical records
-            has_records = MedicalRecord.objects.filter(
-                pet=obj,
-                veterinarian=user
-            ).exists()
-            
-            return has_appointment or has_records
+            return CareRelationship.has_treated(user, obj)
         
         return False
 
@@ -150,20 +131,12 @@ class IsPetOwnerOrReadOnlyForVet(permissions.BasePermission):
         user = request.user
         
         # Pet owner has full access (read and write)
-        if obj.owner == user:
+        if obj.owner_id == user.pk:
             return True
         
         # Veterinarians have read-only access if they've treated the pet
         if user.role == 'VETERINARIAN' and request.method in permissions.SAFE_METHODS:
-            from appointments.models import Appointment
-            from medical_records.models import MedicalRecord
-            
-            # Check if vet has treated this pet
-            has_treated = (
-                Appointment.objects.filter(pet=obj, veterinarian=user).exists() or
-                MedicalRecord.objects.filter(pet=obj, veterinarian=user).exists()
-            )
-            return has_treated
+            return CareRelationship.has_treated(user, obj)
         
         return False
 
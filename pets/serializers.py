@@ -1,16 +1,50 @@
 # pets/serializers.py
 from rest_framework import serializers
+from django.urls import reverse
 from django.utils import timezone
 
 from .models import PetProfile
+from .thumbnails import FORMATS, SIZES
 from accounts.models import CustomUser
 
 
+class ThumbnailField(serializers.Field):
+    """
+    URLs of the pet's image resized to `size`, one per format.
+    Until the thumbnails are built every format points at the original image.
+    """
+
+    def __init__(self, size, **kwargs):
+        assert size in SIZES, f"Unknown thumbnail size {size!r}"
+        self.size = size
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, pet):
+        if not pet.profile_image:
+            return None
+        if not pet.thumbnail_digest:
+            url = self.absolute(reverse('pets:pet-image', kwargs={'pk': pet.pk}))
+            return {image_format: url for image_format in FORMATS}
+        return {
+            image_format: self.absolute(
+                reverse('pets:pet-thumbnail', kwargs={'pk': pet.pk, 'size': self.size, 'image_format': image_format})
+                + f'?v={pet.thumbnail_digest[:16]}'
+            )
+            for image_format in FORMATS
+        }
+
+    def absolute(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
 class PetProfileListSerializer(serializers.ModelSerializer):
 
     owner_name = serializers.CharField(source='owner.get_full_name', read_only=True)
     owner_email = serializers.EmailField(source='owner.email', read_only=True)
     calculated_age = serializers.CharField(read_only=True)
+    thumbnail = ThumbnailField(size='small')
     
     class Meta:
         model = PetProfile
@@ -18,7 +52,7 @@ class PetProfileListSerializer(serializers.ModelSerializer):
             'id', 'owner', 'owner_name', 'owner_email',
             'name', 'species', 'breed', 'gender',
             'age', 'calculated_age', 'weight',
-            'profile_image', 'is_active', 'created_at'
+            'profile_image', 'thumbnail', 'is_active', 'created_at'
         ]
         read_only_fields = ['id', 'owner', 'created_at']
 
@@ -31,6 +65,7 @@ class PetProfileDetailSerializer(serializers.ModelSerializer):
     calculated_age = serializers.CharField(read_only=True)
     has_medical_conditions = serializers.BooleanField(read_only=True)
     needs_attention = serializers.BooleanField(read_only=True)
+    thumbnail = ThumbnailField(size='large')
     
     class Meta:
         model = PetProfile
@@ -40,7 +75,7 @@ class PetProfileDetailSerializer(serializers.ModelSerializer):
             'date_of_birth', 'age', 'calculated_age',
             'weight', 'microchip_number',
             'allergies', 'medical_conditions', 'current_medications',
-            'profile_image', 'notes', 'is_active',
+            'profile_image', 'thumbnail', 'notes', 'is_active',
             'has_medical_conditions', 'needs_attention',
             'created_at', 'updated_at'
         ]
@@ -118,6 +153,7 @@ class MyPetsSerializer(serializers.ModelSerializer):
    
     calculated_age = serializers.CharField(read_only=True)
     needs_attention = serializers.BooleanField(read_only=True)
+    thumbnail = ThumbnailField(size='medium')
     
     class Meta:
         model = PetProfile
@@ -125,6 +161,6 @@ class MyPetsSerializer(serializers.ModelSerializer):
             'id', 'name', 'species', 'breed', 'gender',
             'age', 'calculated_age', 'weight',
             'allergies', 'medical_conditions', 'current_medications',
-            'needs_attention', 'profile_image', 'is_active'
+            'needs_attention', 'profile_image', 'thumbnail', 'is_active'
         ]
         read_only_fields = ['id']
\ No newline at end of file
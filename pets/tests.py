@@ -1,3 +1,249 @@
-from django.test import TestCase
+import io
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from appointments.models import Appointment
+from medical_records.models import MedicalRecord
+from .models import CareRelationship, PetProfile
+
+
+class PetQueryCountTests(APITestCase):
+    """
+    Pet lists must run a fixed number of queries regardless of how many pets they return.
+    """
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+
+    def add_pets(self, count):
+        for i in range(count):
+            pet = PetProfile.objects.create(owner=self.owner, name=f'Pet {i}', species=PetProfile.CAT, age=1)
+            Appointment.objects.create(client=self.owner, veterinarian=self.vet, pet=pet, reason='Checkup')
+
+    def assertConstantQueries(self, user, url, expected):
+        self.client.force_authenticate(user)
+        for count in (2, 6):
+            self.add_pets(count)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def test_pet_list(self):
+        self.assertConstantQueries(self.owner, '/vetcare/Pets/pet/', 1)
+        self.assertConstantQueries(self.vet, '/vetcare/Pets/pet/', 1)
+
+    def test_active_pets(self):
+        self.assertConstantQueries(self.owner, '/vetcare/Pets/active/', 1)
+        self.assertConstantQueries(self.vet, '/vetcare/Pets/active/', 1)
+
+    def test_pets_by_species(self):
+        self.assertConstantQueries(self.vet, '/vetcare/Pets/species/Cat/', 1)
+
+
+class CareRelationshipTests(APITestCase):
+    """
+    The vet-pet relationship table must follow appointment and record writes,
+    and grant vets access to exactly the pets they have seen.
+    """
+
+    def setUp(self):
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.other_vet = CustomUser.objects.create_user('other@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=3)
+        self.today = timezone.now().date()
+
+    def test_appointment_and_record_writes_widen_range(self):
+        Appointment.objects.create(
+            client=self.owner, veterinarian=self.vet, pet=self.pet,
+            date=self.today + timedelta(days=5), reason='Checkup',
+        )
+        MedicalRecord.objects.create(
+            pet=self.pet, veterinarian=self.vet, diagnosis='Healthy', treatment='None',
+            visit_date=timezone.now() - timedelta(days=30),
+        )
+
+        relationship = CareRelationship.objects.get()
+        self.assertEqual(relationship.first_seen, self.today - timedelta(days=30))
+        self.assertEqual(relationship.last_seen, self.today + timedelta(days=5))
+
+    def test_bulk_create_and_rebuild_match_source_rows(self):
+        Appointment.objects.bulk_create([
+            Appointment(client=self.owner, veterinarian=self.vet, pet=self.pet, date=self.today, reason='A'),
+            Appointment(client=self.owner, veterinarian=self.vet, pet=self.pet,
+                        date=self.today - timedelta(days=10), reason='B'),
+        ])
+        relationship = CareRelationship.objects.get()
+        self.assertEqual((relationship.first_seen, relationship.last_seen), (self.today - timedelta(days=10), self.today))
+
+        CareRelationship.objects.all().delete()
+        self.assertEqual(CareRelationship.rebuild(), 1)
+        self.assertEqual(CareRelationship.rebuild(), 1)
+        relationship = CareRelationship.objects.get()
+        self.assertEqual((relationship.first_seen, relationship.last_seen), (self.today - timedelta(days=10), self.today))
+
+    def test_vet_access_follows_relationship(self):
+        Appointment.objects.create(client=self.owner, veterinarian=self.vet, pet=self.pet, reason='Checkup')
+        pet_url = f'/vetcare/Pets/pet/{self.pet.pk}/'
+        history_url = f'/vetcare/medical-records/pet/{self.pet.pk}/history/'
+
+        self.client.force_authenticate(self.vet)
+        self.assertEqual(self.client.get(pet_url).status_code, 200)
+        self.assertEqual(self.client.get(history_url).status_code, 200)
+        self.assertEqual(self.client.patch(pet_url, {'name': 'Max'}).status_code, 403)
+        self.assertEqual(len(self.client.get('/vetcare/Pets/pet/').data['results']), 1)
+
+        self.client.force_authenticate(self.other_vet)
+        self.assertEqual(self.client.get(pet_url).status_code, 403)
+        self.assertEqual(self.client.get(history_url).status_code, 403)
+        self.assertEqual(self.client.get('/vetcare/Pets/pet/').data['results'], [])
+
+    def test_access_revoked_when_visits_are_deleted_or_moved(self):
+        pet_url = f'/vetcare/Pets/pet/{self.pet.pk}/'
+        appointment = Appointment.objects.create(client=self.owner, veterinarian=self.vet, pet=self.pet, reason='Checkup')
+        record = MedicalRecord.objects.create(
+            pet=self.pet, veterinarian=self.vet, diagnosis='Healthy', treatment='None',
+            visit_date=timezone.now() - timedelta(days=3),
+        )
+        self.client.force_authenticate(self.vet)
+        self.assertEqual(self.client.get(pet_url).status_code, 200)
+
+        # The record still links the vet to the pet, from its own visit date
+        appointment.delete()
+        relationship = CareRelationship.objects.get()
+        self.assertEqual((relationship.first_seen, relationship.last_seen), (self.today - timedelta(days=3),) * 2)
+
+        record = MedicalRecord.objects.get(pk=record.pk)
+        record.veterinarian = self.other_vet
+        record.save()
+        self.assertEqual(self.client.get(pet_url).status_code, 403)
+        self.assertFalse(CareRelationship.has_treated(self.vet, self.pet))
+        self.assertTrue(CareRelationship.has_treated(self.other_vet, self.pet))
+
+        MedicalRecord.objects.filter(pk=record.pk).delete()
+        self.assertFalse(CareRelationship.objects.exists())
+
+
+@override_settings(PET_THUMBNAIL_WORKERS=0)
+class PetProfileImageTests(APITestCase):
+    """Profile images are only served to the owner and vets who treated the pet"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.vet = CustomUser.objects.create_user('vet@example.com', 'password123', role=CustomUser.VETERINARIAN)
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=5)
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), 'orange').save(buffer, 'PNG')
+        self.pet.profile_image.save('rex.png', ContentFile(buffer.getvalue()))
+        self.url = f'/vetcare/Pets/pet/{self.pet.pk}/image/'
+
+    def test_owner_gets_image(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        with self.pet.profile_image.open('rb') as image:
+            self.assertEqual(response.getvalue(), image.read())
+
+    def test_vet_needs_care_relationship(self):
+        self.client.force_authenticate(self.vet)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        MedicalRecord.objects.create(pet=self.pet, veterinarian=self.vet, diagnosis='Checkup', treatment='None')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+@override_settings(PET_THUMBNAIL_WORKERS=0)
+class PetThumbnailTests(APITestCase):
+    """Resized copies of profile images, keyed by the image content"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.owner = CustomUser.objects.create_user('owner@example.com', 'password123', role=CustomUser.CLIENT)
+        self.pet = PetProfile.objects.create(owner=self.owner, name='Rex', species=PetProfile.DOG, age=5)
+        self.client.force_authenticate(self.owner)
+
+    def image(self, colour='orange', size=(1600, 1200)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, colour).save(buffer, 'JPEG')
+        return ContentFile(buffer.getvalue())
+
+    def test_thumbnails_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pet.profile_image.save('rex.jpg', self.image())
+        self.pet.refresh_from_db()
+        self.assertEqual(len(self.pet.thumbnail_digest), 64)
+
+        response = self.client.get(f'/vetcare/Pets/pet/{self.pet.pk}/image/small/webp/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with Image.open(io.BytesIO(response.getvalue())) as thumbnail:
+            self.assertEqual(thumbnail.size, (64, 48))
+
+        response = self.client.get(f'/vetcare/Pets/pet/{self.pet.pk}/image/large/jpeg/')
+        with Image.open(io.BytesIO(response.getvalue())) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', (1024, 768)))
+
+    def test_serializers_pick_their_size(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pet.profile_image.save('rex.jpg', self.image())
+
+        listed = self.client.get('/vetcare/Pets/pet/').data['results'][0]
+        self.assertIn(f'/pet/{self.pet.pk}/image/small/webp/?v=', listed['thumbnail']['webp'])
+        mine = self.client.get('/vetcare/Pets/my-pets/').data['results'][0]
+        self.assertIn('/image/medium/jpeg/', mine['thumbnail']['jpeg'])
+        detail = self.client.get(f'/vetcare/Pets/pet/{self.pet.pk}/').data
+        self.assertIn('/image/large/webp/', detail['thumbnail']['webp'])
+
+    def test_original_served_until_thumbnails_exist(self):
+        self.pet.profile_image.save('rex.jpg', self.image())
+        listed = self.client.get('/vetcare/Pets/pet/').data['results'][0]
+        self.assertTrue(listed['thumbnail']['webp'].endswith(f'/pet/{self.pet.pk}/image/'))
+        self.assertEqual(self.client.get(f'/vetcare/Pets/pet/{self.pet.pk}/image/small/webp/').status_code, 404)
+
+    def test_new_image_replaces_thumbnails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pet.profile_image.save('rex.jpg', self.image())
+        self.pet.refresh_from_db()
+        first = self.pet.thumbnail_digest
+
+        # Saving other fields keeps them; a different photo gets new ones
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.pet.name = 'Rexy'
+            self.pet.save()
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pet.profile_image.save('rex.jpg', self.image('blue'))
+        self.pet.refresh_from_db()
+        self.assertNotIn(self.pet.thumbnail_digest, ('', first))
+
+    def test_same_photo_shares_thumbnails(self):
+        other = PetProfile.objects.create(owner=self.owner, name='Max', species=PetProfile.DOG, age=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pet.profile_image.save('rex.jpg', self.image())
+            other.profile_image.save('max.jpg', self.image())
+        self.pet.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.pet.thumbnail_digest, other.thumbnail_digest)
+
+    def test_unknown_size(self):
+        self.assertEqual(self.client.get(f'/vetcare/Pets/pet/{self.pet.pk}/image/huge/webp/').status_code, 404)
@@ -0,0 +1,123 @@
+"""
+Resized WebP and JPEG derivatives of pet profile images.
+
+Saving a pet with a new image schedules ``render()`` on a process pool once
+the transaction commits, so requests never wait on Pillow. The worker reads
+the original once, hashes it and writes every size in both formats under
+``pets/thumbnails/<digest>/``; the path depends only on the image content,
+so re-uploads of the same photo reuse existing files and derivatives never
+need invalidating. When the worker finishes, the digest is stored on the pet
+and serializers build thumbnail URLs from it.
+
+This module must stay importable without the app registry: with the
+``spawn`` start method it is what worker processes import.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+ROOT = 'pets/thumbnails'
+
+# Longest edge in pixels, largest first: each size is resized from the previous one
+SIZES = {
+    'large': 1024,
+    'medium': 256,
+    'small': 64,
+}
+
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def derivative_name(digest, size, image_format):
+    return f'{ROOT}/{digest[:2]}/{digest}/{size}.{FORMATS[image_format][1]}'
+
+
+def render(name):
+    """Write every size and format of the stored image `name`; return its SHA-256"""
+    from PIL import Image, ImageOps
+
+    with default_storage.open(name, 'rb') as original:
+        data = original.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    missing = [
+        (size, image_format) for size in SIZES for image_format in FORMATS
+        if not default_storage.exists(derivative_name(digest, size, image_format))
+    ]
+    if not missing:
+        return digest
+
+    with Image.open(io.BytesIO(data)) as source:
+        # Let the JPEG decoder skip detail the largest size does not need
+        source.draft('RGB', (SIZES['large'], SIZES['large']))
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    for size, pixels in SIZES.items():
+        image.thumbnail((pixels, pixels), Image.LANCZOS)
+        for image_format, (pil_format, _, options) in FORMATS.items():
+            if (size, image_format) not in missing:
+                continue
+            frame = image
+            if pil_format == 'JPEG' and has_alpha:
+                frame = Image.new('RGB', image.size, 'white')
+                frame.paste(image, mask=image.getchannel('A'))
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, **options)
+            default_storage.save(derivative_name(digest, size, image_format), ContentFile(buffer.getvalue()))
+    return digest
+
+
+def executor():
+    """The shared worker pool, started on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.PET_THUMBNAIL_WORKERS)
+    return _executor
+
+
+def schedule(pet):
+    """Render `pet`'s image after the current transaction commits"""
+    transaction.on_commit(partial(submit, pet.pk, pet.profile_image.name))
+
+
+def submit(pk, name):
+    """Render `name` for pet `pk` in the pool, or inline when PET_THUMBNAIL_WORKERS is 0"""
+    if not settings.PET_THUMBNAIL_WORKERS:
+        store(pk, name, render(name))
+        return
+    future = executor().submit(render, name)
+    future.add_done_callback(partial(_finished, pk, name))
+
+
+def store(pk, name, digest):
+    """Record the digest, unless the pet's image changed in the meantime"""
+    from .models import PetProfile
+
+    PetProfile.objects.filter(pk=pk, profile_image=name).update(thumbnail_digest=digest)
+
+
+def _finished(pk, name, future):
+    # Runs on the pool's management thread, which has its own connection
+    try:
+        store(pk, name, future.result())
+    except Exception:
+        logger.exception("Could not build thumbnails for pet %s (%s)", pk, name)
+    finally:
+        connection.close()
@@ -6,6 +6,8 @@ from .views import (
     MyPetsView,
     ActivePetsView,
     PetsBySpeciesView,
+    PetProfileImageView,
+    PetThumbnailView,
 )
 
 app_name = 'pets'
@@ -14,6 +16,8 @@ urlpatterns = [
     path('pet/', PetListView.as_view(), name='pet-list'),
     path('pet/create/', PetCreateView.as_view(), name='pet-create'),
     path('pet/<int:pk>/', PetDetailView.as_view(), name='pet-detail'),
+    path('pet/<int:pk>/image/', PetProfileImageView.as_view(), name='pet-image'),
+    path('pet/<int:pk>/image/<str:size>/<str:image_format>/', PetThumbnailView.as_view(), name='pet-thumbnail'),
     
     path('my-pets/', MyPetsView.as_view(), name='my-pets'),
     path('active/', ActivePetsView.as_view(), name='active-pets'),
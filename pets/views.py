@@ -2,16 +2,19 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 
+from . import thumbnails
 from .models import PetProfile
 from .serializers import (PetProfileListSerializer,PetProfileDetailSerializer,PetProfileCreateSerializer,PetProfileUpdateSerializer,MyPetsSerializer,)
-from .permissions import ( IsPetOwner, IsPetOwnerOrReadOnlyForVet, CanCreatePet, CanAccessPetList
+from .permissions import ( IsPetOwner, IsPetOwnerOrReadOnlyForVet, CanCreatePet, CanAccessPetList, CanViewPet
 )
 from accounts.permissions import IsClient, IsVeterinarian
+from Vetcare.downloads import file_response
+from Vetcare.query_optimizer import OptimizedQuerysetMixin
 
 
 # PET PROFILE VIEWS 
 
-class PetListView(generics.ListAPIView):
+class PetListView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     List pets based on user role.
     - Clients see their own pets
@@ -28,26 +31,22 @@ class PetListView(generics.ListAPIView):
             # Clients see only their own pets
             return PetProfile.objects.filter(
                 owner=user
-            ).select_related('owner').order_by('-created_at')
+            ).order_by('-created_at')
         
         elif user.role == 'VETERINARIAN':
             # Veterinarians see pets they've treated
-            from appointments.models import Appointment
-            treated_pet_ids = Appointment.objects.filter(
-                veterinarian=user
-            ).values_list('pet_id', flat=True).distinct()
-            
             return PetProfile.objects.filter(
-                id__in=treated_pet_ids
-            ).select_related('owner').order_by('-created_at')
+                care_relationships__veterinarian=user
+            ).order_by('-created_at')
         
         return PetProfile.objects.none()
 
 
-class PetDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PetDetailView(OptimizedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     View, update, or delete a specific pet.
     """
+    # owner is read by the permission check on writes too
     queryset = PetProfile.objects.select_related('owner').all()
     permission_classes = [permissions.IsAuthenticated, IsPetOwnerOrReadOnlyForVet]
 
@@ -63,6 +62,49 @@ class PetDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance.save()
 
 
+class PetProfileImageView(generics.GenericAPIView):
+    """
+    Download a pet's profile image.
+    Supports Range, If-Range and If-None-Match; owners and vets who treated the pet can access it.
+    """
+    queryset = PetProfile.objects.all()
+    permission_classes = [permissions.IsAuthenticated, CanViewPet]
+
+    def get(self, request, *args, **kwargs):
+        pet = self.get_object()
+        if not pet.profile_image:
+            return Response(
+                {"error": "This pet has no profile image."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return file_response(request, pet.profile_image)
+
+
+class PetThumbnailView(generics.GenericAPIView):
+    """
+    Download a resized copy of a pet's profile image, e.g. `image/small/webp/`.
+    Same access rules as the original image.
+    """
+    queryset = PetProfile.objects.all()
+    permission_classes = [permissions.IsAuthenticated, CanViewPet]
+
+    def get(self, request, *args, **kwargs):
+        size, image_format = kwargs['size'], kwargs['image_format']
+        if size not in thumbnails.SIZES or image_format not in thumbnails.FORMATS:
+            return Response(
+                {"error": f"Choose a size from {', '.join(thumbnails.SIZES)} and a format from {', '.join(thumbnails.FORMATS)}."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        pet = self.get_object()
+        if not pet.thumbnail_digest:
+            return Response(
+                {"error": "This pet has no thumbnails yet."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        name = thumbnails.derivative_name(pet.thumbnail_digest, size, image_format)
+        return file_response(request, pet.profile_image.field.attr_class(pet, pet.profile_image.field, name))
+
+
 class PetCreateView(generics.CreateAPIView):
     """
     Create a new pet profile (Client only).
@@ -75,7 +117,7 @@ class PetCreateView(generics.CreateAPIView):
         serializer.save(owner=self.request.user)
 
 
-class MyPetsView(generics.ListAPIView):
+class MyPetsView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     List all pets owned by the logged-in client.
     """
@@ -90,7 +132,7 @@ class MyPetsView(generics.ListAPIView):
         ).order_by('-created_at')
 
 
-class ActivePetsView(generics.ListAPIView):
+class ActivePetsView(OptimizedQuerysetMixin, generics.ListAPIView):
 
     serializer_class = PetProfileListSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -106,20 +148,15 @@ class ActivePetsView(generics.ListAPIView):
             ).order_by('name')
         
         elif user.role == 'VETERINARIAN':
-            from appointments.models import Appointment
-            treated_pet_ids = Appointment.objects.filter(
-                veterinarian=user
-            ).values_list('pet_id', flat=True).distinct()
-            
             return PetProfile.objects.filter(
-                id__in=treated_pet_ids,
+                care_relationships__veterinarian=user,
                 is_active=True
             ).order_by('name')
         
         return PetProfile.objects.none()
 
 
-class PetsBySpeciesView(generics.ListAPIView):
+class PetsBySpeciesView(OptimizedQuerysetMixin, generics.ListAPIView):
     """
     List pets filtered by species.
     """
@@ -139,13 +176,8 @@ class PetsBySpeciesView(generics.ListAPIView):
             ).order_by('name')
         
         elif user.role == 'VETERINARIAN':
-            from appointments.models import Appointment
-            treated_pet_ids = Appointment.objects.filter(
-                veterinarian=user
-            ).values_list('pet_id', flat=True).distinct()
-            
             return PetProfile.objects.filter(
-                id__in=treated_pet_ids,
+                care_relationships__veterinarian=user,
                 species__iexact=species,
                 is_active=True
             ).order_by('name')